@@ -120,11 +120,32 @@ CREATE TABLE command_logs (
     command_text TEXT NOT NULL,
     executed_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
     status command_status,
-    output TEXT,
+    output TEXT, -- capped at COMMAND_OUTPUT_INLINE_LIMIT characters
+    output_size INTEGER, -- full output length in characters
+    output_chunks INTEGER DEFAULT 0, -- number of rows in command_output_chunks, 0 if fully inline
     execution_time INTEGER, -- in milliseconds
+    phase_timings JSONB, -- milliseconds per phase: checkout, connect, auth, channel_open, exec, transfer
     is_approved BOOLEAN
 );
 
+-- Create Command Output Chunk Table (zlib-compressed full output of large commands)
+CREATE TABLE command_output_chunks (
+    log_id INTEGER REFERENCES command_logs(log_id) ON DELETE CASCADE,
+    chunk_index INTEGER NOT NULL,
+    data BYTEA NOT NULL,
+    size INTEGER NOT NULL, -- characters in this chunk
+    PRIMARY KEY (log_id, chunk_index)
+);
+
+-- Create File Snapshot Table (content-addressed, zlib-compressed file content)
+CREATE TABLE file_snapshots (
+    content_hash VARCHAR(64) PRIMARY KEY, -- sha256 of the UTF-8 content
+    data BYTEA NOT NULL,
+    size INTEGER NOT NULL,
+    compressed_size INTEGER NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
 -- Create File Edit Log Table
 CREATE TABLE file_edit_logs (
     log_id SERIAL PRIMARY KEY,
@@ -137,6 +158,8 @@ CREATE TABLE file_edit_logs (
     edit_finished_at TIMESTAMP WITH TIME ZONE,
     content_before TEXT,
     content_after TEXT,
+    content_before_hash VARCHAR(64) REFERENCES file_snapshots(content_hash) DEFERRABLE INITIALLY DEFERRED,
+    content_after_hash VARCHAR(64) REFERENCES file_snapshots(content_hash) DEFERRABLE INITIALLY DEFERRED,
     diff TEXT
 );
 
@@ -146,7 +169,7 @@ CREATE TABLE scheduled_monitoring (
     user_id INTEGER REFERENCES users(user_id) DEFERRABLE INITIALLY DEFERRED,
     device_id INTEGER REFERENCES devices(device_id) DEFERRABLE INITIALLY DEFERRED,
     scheduled_time TIMESTAMP WITH TIME ZONE NOT NULL,
-    completed BOOLEAN DEFAULT FALSE,
+    completed BOOLEAN NOT NULL DEFAULT FALSE,
     completed_at TIMESTAMP WITH TIME ZONE,
     notes TEXT,
     created_by INTEGER REFERENCES users(user_id) DEFERRABLE INITIALLY DEFERRED,
@@ -250,10 +273,19 @@ CREATE INDEX idx_command_logs_session_id ON command_logs(session_id);
 CREATE INDEX idx_command_logs_user_id ON command_logs(user_id);
 CREATE INDEX idx_command_logs_device_id ON command_logs(device_id);
 CREATE INDEX idx_command_logs_executed_at ON command_logs(executed_at);
+-- Keyset pagination: (time, id) cursors are index range scans
+CREATE INDEX idx_sessions_start_time_id ON sessions(start_time DESC, session_id DESC);
+CREATE INDEX idx_command_logs_session_executed ON command_logs(session_id, executed_at, log_id);
+CREATE INDEX idx_file_edit_logs_started_id ON file_edit_logs(edit_started_at DESC, log_id DESC);
 CREATE INDEX idx_devices_group_id ON devices(group_id);
 CREATE INDEX idx_user_profiles_user_id ON user_profiles(user_id);
+CREATE INDEX idx_user_profiles_active ON user_profiles(user_id, profile_id) WHERE is_active = TRUE;
+CREATE INDEX idx_profiles_group_id ON profiles(group_id);
+CREATE INDEX idx_profiles_list_id ON profiles(list_id);
+CREATE INDEX idx_commands_list_id ON commands(list_id);
 CREATE INDEX idx_audit_logs_user_id ON audit_logs(user_id);
 CREATE INDEX idx_devices_assigned_by ON devices(assigned_by);
+CREATE INDEX idx_scheduled_monitoring_pending ON scheduled_monitoring(scheduled_time) WHERE completed = FALSE;
 
 -- Self-reference foreign key for users.created_by (add after table is created)
 ALTER TABLE users ADD CONSTRAINT users_created_by_fkey 
@@ -6,6 +6,15 @@ from flask_migrate import Migrate
 import os
 from datetime import timedelta
 from flask_cors import CORS
+from app.utils.ssh_pool import ssh_pool
+from app.utils.command_jobs import command_jobs
+from app.utils.device_poller import device_poller
+from app.utils.scheduler import monitoring_scheduler
+from app.utils.permission_cache import permission_cache
+from app.utils.diff_worker import diff_worker
+from app.utils.log_writer import log_writer
+from app.utils.query_profiler import query_profiler
+from app.utils.metrics import metrics, TimedQueuePool
 
 # Initialize extensions
 db = SQLAlchemy()
@@ -24,11 +33,101 @@ def create_app(config=None):
     app.config['JWT_SECRET_KEY'] = os.environ.get('JWT_SECRET_KEY', 'jwt-dev-key-change-in-production')
     app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(hours=1)
     
+    # SSH engine: 'paramiko' (threads) or 'asyncssh' (event loop, needs asyncssh installed)
+    app.config['SSH_ENGINE'] = os.environ.get('SSH_ENGINE', 'paramiko')
+    
+    # SSH connection pool
+    app.config['SSH_POOL_IDLE_TIMEOUT'] = int(os.environ.get('SSH_POOL_IDLE_TIMEOUT', 300))
+    app.config['SSH_POOL_BOUND_IDLE_TIMEOUT'] = int(os.environ.get('SSH_POOL_BOUND_IDLE_TIMEOUT', 1800))
+    app.config['SSH_POOL_MAX_PER_DEVICE'] = int(os.environ.get('SSH_POOL_MAX_PER_DEVICE', 4))
+    app.config['SSH_POOL_HEALTH_CHECK_INTERVAL'] = int(os.environ.get('SSH_POOL_HEALTH_CHECK_INTERVAL', 30))
+    app.config['SSH_POOL_KEEPALIVE'] = int(os.environ.get('SSH_POOL_KEEPALIVE', 30))
+    
+    # Background command jobs
+    app.config['JOB_MAX_WORKERS'] = int(os.environ.get('JOB_MAX_WORKERS', 8))
+    app.config['JOB_MAX_PENDING'] = int(os.environ.get('JOB_MAX_PENDING', 100))
+    app.config['JOB_RESULT_TTL'] = int(os.environ.get('JOB_RESULT_TTL', 3600))
+    
+    # Streaming command output
+    app.config['STREAM_CHUNK_SIZE'] = int(os.environ.get('STREAM_CHUNK_SIZE', 4096))
+    app.config['STREAM_MAX_LOG_BYTES'] = int(os.environ.get('STREAM_MAX_LOG_BYTES', 1048576))
+    
+    # Remote file reads and uploads over SFTP
+    app.config['READ_FILE_CHUNK_SIZE'] = int(os.environ.get('READ_FILE_CHUNK_SIZE', 32768))
+    app.config['READ_FILE_PREFETCH_WINDOW'] = int(os.environ.get('READ_FILE_PREFETCH_WINDOW', 32))
+    app.config['READ_FILE_MAX_INLINE_BYTES'] = int(os.environ.get('READ_FILE_MAX_INLINE_BYTES', 5242880))
+    app.config['UPLOAD_CHUNK_SIZE'] = int(os.environ.get('UPLOAD_CHUNK_SIZE', 32768))
+    
+    # Fleet-wide command fan-out
+    app.config['FANOUT_DEFAULT_CONCURRENCY'] = int(os.environ.get('FANOUT_DEFAULT_CONCURRENCY', 16))
+    app.config['FANOUT_MAX_CONCURRENCY'] = int(os.environ.get('FANOUT_MAX_CONCURRENCY', 64))
+    
+    # Background device reachability poller
+    app.config['DEVICE_POLL_ENABLED'] = os.environ.get('DEVICE_POLL_ENABLED', 'false').lower() == 'true'
+    app.config['DEVICE_POLL_INTERVAL'] = int(os.environ.get('DEVICE_POLL_INTERVAL', 60))
+    app.config['DEVICE_POLL_TIMEOUT'] = float(os.environ.get('DEVICE_POLL_TIMEOUT', 3))
+    app.config['DEVICE_POLL_CONCURRENCY'] = int(os.environ.get('DEVICE_POLL_CONCURRENCY', 1000))
+    app.config['DEVICE_POLL_CHECK_BANNER'] = os.environ.get('DEVICE_POLL_CHECK_BANNER', 'true').lower() == 'true'
+    
+    # Scheduled monitoring
+    app.config['SCHEDULER_ENABLED'] = os.environ.get('SCHEDULER_ENABLED', 'false').lower() == 'true'
+    app.config['SCHEDULER_REFRESH_INTERVAL'] = int(os.environ.get('SCHEDULER_REFRESH_INTERVAL', 30))
+    app.config['SCHEDULER_BATCH_SIZE'] = int(os.environ.get('SCHEDULER_BATCH_SIZE', 100))
+    
+    # Effective-permissions cache (optional Redis backend shared between workers)
+    app.config['PERMISSION_CACHE_ENABLED'] = os.environ.get('PERMISSION_CACHE_ENABLED', 'true').lower() == 'true'
+    app.config['PERMISSION_CACHE_SIZE'] = int(os.environ.get('PERMISSION_CACHE_SIZE', 1024))
+    app.config['PERMISSION_CACHE_REDIS_URL'] = os.environ.get('PERMISSION_CACHE_REDIS_URL')
+    # Không có Redis thì worker khác không thấy việc thu hồi quyền: chỉ giữ vài giây
+    app.config['PERMISSION_CACHE_TTL'] = int(os.environ.get(
+        'PERMISSION_CACHE_TTL', 300 if app.config['PERMISSION_CACHE_REDIS_URL'] else 5))
+    
+    # Background unified diffs for file edit logs
+    app.config['DIFF_MAX_INPUT_BYTES'] = int(os.environ.get('DIFF_MAX_INPUT_BYTES', 1048576))
+    app.config['DIFF_MAX_BYTES'] = int(os.environ.get('DIFF_MAX_BYTES', 65536))
+    app.config['DIFF_QUEUE_SIZE'] = int(os.environ.get('DIFF_QUEUE_SIZE', 1000))
+    
+    # Batched command/file edit log writes (sync: wait for commit, async: fire and forget)
+    app.config['LOG_WRITER_ENABLED'] = os.environ.get('LOG_WRITER_ENABLED', 'true').lower() == 'true'
+    app.config['LOG_WRITER_BATCH_SIZE'] = int(os.environ.get('LOG_WRITER_BATCH_SIZE', 200))
+    app.config['LOG_WRITER_FLUSH_INTERVAL'] = float(os.environ.get('LOG_WRITER_FLUSH_INTERVAL', 0.02))
+    app.config['LOG_WRITER_QUEUE_SIZE'] = int(os.environ.get('LOG_WRITER_QUEUE_SIZE', 10000))
+    app.config['LOG_WRITER_PUT_TIMEOUT'] = float(os.environ.get('LOG_WRITER_PUT_TIMEOUT', 5))
+    app.config['LOG_WRITER_SYNC_TIMEOUT'] = float(os.environ.get('LOG_WRITER_SYNC_TIMEOUT', 30))
+    app.config['LOG_WRITER_DURABILITY'] = os.environ.get('LOG_WRITER_DURABILITY', 'sync')
+    app.config['LOG_WRITER_BULK_DURABILITY'] = os.environ.get('LOG_WRITER_BULK_DURABILITY', 'async')
+    
+    # Command output kept inline in command_logs; longer output is stored compressed in chunks
+    app.config['COMMAND_OUTPUT_INLINE_LIMIT'] = int(os.environ.get('COMMAND_OUTPUT_INLINE_LIMIT', 65536))
+    app.config['COMMAND_OUTPUT_CHUNK_SIZE'] = int(os.environ.get('COMMAND_OUTPUT_CHUNK_SIZE', 262144))
+    
+    # Per-request SQL query counting and N+1 detection (can be toggled at runtime)
+    app.config['QUERY_PROFILER_ENABLED'] = os.environ.get('QUERY_PROFILER_ENABLED', 'false').lower() == 'true'
+    app.config['QUERY_PROFILER_HEADERS'] = os.environ.get('QUERY_PROFILER_HEADERS', 'true').lower() == 'true'
+    app.config['QUERY_PROFILER_N_PLUS_ONE_THRESHOLD'] = int(os.environ.get('QUERY_PROFILER_N_PLUS_ONE_THRESHOLD', 5))
+    app.config['QUERY_PROFILER_LOG_THRESHOLD'] = int(os.environ.get('QUERY_PROFILER_LOG_THRESHOLD', 20))
+    
+    # Prometheus /metrics endpoint (METRICS_TOKEN: bearer token for scrapers, required unless debugging)
+    app.config['METRICS_ENABLED'] = os.environ.get('METRICS_ENABLED', 'true').lower() == 'true'
+    app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')
+    if app.config['METRICS_ENABLED'] and app.config['SQLALCHEMY_DATABASE_URI'].startswith('postgresql'):
+        # Đo thời gian chờ lấy kết nối từ DB pool
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'poolclass': TimedQueuePool}
+    
     # Initialize extensions with app
     db.init_app(app)
     login_manager.init_app(app)
     jwt.init_app(app)
     migrate.init_app(app, db)
+    ssh_pool.init_app(app)
+    command_jobs.init_app(app)
+    device_poller.init_app(app)
+    monitoring_scheduler.init_app(app)
+    permission_cache.init_app(app)
+    diff_worker.init_app(app)
+    log_writer.init_app(app)
+    query_profiler.init_app(app)
+    metrics.init_app(app)
     
     # Configure CORS to allow any origin
     CORS(app, resources={r"/*": {"origins": "*"}}, supports_credentials=True)
@@ -39,12 +138,14 @@ def create_app(config=None):
     from app.routes.commands import commands_bp
     from app.routes.sessions import sessions_bp
     from app.routes.profiles import profiles_bp
+    from app.routes.schedules import schedules_bp
     
     app.register_blueprint(auth_bp, url_prefix='/api/auth')
     app.register_blueprint(devices_bp, url_prefix='/api/devices')
     app.register_blueprint(commands_bp, url_prefix='/api/commands')
     app.register_blueprint(sessions_bp, url_prefix='/api/sessions')
     app.register_blueprint(profiles_bp, url_prefix='/api/profiles')
+    app.register_blueprint(schedules_bp, url_prefix='/api/schedules')
     
     # Configure login_manager
     login_manager.login_view = 'auth.login'
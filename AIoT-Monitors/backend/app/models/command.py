@@ -24,12 +24,25 @@ class CommandList(db.Model):
         self.description = description
         self.created_by = created_by
     
-    def to_dict(self):
+    @classmethod
+    def command_counts(cls, list_ids):
+        """Number of commands per list id, in one grouped query"""
+        if not list_ids:
+            return {}
+        rows = db.session.query(Command.list_id, func.count(Command.command_id)).filter(
+            Command.list_id.in_(list_ids)
+        ).group_by(Command.list_id).all()
+        return dict(rows)
+    
+    def to_dict(self, command_count=None):
+        # Danh sách truyền command_count lấy từ command_counts() thay vì đếm từng list
+        if command_count is None:
+            command_count = self.commands.count()
         return {
             'id': self.list_id,
             'name': self.list_name,
             'description': self.description,
-            'command_count': self.commands.count(),
+            'command_count': command_count,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'created_by': self.creator.username if self.creator else None,
             'is_active': self.is_active
@@ -0,0 +1,40 @@
+import zlib
+from app import db
+
+class CommandOutputChunk(db.Model):
+    """One zlib-compressed slice of a command output too large to keep inline"""
+    __tablename__ = 'command_output_chunks'
+
+    log_id = db.Column(db.Integer, db.ForeignKey('command_logs.log_id', ondelete='CASCADE'), primary_key=True)
+    chunk_index = db.Column(db.Integer, primary_key=True)
+    data = db.Column(db.LargeBinary, nullable=False)
+    size = db.Column(db.Integer, nullable=False)  # characters in this chunk
+
+    @property
+    def content(self):
+        return zlib.decompress(self.data).decode('utf-8')
+
+    @staticmethod
+    def split(output, inline_limit, chunk_size):
+        """Split an output into (inline_output, chunk rows without log_id).
+
+        Outputs within inline_limit characters are kept as they are and
+        produce no chunks. Larger outputs keep their first inline_limit
+        characters inline and are stored in full, chunk_size characters per
+        compressed chunk, so the chunks alone reproduce the output.
+        """
+        if output is None or len(output) <= inline_limit:
+            return output, []
+
+        chunks = []
+        for index, start in enumerate(range(0, len(output), chunk_size)):
+            text = output[start:start + chunk_size]
+            chunks.append({
+                'chunk_index': index,
+                'data': zlib.compress(text.encode('utf-8'), 6),
+                'size': len(text)
+            })
+
+        inline = (f"{output[:inline_limit]}\n"
+                  f"[output truncated: showing {inline_limit} of {len(output)} characters]")
+        return inline, chunks
@@ -1,5 +1,7 @@
 from app import db
 from datetime import datetime
+from sqlalchemy.sql import func
+from sqlalchemy.orm import joinedload
 from app.models.user import User
 
 class DeviceStatus:
@@ -31,12 +33,25 @@ class DeviceGroup(db.Model):
         self.description = description
         self.created_by = created_by
     
-    def to_dict(self):
+    @classmethod
+    def device_counts(cls, group_ids):
+        """Number of devices per group id, in one grouped query"""
+        if not group_ids:
+            return {}
+        rows = db.session.query(Device.group_id, func.count(Device.device_id)).filter(
+            Device.group_id.in_(group_ids)
+        ).group_by(Device.group_id).all()
+        return dict(rows)
+    
+    def to_dict(self, device_count=None):
+        # Danh sách truyền device_count lấy từ device_counts() thay vì đếm từng nhóm
+        if device_count is None:
+            device_count = self.devices.count()
         return {
             'id': self.group_id,
             'name': self.group_name,
             'description': self.description,
-            'device_count': self.devices.count(),
+            'device_count': device_count,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'created_by': self.creator.username if self.creator else None,
             'is_active': self.is_active
@@ -84,6 +99,15 @@ class Device(db.Model):
         self.customer_id = customer_id
         self.assigned_by = assigned_by
     
+    @classmethod
+    def listing_query(cls):
+        """Query that loads group, creator and assigner in the same SELECT as the devices"""
+        return cls.query.options(
+            joinedload(cls.group),
+            joinedload(cls.creator),
+            joinedload(cls.assigner)
+        )
+    
     def to_dict(self):
         try:
             group_name = None
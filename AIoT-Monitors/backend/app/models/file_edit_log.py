@@ -1,6 +1,8 @@
 from app import db
 from datetime import datetime
 from pytz import UTC
+from app.models.file_snapshot import FileSnapshot
+from sqlalchemy.orm import joinedload
 
 class FileEditLog(db.Model):
     __tablename__ = 'file_edit_logs'
@@ -14,8 +16,10 @@ class FileEditLog(db.Model):
     edit_type = db.Column(db.String(20), nullable=False)  # create, modify, delete
     edit_started_at = db.Column(db.DateTime(timezone=True), default=lambda: datetime.now(UTC))
     edit_finished_at = db.Column(db.DateTime(timezone=True))
-    content_before = db.Column(db.Text)
+    content_before = db.Column(db.Text)  # Chỉ còn dùng cho các bản ghi cũ
     content_after = db.Column(db.Text)
+    content_before_hash = db.Column(db.String(64), db.ForeignKey('file_snapshots.content_hash'))
+    content_after_hash = db.Column(db.String(64), db.ForeignKey('file_snapshots.content_hash'))
     diff = db.Column(db.Text)
     
     # Relationships
@@ -24,18 +28,34 @@ class FileEditLog(db.Model):
     device = db.relationship('Device', backref='file_edits')
     
     def __init__(self, session_id, user_id, device_id, file_path, edit_type,
-                 content_before=None, content_after=None, diff=None):
+                 content_before_hash=None, content_after_hash=None, diff=None):
         self.session_id = session_id
         self.user_id = user_id
         self.device_id = device_id
         self.file_path = file_path
         self.edit_type = edit_type
-        self.content_before = content_before
-        self.content_after = content_after
+        # Nội dung được lưu một lần trong file_snapshots (FileSnapshot.store), bản ghi chỉ giữ hash
+        self.content_before_hash = content_before_hash
+        self.content_after_hash = content_after_hash
         self.diff = diff
         self.edit_started_at = datetime.now(UTC)
         self.edit_finished_at = datetime.now(UTC)
     
+    @classmethod
+    def listing_query(cls):
+        """Query that loads user and device in the same SELECT as the file edits"""
+        return cls.query.options(joinedload(cls.user), joinedload(cls.device))
+    
+    def get_content_before(self):
+        if self.content_before_hash:
+            return FileSnapshot.load(self.content_before_hash)
+        return self.content_before
+
+    def get_content_after(self):
+        if self.content_after_hash:
+            return FileSnapshot.load(self.content_after_hash)
+        return self.content_after
+
     def to_dict(self):
         return {
             'id': self.log_id,
@@ -46,8 +66,10 @@ class FileEditLog(db.Model):
             'edit_type': self.edit_type,
             'edit_started_at': self.edit_started_at.isoformat() if self.edit_started_at else None,
             'edit_finished_at': self.edit_finished_at.isoformat() if self.edit_finished_at else None,
-            'content_before': self.content_before,
-            'content_after': self.content_after,
+            'content_before_hash': self.content_before_hash,
+            'content_after_hash': self.content_after_hash,
+            'has_content_before': bool(self.content_before_hash or self.content_before is not None),
+            'has_content_after': bool(self.content_after_hash or self.content_after is not None),
             'diff': self.diff,
             'user': self.user.username if self.user else None,
             'device': {
@@ -0,0 +1,54 @@
+import hashlib
+import zlib
+from app import db
+from datetime import datetime, UTC
+from sqlalchemy.dialects.postgresql import insert
+
+class FileSnapshot(db.Model):
+    """Content-addressed file content shared by every FileEditLog that saw it"""
+    __tablename__ = 'file_snapshots'
+
+    content_hash = db.Column(db.String(64), primary_key=True)  # sha256 of the UTF-8 content
+    data = db.Column(db.LargeBinary, nullable=False)  # zlib-compressed content
+    size = db.Column(db.Integer, nullable=False)
+    compressed_size = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime(timezone=True), default=lambda: datetime.now(UTC))
+
+    @property
+    def content(self):
+        return zlib.decompress(self.data).decode('utf-8', errors='replace')
+
+    @classmethod
+    def store(cls, content):
+        """Save content (str or bytes) once and return its hash (None for None content).
+
+        Existing content is detected by hash before compressing, so repeated
+        snapshots of the same file cost one primary-key lookup.
+        """
+        if content is None:
+            return None
+
+        # read_file of both SSH engines returns str (decoded with errors='replace'); bytes are raw file data
+        raw = content if isinstance(content, bytes) else content.encode('utf-8')
+        content_hash = hashlib.sha256(raw).hexdigest()
+
+        if db.session.query(cls.content_hash).filter_by(content_hash=content_hash).first() is None:
+            data = zlib.compress(raw, 6)
+            # ON CONFLICT covers two requests storing the same content concurrently
+            db.session.execute(insert(cls).values(
+                content_hash=content_hash,
+                data=data,
+                size=len(raw),
+                compressed_size=len(data),
+                created_at=datetime.now(UTC)
+            ).on_conflict_do_nothing(index_elements=['content_hash']))
+
+        return content_hash
+
+    @classmethod
+    def load(cls, content_hash):
+        """Return the stored content for a hash, or None"""
+        if content_hash is None:
+            return None
+        snapshot = cls.query.get(content_hash)
+        return snapshot.content if snapshot else None
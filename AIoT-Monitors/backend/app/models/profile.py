@@ -1,5 +1,6 @@
 from app import db
 from datetime import datetime
+from sqlalchemy.sql import func
 
 class Profile(db.Model):
     __tablename__ = 'profiles'
@@ -35,8 +36,23 @@ class Profile(db.Model):
         ).all()
         return User.query.filter(User.user_id.in_([uid[0] for uid in user_ids])).all()
     
-    def to_dict(self):
+    @classmethod
+    def user_counts(cls, profile_ids):
+        """Number of users actively assigned to each profile id, in one grouped query"""
+        from app.models.user import UserProfile
+        if not profile_ids:
+            return {}
+        rows = db.session.query(UserProfile.profile_id, func.count(func.distinct(UserProfile.user_id))).filter(
+            UserProfile.profile_id.in_(profile_ids),
+            UserProfile.is_active == True
+        ).group_by(UserProfile.profile_id).all()
+        return dict(rows)
+    
+    def to_dict(self, user_count=None):
         """Convert object to dictionary"""
+        # Đếm bằng COUNT thay vì tải toàn bộ users
+        if user_count is None:
+            user_count = Profile.user_counts([self.profile_id]).get(self.profile_id, 0)
         return {
             'id': self.profile_id,
             'name': self.profile_name,
@@ -46,7 +62,7 @@ class Profile(db.Model):
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'created_by': self.creator.username if self.creator else None,
             'is_active': self.is_active,
-            'user_count': len(self.users) if hasattr(self, 'users') else 0
+            'user_count': user_count
         }
     
     @classmethod
@@ -0,0 +1,41 @@
+from app import db
+from datetime import datetime, UTC
+
+class ScheduledMonitoring(db.Model):
+    __tablename__ = 'scheduled_monitoring'
+
+    schedule_id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.user_id'))
+    device_id = db.Column(db.Integer, db.ForeignKey('devices.device_id'))
+    scheduled_time = db.Column(db.DateTime(timezone=True), nullable=False)
+    completed = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())
+    completed_at = db.Column(db.DateTime(timezone=True))
+    notes = db.Column(db.Text)
+    created_by = db.Column(db.Integer, db.ForeignKey('users.user_id'))
+    created_at = db.Column(db.DateTime(timezone=True), default=lambda: datetime.now(UTC))
+
+    # Relationships
+    user = db.relationship('User', foreign_keys=[user_id])
+    device = db.relationship('Device', foreign_keys=[device_id])
+    creator = db.relationship('User', foreign_keys=[created_by])
+
+    def __init__(self, device_id, scheduled_time, user_id=None, notes=None, created_by=None):
+        self.device_id = device_id
+        self.scheduled_time = scheduled_time
+        self.user_id = user_id
+        self.notes = notes
+        self.created_by = created_by
+        self.completed = False
+
+    def to_dict(self):
+        return {
+            'id': self.schedule_id,
+            'user_id': self.user_id,
+            'device_id': self.device_id,
+            'scheduled_time': self.scheduled_time.isoformat() if self.scheduled_time else None,
+            'completed': self.completed,
+            'completed_at': self.completed_at.isoformat() if self.completed_at else None,
+            'notes': self.notes,
+            'created_by': self.created_by,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
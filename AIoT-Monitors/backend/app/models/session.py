@@ -1,5 +1,8 @@
 from app import db
 from datetime import datetime, timedelta, UTC
+from sqlalchemy.sql import func
+from sqlalchemy.orm import joinedload
+from sqlalchemy.dialects.postgresql import JSONB
 
 class SessionStatus:
     ACTIVE = 'active'
@@ -40,7 +43,32 @@ class Session(db.Model):
         self.end_time = datetime.now(UTC)
         self.terminated_by = terminated_by
     
-    def to_dict(self, detailed=False):
+    @classmethod
+    def listing_query(cls):
+        """Query that loads user and device in the same SELECT as the sessions"""
+        return cls.query.options(joinedload(cls.user), joinedload(cls.device))
+    
+    @classmethod
+    def commands_by_session(cls, session_ids):
+        """Command logs of several sessions, oldest first, in one query"""
+        commands = {session_id: [] for session_id in session_ids}
+        if session_ids:
+            for command in CommandLog.query.filter(CommandLog.session_id.in_(session_ids)).order_by(
+                    CommandLog.executed_at.asc(), CommandLog.log_id.asc()):
+                commands[command.session_id].append(command)
+        return commands
+    
+    @classmethod
+    def command_counts(cls, session_ids):
+        """Number of command logs per session id, in one grouped query"""
+        if not session_ids:
+            return {}
+        rows = db.session.query(CommandLog.session_id, func.count(CommandLog.log_id)).filter(
+            CommandLog.session_id.in_(session_ids)
+        ).group_by(CommandLog.session_id).all()
+        return dict(rows)
+    
+    def to_dict(self, detailed=False, command_count=None, commands=None):
         try:
             # Lấy thông tin user và device một cách an toàn
             user_name = None
@@ -76,12 +104,12 @@ class Session(db.Model):
             except:
                 if self.end_time:
                     end_time_str = str(self.end_time)                    
-            # Đếm số lượng lệnh nếu có
-            command_count = 0
+            # Đếm số lượng lệnh nếu danh sách chưa truyền sẵn từ command_counts()
             try:
-                if hasattr(self, 'command_logs'):
+                if command_count is None:
                     command_count = self.command_logs.count()
             except Exception as e:
+                command_count = 0
                 print(f"Error counting commands for session {self.session_id}: {str(e)}")
             
             result = {
@@ -101,8 +129,9 @@ class Session(db.Model):
             if detailed:
                 # Thêm thông tin chi tiết nếu cần
                 try:
-                    if hasattr(self, 'command_logs'):
-                        result['commands'] = [cmd.to_dict() for cmd in self.command_logs]
+                    if commands is None:
+                        commands = self.command_logs
+                    result['commands'] = [cmd.to_dict() for cmd in commands]
                 except Exception as e:
                     print(f"Error getting detailed commands for session {self.session_id}: {str(e)}")
             
@@ -127,12 +156,15 @@ class CommandLog(db.Model):
     command_text = db.Column(db.Text, nullable=False)
     executed_at = db.Column(db.DateTime, default=datetime.now(UTC))
     status = db.Column(db.String(20))
-    output = db.Column(db.Text)
-    execution_time = db.Column(db.Integer)
+    output = db.Column(db.Text)  # Tối đa COMMAND_OUTPUT_INLINE_LIMIT ký tự, phần còn lại ở command_output_chunks
+    output_size = db.Column(db.Integer)  # Full output length in characters
+    output_chunks = db.Column(db.Integer, default=0)  # 0: output is fully inline
+    execution_time = db.Column(db.Integer)  # Total wall time in milliseconds
+    phase_timings = db.Column(JSONB)  # Milliseconds per phase: checkout, connect, auth, channel_open, exec, transfer
     is_approved = db.Column(db.Boolean)
     
     def __init__(self, session_id, command_text, user_id=None, device_id=None, 
-                output=None, status=None, execution_time=None, is_approved=None):
+                output=None, status=None, execution_time=None, is_approved=None, phase_timings=None):
         self.session_id = session_id
         self.command_text = command_text
         self.user_id = user_id
@@ -140,6 +172,7 @@ class CommandLog(db.Model):
         self.output = output
         self.status = status
         self.execution_time = execution_time
+        self.phase_timings = phase_timings
         self.is_approved = is_approved
         self.executed_at = datetime.now(UTC)
     
@@ -159,8 +192,11 @@ class CommandLog(db.Model):
                 'device_id': self.device_id,
                 'command_text': self.command_text,
                 'output': self.output,
+                'output_size': self.output_size if self.output_size is not None else len(self.output or ''),
+                'output_truncated': bool(self.output_chunks),
                 'status': self.status,
                 'execution_time': self.execution_time,
+                'phase_timings': self.phase_timings,
                 'is_approved': self.is_approved,
                 'executed_at': executed_at_str
             }
@@ -5,6 +5,8 @@ from app.models.user import User, UserRole, UserProfile
 from app.models.command import Command, CommandList
 from app.models.profile import Profile
 from app.models.device import DeviceGroup
+from app.utils.permission_cache import permission_cache
+from app.utils import permissions
 from datetime import datetime
 
 commands_bp = Blueprint('commands', __name__)
@@ -40,6 +42,8 @@ def create_command():
     
     db.session.add(new_command)
     db.session.commit()
+    if new_command.list_id is not None:
+        permission_cache.invalidate_all()
     
     return jsonify({
         'message': 'Command created successfully',
@@ -107,8 +111,10 @@ def create_command_list():
 def get_command_lists():
     """Get all command lists"""
     command_lists = CommandList.query.all()
+    counts = CommandList.command_counts([command_list.list_id for command_list in command_lists])
     return jsonify({
-        'command_lists': [command_list.to_dict() for command_list in command_lists]
+        'command_lists': [command_list.to_dict(command_count=counts.get(command_list.list_id, 0))
+                          for command_list in command_lists]
     }), 200
 
 @commands_bp.route('/lists/<int:list_id>', methods=['GET'])
@@ -167,6 +173,7 @@ def add_command_to_list(list_id):
     # Update the command's list_id to associate it with this list
     command.list_id = list_id
     db.session.commit()
+    permission_cache.invalidate_all()
     
     return jsonify({
         'message': 'Command added to list successfully'
@@ -227,8 +234,9 @@ def create_profile():
 def get_profiles():
     """Get all profiles"""
     profiles = Profile.query.all()
+    counts = Profile.user_counts([profile.profile_id for profile in profiles])
     return jsonify({
-        'profiles': [profile.to_dict() for profile in profiles]
+        'profiles': [profile.to_dict(user_count=counts.get(profile.profile_id, 0)) for profile in profiles]
     }), 200
 
 @commands_bp.route('/profiles/<int:profile_id>', methods=['GET'])
@@ -291,6 +299,7 @@ def assign_profile_to_user(profile_id):
         
         db.session.add(user_profile)
         db.session.commit()
+        permission_cache.invalidate_user(user_id)
         
         return jsonify({
             'message': 'Profile assigned to user successfully'
@@ -343,6 +352,7 @@ def update_profile(profile_id):
         profile.is_active = bool(data['is_active'])
     
     db.session.commit()
+    permission_cache.invalidate_all()
     
     return jsonify({
         'message': 'Profile updated successfully',
@@ -383,6 +393,7 @@ def remove_user_from_profile(profile_id, user_id):
         # Soft delete by setting is_active=False
         user_profile.is_active = False
         db.session.commit()
+        permission_cache.invalidate_user(user_id)
         
         return jsonify({
             'message': 'User removed from profile successfully'
@@ -421,18 +432,13 @@ def get_allowed_commands():
             'commands': [command.to_dict() for command in commands]
         }), 200
     
-    # Đối với Operator, chỉ trả về các lệnh từ các profile được gán
-    allowed_commands = set()
-    
-    # Lấy tất cả profile đang hoạt động của người dùng
-    for profile in current_user.profiles:
-        if profile.is_active and profile.command_list:
-            # Thêm tất cả lệnh từ command_list của profile vào tập hợp allowed_commands
-            for command in profile.command_list.commands:
-                allowed_commands.add(command)
+    # Đối với Operator, chỉ trả về các lệnh từ các profile được gán (một truy vấn join)
+    allowed_commands = {}
+    for command, _ in permissions.get_allowed_commands(current_user.user_id):
+        allowed_commands.setdefault(command.command_id, command)
     
     return jsonify({
-        'commands': [command.to_dict() for command in allowed_commands]
+        'commands': [command.to_dict() for command in allowed_commands.values()]
     }), 200
 
 @commands_bp.route('/profiles/users/<int:user_id>', methods=['GET'])
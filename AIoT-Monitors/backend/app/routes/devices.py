@@ -3,10 +3,18 @@ from flask_jwt_extended import jwt_required, get_jwt_identity
 from app import db
 from app.models.user import User, UserRole
 from app.models.device import Device, DeviceGroup
+from app.models.session import CommandLog
+from app.utils.device_poller import device_poller
+from app.utils.permission_cache import permission_cache
+from datetime import datetime, timedelta, UTC
+from sqlalchemy import Float, cast, func
 import traceback
 
 devices_bp = Blueprint('devices', __name__)
 
+# Phases stored in CommandLog.phase_timings; 'total' is CommandLog.execution_time
+LATENCY_PHASES = ('total', 'checkout', 'connect', 'auth', 'channel_open', 'exec', 'transfer')
+
 # Device Group Routes
 @devices_bp.route('/groups', methods=['POST'])
 @jwt_required()
@@ -48,8 +56,9 @@ def create_device_group():
 def get_device_groups():
     """Get all device groups"""
     device_groups = DeviceGroup.query.all()
+    counts = DeviceGroup.device_counts([group.group_id for group in device_groups])
     return jsonify({
-        'device_groups': [group.to_dict() for group in device_groups]
+        'device_groups': [group.to_dict(device_count=counts.get(group.group_id, 0)) for group in device_groups]
     }), 200
 
 @devices_bp.route('/groups/<int:group_id>', methods=['GET'])
@@ -72,8 +81,9 @@ def get_group_devices(group_id):
     if not group:
         return jsonify({'error': 'Device group not found'}), 404
     
+    devices = Device.listing_query().filter(Device.group_id == group_id).all()
     return jsonify({
-        'devices': [device.to_dict() for device in group.devices]
+        'devices': [device.to_dict() for device in devices]
     }), 200
 
 @devices_bp.route('/groups/<int:group_id>/devices', methods=['POST'])
@@ -115,6 +125,7 @@ def add_device_to_group(group_id):
     device.group_id = group_id
     device.assigned_by = current_user.user_id
     db.session.commit()
+    permission_cache.invalidate_all()
     
     return jsonify({
         'message': 'Device added to group successfully',
@@ -156,6 +167,8 @@ def create_device():
     
     db.session.add(new_device)
     db.session.commit()
+    if new_device.group_id is not None:
+        permission_cache.invalidate_all()
     
     return jsonify({
         'message': 'Device created successfully',
@@ -168,7 +181,7 @@ def get_devices():
     """Get all devices"""
     try:
         # Lấy danh sách thiết bị từ database
-        devices = Device.query.all()
+        devices = Device.listing_query().all()
         
         # Chuẩn bị danh sách thiết bị để trả về
         device_list = []
@@ -201,6 +214,120 @@ def get_devices():
             'devices': []
         }), 500
 
+@devices_bp.route('/health-check', methods=['POST'])
+@jwt_required()
+def run_health_check():
+    """Probe all active devices now and update their status (Admin or Team Lead)"""
+    current_user_id = get_jwt_identity()
+    current_user = User.query.get(current_user_id)
+    
+    if not current_user or not (current_user.is_admin() or current_user.is_team_lead()):
+        return jsonify({'error': 'Only admins and team leads can run device health checks'}), 403
+    
+    try:
+        result = device_poller.sweep()
+        if result is None:
+            return jsonify({'error': 'A health check is already running'}), 409
+        return jsonify({
+            'message': 'Device health check completed',
+            'result': result
+        }), 200
+    except Exception as e:
+        print(f"Error in run_health_check: {str(e)}")
+        return jsonify({'error': f'Health check failed: {str(e)}'}), 500
+
+@devices_bp.route('/health-check', methods=['GET'])
+@jwt_required()
+def get_health_check():
+    """Get the result of the last device health sweep"""
+    return jsonify({
+        'enabled': device_poller.is_running(),
+        'interval': device_poller.interval,
+        'last_sweep': device_poller.last_sweep
+    }), 200
+
+def _latency_percentiles(key_columns):
+    """p50/p95/p99 of one command phase over the last `hours`, grouped by key_columns (ms)"""
+    phase = request.args.get('phase', 'total')
+    if phase not in LATENCY_PHASES:
+        raise ValueError(f"phase must be one of: {', '.join(LATENCY_PHASES)}")
+    hours = request.args.get('hours', 24, type=int)
+    if hours < 1:
+        raise ValueError('hours must be at least 1')
+    
+    if phase == 'total':
+        value = cast(CommandLog.execution_time, Float)
+    else:
+        value = cast(CommandLog.phase_timings[phase].astext, Float)
+    p95 = func.percentile_cont(0.95).within_group(value)
+    
+    # Một truy vấn GROUP BY, percentile được tính trong PostgreSQL
+    rows = db.session.query(
+        *key_columns,
+        func.count(value).label('samples'),
+        func.percentile_cont(0.5).within_group(value).label('p50'),
+        p95.label('p95'),
+        func.percentile_cont(0.99).within_group(value).label('p99'),
+        func.max(value).label('max')
+    ).join(Device, Device.device_id == CommandLog.device_id).filter(
+        CommandLog.executed_at >= datetime.now(UTC) - timedelta(hours=hours),
+        value.isnot(None)
+    ).group_by(*key_columns).order_by(p95.desc()).all()
+    
+    result = []
+    for row in rows:
+        item = row._asdict()
+        for key in ('p50', 'p95', 'p99', 'max'):
+            item[key] = round(item[key], 2) if item[key] is not None else None
+        result.append(item)
+    return phase, hours, result
+
+@devices_bp.route('/latency', methods=['GET'])
+@jwt_required()
+def get_device_latency():
+    """Command latency percentiles per device (Admin, Team Lead or Supervisor)"""
+    current_user_id = get_jwt_identity()
+    current_user = User.query.get(current_user_id)
+    
+    if not current_user or current_user.is_operator():
+        return jsonify({'error': 'You do not have permission to view latency statistics'}), 403
+    
+    try:
+        phase, hours, devices = _latency_percentiles(
+            [Device.device_id, Device.device_name, Device.device_type]
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify({
+        'phase': phase,
+        'hours': hours,
+        'unit': 'ms',
+        'devices': devices
+    }), 200
+
+@devices_bp.route('/latency/types', methods=['GET'])
+@jwt_required()
+def get_device_type_latency():
+    """Command latency percentiles per device type (Admin, Team Lead or Supervisor)"""
+    current_user_id = get_jwt_identity()
+    current_user = User.query.get(current_user_id)
+    
+    if not current_user or current_user.is_operator():
+        return jsonify({'error': 'You do not have permission to view latency statistics'}), 403
+    
+    try:
+        phase, hours, device_types = _latency_percentiles([Device.device_type])
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify({
+        'phase': phase,
+        'hours': hours,
+        'unit': 'ms',
+        'device_types': device_types
+    }), 200
+
 @devices_bp.route('/<int:device_id>', methods=['GET'])
 @jwt_required()
 def get_device(device_id):
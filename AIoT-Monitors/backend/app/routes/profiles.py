@@ -5,6 +5,7 @@ from app.models.user import User, UserRole, UserProfile
 from app.models.profile import Profile
 from app.models.device import DeviceGroup
 from app.models.command import CommandList
+from app.utils.permission_cache import permission_cache
 from datetime import datetime
 
 profiles_bp = Blueprint('profiles', __name__)
@@ -22,10 +23,11 @@ def get_profiles():
         else:
             profiles = Profile.query.all()
         
+        counts = Profile.user_counts([profile.profile_id for profile in profiles])
         return jsonify({
             'success': True,
             'count': len(profiles),
-            'profiles': [profile.to_dict() for profile in profiles]
+            'profiles': [profile.to_dict(user_count=counts.get(profile.profile_id, 0)) for profile in profiles]
         }), 200
     except Exception as e:
         return jsonify({
@@ -193,6 +195,7 @@ def update_profile(profile_id):
             profile.is_active = bool(data['is_active'])
         
         db.session.commit()
+        permission_cache.invalidate_all()
         
         return jsonify({
             'success': True,
@@ -234,6 +237,7 @@ def delete_profile(profile_id):
             # Thay vì xóa, đánh dấu là không hoạt động
             profile.is_active = False
             db.session.commit()
+            permission_cache.invalidate_all()
             
             return jsonify({
                 'success': True,
@@ -243,6 +247,7 @@ def delete_profile(profile_id):
             # Xóa profile nếu không có người dùng nào được gán
             db.session.delete(profile)
             db.session.commit()
+            permission_cache.invalidate_all()
             
             return jsonify({
                 'success': True,
@@ -352,6 +357,7 @@ def assign_profile_to_user(profile_id):
         
         db.session.add(user_profile)
         db.session.commit()
+        permission_cache.invalidate_user(user_id)
         
         return jsonify({
             'success': True,
@@ -411,6 +417,7 @@ def remove_user_from_profile(profile_id, user_id):
         # Thay vì xóa quan hệ, chỉ đánh dấu là không còn active
         user_profile.is_active = False
         db.session.commit()
+        permission_cache.invalidate_user(user_id)
         
         return jsonify({
             'success': True,
@@ -421,4 +428,22 @@ def remove_user_from_profile(profile_id, user_id):
         return jsonify({
             'success': False,
             'error': str(e)
-        }), 500 
\ No newline at end of file
+        }), 500 
+
+@profiles_bp.route('/permission-cache', methods=['GET'])
+@jwt_required()
+def get_permission_cache_stats():
+    """Thống kê cache quyền hiệu lực (chỉ Admin)"""
+    current_user_id = get_jwt_identity()
+    current_user = User.query.get(current_user_id)
+    
+    if not current_user or not current_user.is_admin():
+        return jsonify({
+            'success': False,
+            'error': 'Chỉ Admin mới có quyền xem thống kê cache'
+        }), 403
+    
+    return jsonify({
+        'success': True,
+        'cache': permission_cache.get_stats()
+    }), 200
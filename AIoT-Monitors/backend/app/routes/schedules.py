@@ -0,0 +1,89 @@
+from flask import Blueprint, request, jsonify
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from app import db
+from app.models.user import User
+from app.models.device import Device
+from app.models.scheduled_monitoring import ScheduledMonitoring
+from app.utils.scheduler import monitoring_scheduler
+from datetime import datetime
+
+schedules_bp = Blueprint('schedules', __name__)
+
+@schedules_bp.route('', methods=['POST'])
+@jwt_required()
+def create_schedule():
+    """Schedule a monitoring check for a device (Admin, Team Lead or Supervisor)"""
+    current_user_id = get_jwt_identity()
+    current_user = User.query.get(current_user_id)
+
+    if not current_user or not (current_user.is_admin() or current_user.is_team_lead() or current_user.is_supervisor()):
+        return jsonify({'error': 'Only admins, team leads and supervisors can schedule monitoring'}), 403
+
+    data = request.get_json()
+
+    # Validate required fields
+    required_fields = ['device_id', 'scheduled_time']
+    for field in required_fields:
+        if not data or field not in data:
+            return jsonify({'error': f'Missing required field: {field}'}), 400
+
+    device = Device.query.get(data['device_id'])
+    if not device:
+        return jsonify({'error': 'Device not found'}), 404
+
+    try:
+        scheduled_time = datetime.fromisoformat(data['scheduled_time'])
+    except (TypeError, ValueError):
+        return jsonify({'error': 'scheduled_time must be an ISO 8601 timestamp'}), 400
+
+    schedule = ScheduledMonitoring(
+        device_id=device.device_id,
+        scheduled_time=scheduled_time,
+        user_id=data.get('user_id'),
+        notes=data.get('notes'),
+        created_by=current_user.user_id
+    )
+
+    db.session.add(schedule)
+    db.session.commit()
+
+    # Đưa lịch mới vào hàng đợi của scheduler
+    monitoring_scheduler.notify(schedule.schedule_id, schedule.scheduled_time)
+
+    return jsonify({
+        'message': 'Monitoring scheduled successfully',
+        'schedule': schedule.to_dict()
+    }), 201
+
+@schedules_bp.route('', methods=['GET'])
+@jwt_required()
+def get_schedules():
+    """Get scheduled monitoring checks"""
+    current_user_id = get_jwt_identity()
+    current_user = User.query.get(current_user_id)
+
+    if not current_user:
+        return jsonify({'error': 'User not found'}), 404
+
+    pending_only = request.args.get('pending_only', 'false').lower() == 'true'
+    device_id = request.args.get('device_id', type=int)
+
+    query = ScheduledMonitoring.query
+
+    # Operators only see the checks assigned to them
+    if current_user.is_operator():
+        query = query.filter(ScheduledMonitoring.user_id == current_user.user_id)
+    if pending_only:
+        query = query.filter(ScheduledMonitoring.completed == False)
+    if device_id:
+        query = query.filter(ScheduledMonitoring.device_id == device_id)
+
+    schedules = query.order_by(ScheduledMonitoring.scheduled_time.asc()).all()
+
+    return jsonify({
+        'schedules': [schedule.to_dict() for schedule in schedules],
+        'scheduler': {
+            'running': monitoring_scheduler.is_running(),
+            'last_run': monitoring_scheduler.last_run
+        }
+    }), 200
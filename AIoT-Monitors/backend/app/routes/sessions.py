@@ -1,4 +1,4 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response, stream_with_context, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from app import db
 from app.models.user import User
@@ -6,10 +6,20 @@ from app.models.device import Device
 from app.models.session import Session, SessionStatus, CommandLog
 from app.models.command import Command
 from app.models.file_edit_log import FileEditLog
-from app.utils.ssh_client import SSHClient
+from app.models.command_output import CommandOutputChunk
+from app.utils.ssh_pool import ssh_pool
+from app.utils.command_executor import run_command, stream_command
+from app.utils.command_jobs import command_jobs, JobQueueFullError
+from app.utils.fanout import make_target, run_fanout
+from app.utils.log_writer import log_writer
+from app.utils.query_profiler import query_profiler
+from app.utils.pagination import COUNT_MODES, keyset_page, count_rows
+from app.utils.permissions import can_access_device, can_run_command, get_allowed_commands, get_device_profiles
+from datetime import datetime, UTC
 import paramiko
 import json
 import re
+import time
 
 sessions_bp = Blueprint('sessions', __name__)
 
@@ -38,13 +48,7 @@ def create_session():
         return jsonify({'error': 'Device not found'}), 404
     
     # Check if user has permissions for this device through profiles
-    has_permission = False
-    for profile in current_user.profiles:
-        if device in profile.device_group.devices:
-            has_permission = True
-            break
-    
-    if not has_permission:
+    if not can_access_device(current_user.user_id, device.device_id):
         return jsonify({'error': 'You do not have permission to access this device'}), 403
     
     # Create a new session
@@ -98,89 +102,26 @@ def execute_command(session_id):
     device = Device.query.get(session.device_id)
     raw_command = data['command'].strip()
     
-    # Kiểm tra xem lệnh có liên quan đến chỉnh sửa file không
-    is_file_edit = False
-    file_path = None
-    edit_type = None
-    
-    # Các pattern phổ biến cho lệnh chỉnh sửa file
-    file_edit_patterns = {
-        'create': r'(?:touch|mkdir|>)\s+([^\s]+)',
-        'modify': r'(?:echo|cat|sed|awk)\s+.*?>\s+([^\s]+)',
-        'delete': r'(?:rm|rmdir)\s+([^\s]+)'
-    }
+    # Chỉ cho phép các lệnh thuộc command list của profile được gán
+    if not can_run_command(current_user.user_id, device.group_id, raw_command):
+        return jsonify({'error': 'Command is not allowed on this device', 'success': False}), 403
     
-    for edit_type, pattern in file_edit_patterns.items():
-        match = re.search(pattern, raw_command)
-        if match:
-            is_file_edit = True
-            file_path = match.group(1)
-            break
+    # Chạy lệnh ở chế độ nền: trả về job id ngay, kết quả lấy qua /jobs/<job_id>
+    run_async = data.get('async') or request.args.get('async', 'false').lower() == 'true'
+    if run_async:
+        try:
+            job = command_jobs.submit(session.session_id, current_user.user_id, raw_command)
+        except JobQueueFullError:
+            return jsonify({'error': 'Too many pending commands, try again later', 'success': False}), 503
+        
+        return jsonify({
+            'message': 'Command queued',
+            'job': job.to_dict(),
+            'success': True
+        }), 202
     
     try:
-        print(f"Connecting to SSH: {device.ip_address}:{device.ssh_port} with user {device.username}")
-        ssh_client = SSHClient(
-            hostname=device.ip_address,
-            port=device.ssh_port,
-            username=device.username,
-            password=device.password,
-            authentication_method=device.authentication_method
-        )
-        
-        # Connect to the device
-        ssh_client.connect()
-        
-        # Nếu là lệnh chỉnh sửa file, lưu nội dung trước khi thực hiện
-        content_before = None
-        if is_file_edit and file_path:
-            try:
-                content_before = ssh_client.read_file(file_path)
-            except:
-                content_before = None
-        
-        # Execute the command
-        exit_code, output = ssh_client.execute_command(raw_command)
-        
-        # Nếu là lệnh chỉnh sửa file và thực hiện thành công, lưu nội dung sau khi thực hiện
-        content_after = None
-        if is_file_edit and file_path and exit_code == 0:
-            try:
-                content_after = ssh_client.read_file(file_path)
-            except:
-                content_after = None
-        
-        # Close the connection
-        ssh_client.close()
-        
-        # Log the command
-        command_log = CommandLog(
-            session_id=session.session_id,
-            command_text=raw_command,
-            user_id=current_user.user_id,
-            device_id=device.device_id,
-            output=output,
-            status='success' if exit_code == 0 else 'failed',
-            execution_time=None,
-            is_approved=True
-        )
-        
-        db.session.add(command_log)
-        
-        # Nếu là lệnh chỉnh sửa file và thực hiện thành công, lưu vào file_edit_logs
-        if is_file_edit and file_path and exit_code == 0:
-            file_edit_log = FileEditLog(
-                session_id=session.session_id,
-                user_id=current_user.user_id,
-                device_id=device.device_id,
-                file_path=file_path,
-                edit_type=edit_type,
-                content_before=content_before,
-                content_after=content_after,
-                diff=None  # Có thể thêm logic tạo diff ở đây nếu cần
-            )
-            db.session.add(file_edit_log)
-        
-        db.session.commit()
+        command_log = run_command(session, device, current_user.user_id, raw_command)
         
         return jsonify({
             'message': 'Command executed successfully',
@@ -193,11 +134,295 @@ def execute_command(session_id):
         return jsonify({'error': 'Authentication failed', 'success': False}), 401
     except paramiko.SSHException as e:
         print(f"SSH error for {device.ip_address}:{device.ssh_port}: {str(e)}")
+        ssh_pool.discard_session(session.session_id)
         return jsonify({'error': f'SSH error: {str(e)}', 'success': False}), 500
     except Exception as e:
         print(f"Error connecting to {device.ip_address}:{device.ssh_port}: {str(e)}")
+        ssh_pool.discard_session(session.session_id, force=False)
         return jsonify({'error': f'Error: {str(e)}', 'success': False}), 500
 
+def _sse_event(event, payload):
+    """Format one Server-Sent Events message"""
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+@sessions_bp.route('/<int:session_id>/commands/stream', methods=['POST'])
+@jwt_required()
+def stream_command_output(session_id):
+    """Execute a command and stream its output as Server-Sent Events (Operator)"""
+    current_user_id = get_jwt_identity()
+    current_user = User.query.get(current_user_id)
+    
+    if not current_user:
+        return jsonify({'error': 'User not found'}), 404
+    
+    if not current_user.is_operator():
+        return jsonify({'error': 'Only operators can execute commands'}), 403
+    
+    session = Session.query.get(session_id)
+    
+    if not session:
+        return jsonify({'error': 'Session not found'}), 404
+    
+    if session.user_id != current_user.user_id:
+        return jsonify({'error': 'You do not own this session'}), 403
+    
+    if session.status != SessionStatus.ACTIVE:
+        return jsonify({'error': 'Session is not active'}), 400
+    
+    data = request.get_json()
+    
+    if not data or 'command' not in data:
+        return jsonify({'error': 'Command is required'}), 400
+    
+    device = Device.query.get(session.device_id)
+    raw_command = data['command'].strip()
+    user_id = current_user.user_id
+    
+    if not can_run_command(user_id, device.group_id, raw_command):
+        return jsonify({'error': 'Command is not allowed on this device', 'success': False}), 403
+    chunk_size = current_app.config.get('STREAM_CHUNK_SIZE', 4096)
+    max_log_bytes = current_app.config.get('STREAM_MAX_LOG_BYTES', 1048576)
+    
+    def generate():
+        try:
+            for event, payload in stream_command(session, device, user_id, raw_command,
+                                                 chunk_size=chunk_size, max_log_bytes=max_log_bytes):
+                if event == 'done':
+                    yield _sse_event('done', {'command_log': payload.to_dict(), 'success': True})
+                else:
+                    yield _sse_event('output', {'stream': event, 'data': payload})
+        except paramiko.AuthenticationException:
+            print(f"SSH Authentication failed for {device.ip_address}:{device.ssh_port}")
+            yield _sse_event('error', {'error': 'Authentication failed', 'success': False})
+        except Exception as e:
+            print(f"Error streaming command on {device.ip_address}:{device.ssh_port}: {str(e)}")
+            db.session.rollback()
+            ssh_pool.discard_session(session_id, force=isinstance(e, paramiko.SSHException))
+            yield _sse_event('error', {'error': f'Error: {str(e)}', 'success': False})
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@sessions_bp.route('/batch', methods=['POST'])
+@jwt_required()
+def execute_batch_command():
+    """Run one command on every device of a group or a device list (Operator)"""
+    current_user_id = get_jwt_identity()
+    current_user = User.query.get(current_user_id)
+    
+    if not current_user:
+        return jsonify({'error': 'User not found'}), 404
+    
+    if not current_user.is_operator():
+        return jsonify({'error': 'Only operators can execute commands'}), 403
+    
+    data = request.get_json()
+    
+    if not data or 'command' not in data:
+        return jsonify({'error': 'Command is required'}), 400
+    
+    if not data.get('group_id') and not data.get('device_ids'):
+        return jsonify({'error': 'Either group_id or device_ids is required'}), 400
+    
+    raw_command = data['command'].strip()
+    max_concurrency = current_app.config.get('FANOUT_MAX_CONCURRENCY', 64)
+    concurrency = data.get('concurrency', current_app.config.get('FANOUT_DEFAULT_CONCURRENCY', 16))
+    
+    if not isinstance(concurrency, int) or concurrency < 1 or concurrency > max_concurrency:
+        return jsonify({'error': f'Concurrency must be between 1 and {max_concurrency}'}), 400
+    
+    # Lấy danh sách thiết bị mục tiêu
+    query = Device.query.filter(Device.is_active == True)
+    if data.get('group_id'):
+        query = query.filter(Device.group_id == data['group_id'])
+    if data.get('device_ids'):
+        query = query.filter(Device.device_id.in_(data['device_ids']))
+    devices = query.all()
+    
+    if not devices:
+        return jsonify({'error': 'No active devices found'}), 404
+    
+    # Chỉ chạy trên thiết bị mà operator có profile cho phép lệnh này
+    allowed = {d.group_id: can_run_command(current_user.user_id, d.group_id, raw_command) for d in devices}
+    permitted = [d for d in devices if allowed[d.group_id]]
+    denied = [d for d in devices if not allowed[d.group_id]]
+    
+    if not permitted:
+        return jsonify({'error': 'You do not have permission to run this command on these devices'}), 403
+    
+    # One short-lived session per device keeps the audit trail per device
+    sessions = [
+        Session(
+            user_id=current_user.user_id,
+            device_id=device.device_id,
+            ip_address=request.remote_addr,
+            user_agent=request.user_agent.string if hasattr(request, 'user_agent') else None
+        )
+        for device in permitted
+    ]
+    db.session.add_all(sessions)
+    db.session.commit()
+    
+    targets = [make_target(device, sess.session_id) for device, sess in zip(permitted, sessions)]
+    session_ids = [sess.session_id for sess in sessions]
+    user_id = current_user.user_id
+    denied_results = [{
+        'device_id': device.device_id,
+        'device_name': device.device_name,
+        'status': 'denied',
+        'error': 'Command not allowed on this device'
+    } for device in denied]
+    
+    def persist(results):
+        """Queue all command logs on the log writer and close the batch sessions"""
+        executed_at = datetime.now(UTC)
+        if results:
+            log_writer.submit_many([({
+                'session_id': result['session_id'],
+                'user_id': user_id,
+                'device_id': result['device_id'],
+                'command_text': raw_command,
+                'executed_at': executed_at,
+                'status': result['status'],
+                'output': result['output'] if result['error'] is None else result['error'],
+                'execution_time': result['execution_time'],
+                'phase_timings': result.get('phase_timings'),
+                'is_approved': True
+            }, ()) for result in results], durability=log_writer.bulk_durability)
+        
+        # Phiên của thiết bị chưa kịp chạy lệnh (client ngắt kết nối) được đánh dấu terminated
+        ran_ids = {result['session_id'] for result in results}
+        failed_ids = {result['session_id'] for result in results if result['error'] is not None}
+        Session.query.filter(Session.session_id.in_(session_ids)).update(
+            {'status': SessionStatus.TERMINATED, 'end_time': executed_at},
+            synchronize_session=False
+        )
+        for status, ids in ((SessionStatus.COMPLETED, ran_ids - failed_ids), (SessionStatus.FAILED, failed_ids)):
+            if ids:
+                Session.query.filter(Session.session_id.in_(ids)).update(
+                    {'status': status}, synchronize_session=False
+                )
+        db.session.commit()
+    
+    def summary(results):
+        # total = permitted + denied; succeeded + failed + not_run = permitted
+        succeeded = sum(1 for result in results if result['status'] == 'success')
+        failed = sum(1 for result in results if result['status'] == 'failed')
+        return {
+            'total': len(devices),
+            'permitted': len(permitted),
+            'succeeded': succeeded,
+            'failed': failed,
+            'not_run': len(permitted) - succeeded - failed,
+            'denied': len(denied_results)
+        }
+    
+    if not data.get('stream', True):
+        results = list(run_fanout(targets, raw_command, concurrency))
+        persist(results)
+        return jsonify({
+            'command': raw_command,
+            'results': results + denied_results,
+            'summary': summary(results),
+            'success': True
+        }), 200
+    
+    def generate():
+        results = []
+        fanout = run_fanout(targets, raw_command, concurrency, results)
+        try:
+            for result in denied_results:
+                yield _sse_event('result', result)
+            for result in fanout:
+                yield _sse_event('result', result)
+        finally:
+            # Hủy các thiết bị chưa bắt đầu, chờ các lệnh đang chạy rồi ghi log tất cả
+            fanout.close()
+            try:
+                persist(results)
+            except Exception as e:
+                print(f"Error saving batch command logs: {str(e)}")
+                db.session.rollback()
+        yield _sse_event('done', {'command': raw_command, 'summary': summary(results), 'success': True})
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+def _get_accessible_job(job_id, current_user):
+    """Look up a job and check that the user may see it"""
+    job = command_jobs.get(job_id)
+    if not job:
+        return None, (jsonify({'error': 'Job not found'}), 404)
+    
+    if job.user_id != current_user.user_id and not (current_user.is_admin() or current_user.is_supervisor()):
+        return None, (jsonify({'error': 'You do not have permission to view this job'}), 403)
+    
+    return job, None
+
+@sessions_bp.route('/jobs/<job_id>', methods=['GET'])
+@jwt_required()
+def get_command_job(job_id):
+    """Get the status of a command job"""
+    current_user_id = get_jwt_identity()
+    current_user = User.query.get(current_user_id)
+    
+    if not current_user:
+        return jsonify({'error': 'User not found'}), 404
+    
+    job, error = _get_accessible_job(job_id, current_user)
+    if error:
+        return error
+    
+    return jsonify({
+        'job': job.to_dict()
+    }), 200
+
+@sessions_bp.route('/jobs/<job_id>/output', methods=['GET'])
+@jwt_required()
+def get_command_job_output(job_id):
+    """Get the status and output of a command job"""
+    current_user_id = get_jwt_identity()
+    current_user = User.query.get(current_user_id)
+    
+    if not current_user:
+        return jsonify({'error': 'User not found'}), 404
+    
+    job, error = _get_accessible_job(job_id, current_user)
+    if error:
+        return error
+    
+    return jsonify({
+        'job': job.to_dict(include_output=True)
+    }), 200
+
+@sessions_bp.route('/<int:session_id>/jobs', methods=['GET'])
+@jwt_required()
+def get_session_jobs(session_id):
+    """Get the command jobs of a session"""
+    current_user_id = get_jwt_identity()
+    current_user = User.query.get(current_user_id)
+    
+    if not current_user:
+        return jsonify({'error': 'User not found'}), 404
+    
+    session = Session.query.get(session_id)
+    
+    if not session:
+        return jsonify({'error': 'Session not found'}), 404
+    
+    if session.user_id != current_user.user_id and not (current_user.is_admin() or current_user.is_supervisor()):
+        return jsonify({'error': 'You do not have permission to view this session'}), 403
+    
+    return jsonify({
+        'jobs': [job.to_dict() for job in command_jobs.get_session_jobs(session_id)]
+    }), 200
+
 @sessions_bp.route('/<int:session_id>/read-file', methods=['POST'])
 @jwt_required()
 def read_file(session_id):
@@ -216,35 +441,87 @@ def read_file(session_id):
     if session.user_id != current_user.user_id and not (current_user.is_admin() or current_user.is_supervisor()):
         return jsonify({'error': 'You do not have permission to access this session'}), 403
     
+    # Chỉ phiên đang hoạt động mới được gắn kết nối SSH trong pool
+    if session.status != SessionStatus.ACTIVE:
+        return jsonify({'error': 'Session is not active'}), 400
+    
     data = request.get_json()
     if not data or 'file_path' not in data:
         return jsonify({'error': 'File path is required'}), 400
     
+    file_path = data['file_path']
+    stream = bool(data.get('stream', False))
+    offset = data.get('offset', 0)
+    length = data.get('length')
+    tail_lines = data.get('tail_lines')
+    
+    for name, value in (('offset', offset), ('length', length), ('tail_lines', tail_lines)):
+        if value is not None and (not isinstance(value, int) or value < 0):
+            return jsonify({'error': f'{name} must be a non-negative integer'}), 400
+    
+    chunk_size = current_app.config.get('READ_FILE_CHUNK_SIZE', 32768)
+    window = current_app.config.get('READ_FILE_PREFETCH_WINDOW', 32)
+    max_inline = current_app.config.get('READ_FILE_MAX_INLINE_BYTES', 5242880)
+    
     try:
-        # Create SSH client
-        ssh_client = SSHClient(
-            hostname=session.device.ip_address,
-            port=session.device.ssh_port,
-            username=session.device.username,
-            password=session.device.password,
-            authentication_method=session.device.authentication_method
-        )
-        
-        # Connect to device
-        ssh_client.connect()
+        ssh_client = ssh_pool.checkout(session.session_id, session.device)
         
-        # Read file content
-        content = ssh_client.read_file(data['file_path'])
+        # Toàn bộ file ở dạng JSON như trước (dùng cho trình soạn thảo)
+        if not stream and not offset and length is None and not tail_lines:
+            content = ssh_client.read_file(file_path, max_bytes=max_inline)
+            
+            return jsonify({
+                'content': content
+            }), 200
         
-        # Close connection
-        ssh_client.close()
+        size = ssh_client.file_size(file_path)
+        if tail_lines:
+            offset = ssh_client.tail_offset(file_path, tail_lines, chunk_size=chunk_size)
+            length = None
+        read_length = max(0, size - offset) if length is None else max(0, min(length, size - offset))
         
-        return jsonify({
-            'content': content
-        }), 200
+        if not stream:
+            if read_length > max_inline:
+                return jsonify({
+                    'error': f'Range is larger than {max_inline} bytes, use stream mode'
+                }), 413
+            content = b''.join(ssh_client.read_file_chunks(
+                file_path, offset, read_length, chunk_size=chunk_size, window=window))
+            
+            return jsonify({
+                'content': content.decode('utf-8', errors='replace'),
+                'offset': offset,
+                'length': len(content),
+                'file_size': size
+            }), 200
         
     except Exception as e:
+        ssh_pool.discard_session(session.session_id, force=False)
         return jsonify({'error': str(e)}), 500
+    
+    session_id = session.session_id
+    
+    def generate():
+        # Gửi từng chunk ngay khi đọc được, bộ nhớ không phụ thuộc kích thước file
+        try:
+            for chunk in ssh_client.read_file_chunks(file_path, offset, read_length,
+                                                     chunk_size=chunk_size, window=window):
+                yield chunk
+        except Exception as e:
+            print(f"Error streaming {file_path} from session {session_id}: {str(e)}")
+            ssh_pool.discard_session(session_id, force=False)
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='application/octet-stream',
+        headers={
+            'X-File-Size': str(size),
+            'X-Range-Offset': str(offset),
+            'X-Range-Length': str(read_length),
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
 
 @sessions_bp.route('/<int:session_id>/edit-file', methods=['POST'])
 @jwt_required()
@@ -264,34 +541,81 @@ def edit_file(session_id):
     if session.user_id != current_user.user_id and not (current_user.is_admin() or current_user.is_supervisor()):
         return jsonify({'error': 'You do not have permission to access this session'}), 403
     
+    # Chỉ phiên đang hoạt động mới được gắn kết nối SSH trong pool
+    if session.status != SessionStatus.ACTIVE:
+        return jsonify({'error': 'Session is not active'}), 400
+    
     data = request.get_json()
     if not data or 'file_path' not in data or 'content' not in data:
         return jsonify({'error': 'File path and content are required'}), 400
     
     try:
-        # Create SSH client
-        ssh_client = SSHClient(
-            hostname=session.device.ip_address,
-            port=session.device.ssh_port,
-            username=session.device.username,
-            password=session.device.password,
-            authentication_method=session.device.authentication_method
-        )
-        
-        # Connect to device
-        ssh_client.connect()
+        ssh_client = ssh_pool.checkout(session.session_id, session.device)
         
         # Edit file
         ssh_client.edit_file(data['file_path'], data['content'], data.get('edit_type', 'modify'))
         
-        # Close connection
-        ssh_client.close()
-        
         return jsonify({
             'message': 'File edited successfully'
         }), 200
         
     except Exception as e:
+        ssh_pool.discard_session(session.session_id, force=False)
+        return jsonify({'error': str(e)}), 500
+
+@sessions_bp.route('/<int:session_id>/upload-file', methods=['POST'])
+@jwt_required()
+def upload_file(session_id):
+    """Upload a file to the device from a streamed request body (config files, firmware)"""
+    current_user_id = get_jwt_identity()
+    current_user = User.query.get(current_user_id)
+    
+    if not current_user:
+        return jsonify({'error': 'User not found'}), 404
+    
+    session = Session.query.get(session_id)
+    if not session:
+        return jsonify({'error': 'Session not found'}), 404
+    
+    # Check if the user has permission to access this session
+    if session.user_id != current_user.user_id and not (current_user.is_admin() or current_user.is_supervisor()):
+        return jsonify({'error': 'You do not have permission to access this session'}), 403
+    
+    # Chỉ phiên đang hoạt động mới được gắn kết nối SSH trong pool
+    if session.status != SessionStatus.ACTIVE:
+        return jsonify({'error': 'Session is not active'}), 400
+    
+    file_path = request.args.get('file_path')
+    if not file_path:
+        return jsonify({'error': 'file_path query parameter is required'}), 400
+    
+    chunk_size = current_app.config.get('UPLOAD_CHUNK_SIZE', 32768)
+    
+    def body_chunks():
+        # Đọc body theo từng chunk thay vì nạp toàn bộ vào bộ nhớ
+        while True:
+            chunk = request.stream.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    
+    try:
+        ssh_client = ssh_pool.checkout(session.session_id, session.device)
+        
+        started = time.monotonic()
+        written = ssh_client.write_file_chunks(file_path, body_chunks())
+        elapsed = time.monotonic() - started
+        
+        return jsonify({
+            'message': 'File uploaded successfully',
+            'file_path': file_path,
+            'bytes': written,
+            'elapsed_ms': int(elapsed * 1000),
+            'throughput_mb_s': round(written / 1048576 / elapsed, 2) if elapsed > 0 else None
+        }), 200
+        
+    except Exception as e:
+        ssh_pool.discard_session(session.session_id, force=False)
         return jsonify({'error': str(e)}), 500
 
 @sessions_bp.route('/<int:session_id>', methods=['PUT'])
@@ -324,11 +648,43 @@ def end_session(session_id):
     session.end_session(status)
     db.session.commit()
     
+    # Return the session's SSH connection to the pool
+    ssh_pool.release_session(session_id)
+    
     return jsonify({
         'message': 'Session ended successfully',
         'session': session.to_dict()
     }), 200
 
+def _keyset_page(query, time_column, id_column, limit, descending=True):
+    """Cursor pagination from request args: cursor, limit and count (none|estimate|exact)"""
+    count_mode = request.args.get('count', 'none')
+    if count_mode not in COUNT_MODES:
+        raise ValueError(f"count must be one of: {', '.join(COUNT_MODES)}")
+    limit = max(1, min(limit, 100))
+    
+    rows, next_cursor = keyset_page(query, time_column, id_column,
+                                    request.args.get('cursor'), limit, descending)
+    return rows, {
+        'limit': limit,
+        'next_cursor': next_cursor,
+        'has_more': next_cursor is not None,
+        'total': count_rows(db.session, query, count_mode),
+        'total_is_estimate': count_mode == 'estimate'
+    }
+
+def _session_dicts(sessions, detailed):
+    """Serialize a page of sessions with a fixed number of queries"""
+    session_ids = [session.session_id for session in sessions]
+    counts = Session.command_counts(session_ids)
+    commands = Session.commands_by_session(session_ids) if detailed else {}
+    return [
+        session.to_dict(detailed=detailed,
+                        command_count=counts.get(session.session_id, 0),
+                        commands=commands.get(session.session_id))
+        for session in sessions
+    ]
+
 @sessions_bp.route('', methods=['GET'])
 @jwt_required()
 def get_sessions():
@@ -342,10 +698,10 @@ def get_sessions():
     active_only = request.args.get('active_only', 'false').lower() == 'true'
     detailed = request.args.get('detailed', 'false').lower() == 'true'
     limit = request.args.get('limit', 20, type=int)
-    offset = request.args.get('offset', 0, type=int)
+    offset = request.args.get('offset', type=int)
     
     # Build query based on user role
-    query = Session.query
+    query = Session.listing_query()
     
     if active_only:
         query = query.filter(Session.status == SessionStatus.ACTIVE)
@@ -354,16 +710,24 @@ def get_sessions():
     if current_user.is_operator():
         query = query.filter(Session.user_id == current_user.user_id)
     
-    # Apply pagination
-    total = query.count()
-    sessions = query.order_by(Session.start_time.desc()).offset(offset).limit(limit).all()
+    # Legacy offset pagination, kept for existing clients
+    if offset is not None:
+        total = query.count()
+        sessions = query.order_by(Session.start_time.desc()).offset(offset).limit(limit).all()
+        
+        return jsonify({
+            'sessions': _session_dicts(sessions, detailed),
+            'total': total,
+            'limit': limit,
+            'offset': offset
+        }), 200
     
-    return jsonify({
-        'sessions': [session.to_dict(detailed=detailed) for session in sessions],
-        'total': total,
-        'limit': limit,
-        'offset': offset
-    }), 200
+    try:
+        sessions, page = _keyset_page(query, Session.start_time, Session.session_id, limit)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    page['sessions'] = _session_dicts(sessions, detailed)
+    return jsonify(page), 200
 
 @sessions_bp.route('/<int:session_id>', methods=['GET'])
 @jwt_required()
@@ -386,18 +750,13 @@ def get_session(session_id):
         if session.user_id != current_user.user_id:
             return jsonify({'error': 'You do not have permission to view this session'}), 403
         # Check if operator has access to this device through their profiles
-        device = Device.query.get(session.device_id)
-        has_permission = False
-        for profile in current_user.profiles:
-            if device in profile.device_group.devices:
-                has_permission = True
-                break
-        if not has_permission:
+        if not can_access_device(current_user.user_id, session.device_id):
             return jsonify({'error': 'You do not have permission to access this device'}), 403
     
     session_data = session.to_dict()
     
     # Add device details
+    device = None
     try:
         device = Device.query.get(session.device_id)
         if device:
@@ -438,16 +797,14 @@ def get_session(session_id):
     allowed_commands = []
     if current_user.is_operator():
         try:
-            for profile in current_user.profiles:
-                if profile.command_list:
-                    for cmd in profile.command_list.commands:
-                        allowed_commands.append({
-                            'id': cmd.command_id,
-                            'command': cmd.command_text,
-                            'description': cmd.description,
-                            'profile_id': profile.profile_id,
-                            'profile_name': profile.profile_name
-                        })
+            for cmd, profile in get_allowed_commands(current_user.user_id):
+                allowed_commands.append({
+                    'id': cmd.command_id,
+                    'command': cmd.command_text,
+                    'description': cmd.description,
+                    'profile_id': profile.profile_id,
+                    'profile_name': profile.profile_name
+                })
         except Exception as e:
             print(f"Error getting allowed commands: {str(e)}")
     
@@ -455,15 +812,14 @@ def get_session(session_id):
     if current_user.is_operator() and device:
         try:
             device_profiles = []
-            for profile in current_user.profiles:
-                if device.group_id == profile.group_id:
-                    device_profiles.append({
-                        'id': profile.profile_id,
-                        'name': profile.profile_name,
-                        'description': profile.description,
-                        'group_id': profile.group_id,
-                        'list_id': profile.list_id
-                    })
+            for profile in get_device_profiles(current_user.user_id, device.group_id):
+                device_profiles.append({
+                    'id': profile.profile_id,
+                    'name': profile.profile_name,
+                    'description': profile.description,
+                    'group_id': profile.group_id,
+                    'list_id': profile.list_id
+                })
             if device_profiles:
                 session_data['device_profiles'] = device_profiles
         except Exception as e:
@@ -493,9 +849,61 @@ def get_session_commands(session_id):
     if session.user_id != current_user.user_id and not (current_user.is_admin() or current_user.is_supervisor()):
         return jsonify({'error': 'You do not have permission to view this session'}), 403
     
-    commands = CommandLog.query.filter_by(session_id=session_id).order_by(CommandLog.executed_at.asc()).all()
+    query = CommandLog.query.filter_by(session_id=session_id)
+    
+    # Without a limit the whole history is returned, oldest first
+    limit = request.args.get('limit', type=int)
+    if limit is None:
+        commands = query.order_by(CommandLog.executed_at.asc()).all()
+        return jsonify({
+            'commands': [command.to_dict() for command in commands]
+        }), 200
+    
+    try:
+        commands, page = _keyset_page(query, CommandLog.executed_at, CommandLog.log_id, limit, descending=False)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    page['commands'] = [command.to_dict() for command in commands]
+    return jsonify(page), 200
+
+@sessions_bp.route('/commands/<int:log_id>/output', methods=['GET'])
+@jwt_required()
+def get_command_output(log_id):
+    """Get the full output of a command one stored chunk per page"""
+    current_user_id = get_jwt_identity()
+    current_user = User.query.get(current_user_id)
+    
+    if not current_user:
+        return jsonify({'error': 'User not found'}), 404
+    
+    command_log = CommandLog.query.get(log_id)
+    if not command_log:
+        return jsonify({'error': 'Command log not found'}), 404
+    
+    if command_log.user_id != current_user.user_id and not (current_user.is_admin() or current_user.is_supervisor()):
+        return jsonify({'error': 'You do not have permission to view this command'}), 403
+    
+    page = request.args.get('page', 0, type=int)
+    total_pages = command_log.output_chunks or 1
+    if page < 0 or page >= total_pages:
+        return jsonify({'error': f'Page must be between 0 and {total_pages - 1}'}), 400
+    
+    # Output nhỏ được lưu trực tiếp trong command_logs
+    if not command_log.output_chunks:
+        content = command_log.output or ''
+    else:
+        chunk = CommandOutputChunk.query.get((log_id, page))
+        if not chunk:
+            return jsonify({'error': 'Output chunk not found'}), 404
+        content = chunk.content
+    
     return jsonify({
-        'commands': [command.to_dict() for command in commands]
+        'id': command_log.log_id,
+        'page': page,
+        'total_pages': total_pages,
+        'next_page': page + 1 if page + 1 < total_pages else None,
+        'output_size': command_log.output_size if command_log.output_size is not None else len(content),
+        'content': content
     }), 200
 
 @sessions_bp.route('/file-edits', methods=['GET'])
@@ -514,13 +922,13 @@ def get_file_edits():
     
     # Lấy các tham số phân trang và lọc
     limit = request.args.get('limit', 20, type=int)
-    offset = request.args.get('offset', 0, type=int)
+    offset = request.args.get('offset', type=int)
     device_id = request.args.get('device_id', type=int)
     user_id = request.args.get('user_id', type=int)
     session_id = request.args.get('session_id', type=int)
     
     # Xây dựng query
-    query = FileEditLog.query
+    query = FileEditLog.listing_query()
     
     if device_id:
         query = query.filter(FileEditLog.device_id == device_id)
@@ -529,18 +937,111 @@ def get_file_edits():
     if session_id:
         query = query.filter(FileEditLog.session_id == session_id)
     
-    # Sắp xếp theo thời gian giảm dần (mới nhất lên đầu)
-    query = query.order_by(FileEditLog.edit_started_at.desc())
+    # Phân trang kiểu offset cũ, giữ cho các client hiện có
+    if offset is not None:
+        # Sắp xếp theo thời gian giảm dần (mới nhất lên đầu)
+        query = query.order_by(FileEditLog.edit_started_at.desc())
+        
+        # Lấy tổng số records
+        total = query.count()
+        
+        # Áp dụng phân trang
+        file_edits = query.offset(offset).limit(limit).all()
+        
+        return jsonify({
+            'file_edits': [edit.to_dict() for edit in file_edits],
+            'total': total,
+            'limit': limit,
+            'offset': offset
+        }), 200
+    
+    try:
+        file_edits, page = _keyset_page(query, FileEditLog.edit_started_at, FileEditLog.log_id, limit)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    page['file_edits'] = [edit.to_dict() for edit in file_edits]
+    return jsonify(page), 200
+
+@sessions_bp.route('/file-edits/<int:log_id>/content', methods=['GET'])
+@jwt_required()
+def get_file_edit_content(log_id):
+    """Get the file content before/after an edit (Supervisor only)"""
+    current_user_id = get_jwt_identity()
+    current_user = User.query.get(current_user_id)
+    
+    if not current_user:
+        return jsonify({'error': 'User not found'}), 404
     
-    # Lấy tổng số records
-    total = query.count()
+    if not current_user.is_supervisor():
+        return jsonify({'error': 'Only supervisors can view file edit logs'}), 403
     
-    # Áp dụng phân trang
-    file_edits = query.offset(offset).limit(limit).all()
+    file_edit = FileEditLog.query.get(log_id)
+    if not file_edit:
+        return jsonify({'error': 'File edit log not found'}), 404
+    
+    # which=before|after để chỉ tải một phía của snapshot
+    which = request.args.get('which', 'both')
+    if which not in ('before', 'after', 'both'):
+        return jsonify({'error': 'which must be before, after or both'}), 400
+    
+    result = {
+        'id': file_edit.log_id,
+        'file_path': file_edit.file_path
+    }
+    if which in ('before', 'both'):
+        result['content_before'] = file_edit.get_content_before()
+    if which in ('after', 'both'):
+        result['content_after'] = file_edit.get_content_after()
+    
+    return jsonify(result), 200
+
+@sessions_bp.route('/ssh-pool', methods=['GET'])
+@jwt_required()
+def get_ssh_pool_stats():
+    """Get SSH connection pool statistics (Admin only)"""
+    current_user_id = get_jwt_identity()
+    current_user = User.query.get(current_user_id)
+    
+    if not current_user or not current_user.is_admin():
+        return jsonify({'error': 'Only admins can view SSH pool statistics'}), 403
     
     return jsonify({
-        'file_edits': [edit.to_dict() for edit in file_edits],
-        'total': total,
-        'limit': limit,
-        'offset': offset
-    }), 200
\ No newline at end of file
+        'pool': ssh_pool.get_stats()
+    }), 200
+
+@sessions_bp.route('/log-writer', methods=['GET'])
+@jwt_required()
+def get_log_writer_stats():
+    """Get command log writer queue and batching statistics (Admin only)"""
+    current_user_id = get_jwt_identity()
+    current_user = User.query.get(current_user_id)
+    
+    if not current_user or not current_user.is_admin():
+        return jsonify({'error': 'Only admins can view log writer statistics'}), 403
+    
+    return jsonify({
+        'log_writer': log_writer.get_stats()
+    }), 200
+
+@sessions_bp.route('/query-profiler', methods=['GET', 'PUT'])
+@jwt_required()
+def query_profiler_settings():
+    """Get SQL query profiler statistics or switch it on/off (Admin only)"""
+    current_user_id = get_jwt_identity()
+    current_user = User.query.get(current_user_id)
+    
+    if not current_user or not current_user.is_admin():
+        return jsonify({'error': 'Only admins can manage the query profiler'}), 403
+    
+    if request.method == 'PUT':
+        data = request.get_json() or {}
+        if not isinstance(data.get('enabled'), bool):
+            return jsonify({'error': 'enabled must be true or false'}), 400
+        if data['enabled']:
+            query_profiler.enable()
+        else:
+            query_profiler.disable()
+    
+    return jsonify({
+        'query_profiler': query_profiler.get_stats()
+    }), 200
@@ -5,6 +5,7 @@ from app.models.user import User, UserProfile
 from app.models.device_group import DeviceGroup
 from app.models.command_list import CommandList
 from app import db
+from app.utils.permission_cache import permission_cache
 
 user_profiles_bp = Blueprint('user_profiles', __name__)
 
@@ -159,6 +160,7 @@ def assign_profile_to_user(current_user):
         
         db.session.add(user_profile)
         db.session.commit()
+        permission_cache.invalidate_user(user_id)
         
         return jsonify({
             'success': True,
@@ -225,6 +227,7 @@ def remove_profile_from_user(current_user, user_id, profile_id):
         # Đánh dấu user profile là không hoạt động
         user_profile.is_active = False
         db.session.commit()
+        permission_cache.invalidate_user(user_id)
         
         return jsonify({
             'success': True,
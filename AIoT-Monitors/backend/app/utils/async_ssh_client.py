@@ -0,0 +1,600 @@
+import asyncio
+import collections
+import posixpath
+import queue
+import stat
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from app.utils.metrics import metrics
+from app.utils.ssh_client import MAX_SYMLINK_DEPTH
+
+try:
+    import asyncssh
+except ImportError:
+    asyncssh = None
+
+# Seconds to wait for the peer to answer a health check
+HEALTH_CHECK_TIMEOUT = 10
+
+
+class EventLoopThread:
+    """A single asyncio loop running in a daemon thread, shared by the process"""
+
+    def __init__(self):
+        self._loop = None
+        self._lock = threading.Lock()
+
+    def loop(self):
+        if self._loop is None:
+            with self._lock:
+                if self._loop is None:
+                    loop = asyncio.new_event_loop()
+                    thread = threading.Thread(target=loop.run_forever, name='asyncssh-loop', daemon=True)
+                    thread.start()
+                    self._loop = loop
+        return self._loop
+
+    def run(self, coro, timeout=None):
+        """Run a coroutine on the loop and wait for its result"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop()).result(timeout)
+
+    def iterate(self, agen, maxsize=64):
+        """Consume an async generator from synchronous code.
+
+        Items pass through a bounded queue, so a slow consumer pauses the
+        producer instead of buffering without limit. If the consumer stops
+        early the generator is closed on the loop, so its cleanup (closing
+        the remote channel) runs right away rather than at garbage collection.
+        """
+        queue = asyncio.Queue(maxsize)
+        done = object()
+
+        async def pump():
+            try:
+                async for item in agen:
+                    await queue.put((item, None))
+                await queue.put((done, None))
+            except Exception as e:
+                await queue.put((done, e))
+            finally:
+                await agen.aclose()
+
+        future = asyncio.run_coroutine_threadsafe(pump(), self.loop())
+        try:
+            while True:
+                item, error = self.run(queue.get())
+                if item is done:
+                    if error is not None:
+                        raise error
+                    return
+                yield item
+        finally:
+            future.cancel()
+
+
+event_loop = EventLoopThread()
+
+
+def _require_asyncssh():
+    if asyncssh is None:
+        raise Exception("SSH_ENGINE=asyncssh requires the asyncssh package (pip install asyncssh)")
+
+
+if asyncssh is not None:
+    class _ConnectionWatcher(asyncssh.SSHClient):
+        def __init__(self, owner):
+            self.owner = owner
+
+        def connection_lost(self, exc):
+            self.owner._closed = True
+else:
+    _ConnectionWatcher = None
+
+
+class AsyncSSHClient:
+    """asyncssh implementation of the SSHClient interface.
+
+    The *_async coroutines run on the shared event loop; the synchronous
+    methods wrap them so routes and the connection pool can use this class
+    interchangeably with SSHClient.
+    """
+
+    def __init__(self, hostname, port, username, password, authentication_method='password'):
+        _require_asyncssh()
+        self.hostname = hostname
+        self.port = port
+        self.username = username
+        self.password = password
+        self.authentication_method = authentication_method
+        self.conn = None
+        self.keepalive_interval = 0
+        self._sftp = None
+        self._closed = False
+        # Seconds spent connecting, and when (perf_counter) it finished
+        self.timings = {}
+        self.connected_at = None
+
+    def _record_phase(self, phase, started, timings=None):
+        elapsed = time.perf_counter() - started
+        if timings is not None:
+            timings[phase] = elapsed
+        metrics.observe_ssh_phase('asyncssh', phase, elapsed)
+        return time.perf_counter()
+
+    async def connect_async(self):
+        # asyncssh.connect does TCP, handshake and auth in one call: timed as 'connect'
+        started = time.perf_counter()
+        try:
+            self.conn = await asyncssh.connect(
+                self.hostname,
+                port=self.port,
+                username=self.username,
+                password=self.password,
+                known_hosts=None,
+                keepalive_interval=self.keepalive_interval,
+                client_factory=lambda: _ConnectionWatcher(self)
+            )
+            self._closed = False
+            self._record_phase('connect', started, self.timings)
+            self.connected_at = time.perf_counter()
+        except Exception as e:
+            metrics.count_ssh_error('asyncssh', 'connect')
+            raise Exception(f"Failed to connect: {str(e)}")
+
+    async def execute_command_async(self, command, timings=None):
+        if not self.conn:
+            raise Exception("Not connected")
+        _count_operation()
+
+        try:
+            # Same as conn.run(), split so channel open and exec are timed apart;
+            # output is collected while the command runs, so exec includes transfer
+            started = time.perf_counter()
+            process = await self.conn.create_process(command)
+            started = self._record_phase('channel_open', started, timings)
+            result = await process.wait(check=False)
+            self._record_phase('exec', started, timings)
+            output = result.stdout or ''
+            error = result.stderr or ''
+
+            # Combine output and error if there's an error
+            if error:
+                output = f"{output}\n{error}"
+
+            return result.exit_status, output
+        except Exception as e:
+            metrics.count_ssh_error('asyncssh', 'exec')
+            raise Exception(f"Command execution failed: {str(e)}")
+
+    async def execute_command_stream_async(self, command, chunk_size=4096, timings=None):
+        if not self.conn:
+            raise Exception("Not connected")
+        _count_operation()
+
+        try:
+            started = time.perf_counter()
+            process = await self.conn.create_process(command)
+            started = self._record_phase('channel_open', started, timings)
+        except Exception as e:
+            metrics.count_ssh_error('asyncssh', 'exec')
+            raise Exception(f"Command execution failed: {str(e)}")
+
+        async def relay(reader, stream, queue):
+            while True:
+                data = await reader.read(chunk_size)
+                if not data:
+                    break
+                await queue.put((stream, data))
+
+        # Interleave stdout and stderr through one bounded queue
+        queue = asyncio.Queue(16)
+        readers = asyncio.gather(
+            relay(process.stdout, 'stdout', queue),
+            relay(process.stderr, 'stderr', queue)
+        )
+        try:
+            while not (readers.done() and queue.empty()):
+                getter = asyncio.ensure_future(queue.get())
+                await asyncio.wait([getter, readers], return_when=asyncio.FIRST_COMPLETED)
+                if getter.done():
+                    yield getter.result()
+                else:
+                    getter.cancel()
+            readers.result()
+
+            await process.wait()
+            self._record_phase('exec', started, timings)
+            yield 'exit', process.exit_status
+        finally:
+            # The consumer may stop early: do not leave the relays reading
+            readers.cancel()
+            process.close()
+
+    async def _get_sftp(self):
+        if self._sftp is None:
+            self._sftp = await self.conn.start_sftp_client()
+            _count_sftp_open()
+        return self._sftp
+
+    async def read_file_async(self, file_path, max_bytes=None):
+        if not self.conn:
+            raise Exception("Not connected")
+        _count_operation()
+
+        try:
+            sftp = await self._get_sftp()
+            if max_bytes is not None and (await sftp.stat(file_path)).size > max_bytes:
+                raise Exception(f"File is larger than {max_bytes} bytes")
+            async with sftp.open(file_path, 'rb') as f:
+                content = await f.read()
+            # Giống SSHClient.read_file: file không phải UTF-8 vẫn đọc được
+            return content.decode('utf-8', errors='replace')
+        except Exception as e:
+            raise Exception(f"Failed to read file: {str(e)}")
+
+    async def file_size_async(self, file_path):
+        if not self.conn:
+            raise Exception("Not connected")
+        _count_operation()
+
+        try:
+            sftp = await self._get_sftp()
+            return (await sftp.stat(file_path)).size
+        except Exception as e:
+            raise Exception(f"Failed to read file: {str(e)}")
+
+    async def read_file_chunks_async(self, file_path, offset=0, length=None, chunk_size=32768, window=32):
+        if not self.conn:
+            raise Exception("Not connected")
+        _count_operation()
+
+        try:
+            sftp = await self._get_sftp()
+            f = await sftp.open(file_path, 'rb')
+        except Exception as e:
+            raise Exception(f"Failed to read file: {str(e)}")
+
+        async with f:
+            size = (await f.stat()).size
+            end = size if length is None else min(size, offset + length)
+            position = offset
+            while position < end:
+                # asyncssh splits one large read into parallel SFTP requests
+                n = min(chunk_size * window, end - position)
+                data = await f.read(n, position)
+                if not data:
+                    break
+                position += len(data)
+                for start in range(0, len(data), chunk_size):
+                    yield data[start:start + chunk_size]
+
+    async def tail_offset_async(self, file_path, lines, chunk_size=32768):
+        if not self.conn:
+            raise Exception("Not connected")
+        _count_operation()
+
+        try:
+            sftp = await self._get_sftp()
+            async with sftp.open(file_path, 'rb') as f:
+                position = (await f.stat()).size
+                at_end = True
+                newlines = 0
+                while position > 0:
+                    n = min(chunk_size, position)
+                    position -= n
+                    block = await f.read(n, position)
+                    index = len(block) - 1 if at_end and block.endswith(b'\n') else len(block)
+                    at_end = False
+                    while True:
+                        index = block.rfind(b'\n', 0, index)
+                        if index < 0:
+                            break
+                        newlines += 1
+                        if newlines == lines:
+                            return position + index + 1
+                return 0
+        except Exception as e:
+            raise Exception(f"Failed to read file: {str(e)}")
+
+    async def edit_file_async(self, file_path, content, edit_type='modify'):
+        if not self.conn:
+            raise Exception("Not connected")
+        _count_operation()
+
+        try:
+            sftp = await self._get_sftp()
+            if edit_type in ('create', 'modify'):
+                data = content.encode('utf-8') if isinstance(content, str) else content
+                upload = await self._begin_upload_async(file_path)
+                try:
+                    await upload[0].write(data, 0)
+                except Exception:
+                    await self._abort_upload_async(upload)
+                    raise
+                await self._finish_upload_async(upload)
+            elif edit_type == 'delete':
+                await sftp.remove(file_path)
+            else:
+                raise Exception(f"Invalid edit type: {edit_type}")
+
+            return True
+        except Exception as e:
+            raise Exception(f"Failed to edit file: {str(e)}")
+
+    async def _begin_upload_async(self, file_path):
+        """Open a temp file beside the (symlink-resolved) target; see SSHClient._upload.
+        
+        Returns (file, tmp_path, target, attrs); tmp_path is None when the
+        directory refused the temp file and the target itself was opened.
+        """
+        sftp = await self._get_sftp()
+        target, attrs = await self._resolve_upload_target_async(file_path)
+        directory, name = posixpath.split(target)
+        tmp_path = posixpath.join(directory, f'.{name}.{uuid.uuid4().hex[:8]}.tmp')
+        try:
+            f = await sftp.open(tmp_path, 'wb')
+        except asyncssh.SFTPPermissionDenied:
+            # Không tạo được file tạm: ghi đè trực tiếp (không nguyên tử)
+            return await sftp.open(target, 'wb'), None, target, attrs
+        return f, tmp_path, target, attrs
+
+    async def _resolve_upload_target_async(self, file_path):
+        sftp = await self._get_sftp()
+        path = file_path
+        for _ in range(MAX_SYMLINK_DEPTH):
+            try:
+                attrs = await sftp.lstat(path)
+            except asyncssh.SFTPNoSuchFile:
+                return path, None
+            if not stat.S_ISLNK(attrs.permissions):
+                return path, attrs
+            path = posixpath.normpath(posixpath.join(posixpath.dirname(path), await sftp.readlink(path)))
+        raise Exception(f"Too many levels of symbolic links: {file_path}")
+
+    async def _finish_upload_async(self, upload):
+        f, tmp_path, target, attrs = upload
+        sftp = await self._get_sftp()
+        if tmp_path is None:
+            await f.close()
+            return
+        try:
+            await f.close()
+            if attrs is not None:
+                await sftp.chmod(tmp_path, stat.S_IMODE(attrs.permissions))
+                if attrs.uid is not None and attrs.gid is not None:
+                    try:
+                        await sftp.chown(tmp_path, attrs.uid, attrs.gid)
+                    except asyncssh.SFTPError:
+                        pass  # Only root (or the owner, for its own groups) may chown
+            await self._replace_async(tmp_path, target, attrs is not None)
+        except Exception:
+            await self._abort_upload_async((None, tmp_path, target, attrs))
+            raise
+
+    async def _replace_async(self, tmp_path, target, exists):
+        """Rename tmp_path over target; see SSHClient._replace"""
+        sftp = await self._get_sftp()
+        try:
+            await sftp.posix_rename(tmp_path, target)
+            return
+        except asyncssh.SFTPOpUnsupported:
+            pass
+
+        if not exists:
+            await sftp.rename(tmp_path, target)
+            return
+
+        backup_path = f'{tmp_path}.old'
+        await sftp.rename(target, backup_path)
+        try:
+            await sftp.rename(tmp_path, target)
+        except Exception:
+            await sftp.rename(backup_path, target)
+            raise
+        try:
+            await sftp.remove(backup_path)
+        except asyncssh.SFTPError as e:
+            print(f"Could not remove {backup_path} on {self.hostname}: {str(e)}")
+
+    async def _abort_upload_async(self, upload):
+        f, tmp_path = upload[0], upload[1]
+        sftp = await self._get_sftp()
+        try:
+            if f is not None:
+                await f.close()
+            if tmp_path is not None:
+                await sftp.remove(tmp_path)
+        except Exception:
+            pass
+
+    async def close_async(self):
+        if self._sftp:
+            self._sftp.exit()
+            self._sftp = None
+        if self.conn:
+            self.conn.close()
+            await self.conn.wait_closed()
+            self._closed = True
+
+    # Synchronous interface, same as SSHClient
+
+    def connect(self):
+        event_loop.run(self.connect_async())
+
+    def execute_command(self, command, timings=None):
+        return event_loop.run(self.execute_command_async(command, timings))
+
+    def execute_command_stream(self, command, chunk_size=4096, timeout=None, timings=None):
+        return event_loop.iterate(self.execute_command_stream_async(command, chunk_size, timings))
+
+    def read_file(self, file_path, max_bytes=None):
+        return event_loop.run(self.read_file_async(file_path, max_bytes))
+
+    def file_size(self, file_path):
+        return event_loop.run(self.file_size_async(file_path))
+
+    def read_file_chunks(self, file_path, offset=0, length=None, chunk_size=32768, window=32):
+        return event_loop.iterate(
+            self.read_file_chunks_async(file_path, offset, length, chunk_size, window), maxsize=window)
+
+    def tail_offset(self, file_path, lines, chunk_size=32768):
+        return event_loop.run(self.tail_offset_async(file_path, lines, chunk_size))
+
+    def edit_file(self, file_path, content, edit_type='modify'):
+        return event_loop.run(self.edit_file_async(file_path, content, edit_type))
+
+    def write_file_chunks(self, file_path, chunks, window=32):
+        """Atomic chunked upload; up to `window` writes are in flight on the loop"""
+        if not self.conn:
+            raise Exception("Not connected")
+        _count_operation()
+
+        try:
+            upload = event_loop.run(self._begin_upload_async(file_path))
+        except Exception as e:
+            raise Exception(f"Failed to edit file: {str(e)}")
+
+        pending = collections.deque()
+        offset = 0
+        try:
+            # The chunk iterator may block (e.g. a request body), so it is
+            # consumed on this thread and only the writes run on the loop
+            for chunk in chunks:
+                if not chunk:
+                    continue
+                pending.append(asyncio.run_coroutine_threadsafe(upload[0].write(chunk, offset), event_loop.loop()))
+                offset += len(chunk)
+                if len(pending) >= window:
+                    pending.popleft().result()
+            while pending:
+                pending.popleft().result()
+        except Exception as e:
+            for future in pending:
+                future.cancel()
+            event_loop.run(self._abort_upload_async(upload))
+            raise Exception(f"Failed to edit file: {str(e)}")
+
+        try:
+            event_loop.run(self._finish_upload_async(upload))
+        except Exception as e:
+            raise Exception(f"Failed to edit file: {str(e)}")
+        return offset
+
+    def set_keepalive(self, interval):
+        # asyncssh takes the keepalive interval as a connect option
+        self.keepalive_interval = interval
+
+    def check_health(self):
+        """Round-trip a keepalive@openssh.com global request to make sure the peer is still there"""
+        if not self.is_alive():
+            return False
+        try:
+            event_loop.run(self._ping_async(), timeout=HEALTH_CHECK_TIMEOUT)
+            return True
+        except Exception:
+            return False
+
+    async def _ping_async(self):
+        # Same request asyncssh's own keepalive sends; any reply (even a refusal) proves liveness
+        await asyncio.wait_for(self.conn._make_global_request(b'keepalive@openssh.com'), HEALTH_CHECK_TIMEOUT)
+
+    def is_alive(self):
+        return self.conn is not None and not self._closed
+
+    def close(self):
+        event_loop.run(self.close_async())
+
+
+def _count_operation():
+    from app.utils.ssh_client import SSHClient
+    SSHClient._count_operation()
+
+
+def _phase_timings_ms(timings):
+    from app.utils.ssh_client import phase_timings_ms
+    return phase_timings_ms(timings)
+
+
+def _count_sftp_open():
+    from app.utils.ssh_client import SSHClient
+    with SSHClient._stats_lock:
+        SSHClient.sftp_stats['opened'] += 1
+
+
+async def _run_on_target(target, command, executor):
+    """Run a command over the session's pooled connection.
+
+    The pool is synchronous (locks, and connect waits on this loop), so
+    checkout and discard run on executor threads; only the command itself
+    runs on the loop.
+    """
+    from app.utils.ssh_pool import ssh_pool
+
+    loop = asyncio.get_running_loop()
+    started = time.monotonic()
+    timings = {}
+    try:
+        client = await loop.run_in_executor(executor, ssh_pool.checkout, target.session_id, target, timings)
+        exit_code, output = await client.execute_command_async(command, timings)
+        status = 'success' if exit_code == 0 else 'failed'
+        error = None
+    except Exception as e:
+        await loop.run_in_executor(executor, lambda: ssh_pool.discard_session(target.session_id, force=False))
+        exit_code, output, status, error = None, None, 'failed', str(e)
+    finally:
+        ssh_pool.release_session(target.session_id)
+
+    return {
+        'device_id': target.device_id,
+        'device_name': target.device_name,
+        'session_id': target.session_id,
+        'status': status,
+        'exit_code': exit_code,
+        'output': output,
+        'error': error,
+        'execution_time': int((time.monotonic() - started) * 1000),
+        'phase_timings': _phase_timings_ms(timings)
+    }
+
+
+def run_many(targets, command, concurrency, collected):
+    """Run a command on many devices from one event loop, yielding results as they finish.
+
+    Connections come from ssh_pool, as with the thread engine. Same contract
+    as fanout.run_fanout: every result is appended to collected, and closing
+    the generator skips the targets that have not started and waits for
+    the running ones, whose results are appended too.
+    """
+    _require_asyncssh()
+    results = queue.Queue()
+    stopping = threading.Event()
+    executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='fanout-checkout')
+
+    async def run_all():
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def run_one(target):
+            async with semaphore:
+                if stopping.is_set():
+                    return
+                results.put(await _run_on_target(target, command, executor))
+
+        await asyncio.gather(*[run_one(target) for target in targets])
+
+    future = asyncio.run_coroutine_threadsafe(run_all(), event_loop.loop())
+    try:
+        while not (future.done() and results.empty()):
+            try:
+                collected.append(results.get(timeout=0.5))
+            except queue.Empty:
+                continue
+            yield collected[-1]
+        future.result()
+    finally:
+        stopping.set()
+        future.result()
+        executor.shutdown(wait=False)
+        while not results.empty():
+            collected.append(results.get_nowait())
@@ -0,0 +1,184 @@
+from datetime import datetime, UTC
+from app.models.session import CommandLog
+from app.utils.ssh_pool import ssh_pool
+from app.utils.ssh_client import phase_timings_ms
+from app.utils.file_edit_detector import detect_file_edits
+from app.utils.log_writer import log_writer
+
+def _read_snapshot(ssh_client, file_path):
+    try:
+        return ssh_client.read_file(file_path)
+    except:
+        return None
+
+def _read_snapshots(ssh_client, file_edits, skip_deleted=False):
+    """Map each edited path to its current content (None if it cannot be read)"""
+    return {
+        edit.path: _read_snapshot(ssh_client, edit.path)
+        for edit in file_edits
+        if not (skip_deleted and edit.edit_type == 'delete')
+    }
+
+def _execution_time_ms(timings):
+    """Wall time of the command itself; connect/auth are already part of checkout"""
+    return int(round(sum(seconds for phase, seconds in timings.items()
+                         if phase not in ('connect', 'auth')) * 1000))
+
+def _save_logs(session, device, user_id, raw_command, exit_code, output,
+               file_edits=(), contents_before=None, contents_after=None, timings=None):
+    """Write the command log (and file edit logs) through the log writer.
+
+    Returns a CommandLog carrying the committed log_id; the row itself is
+    inserted by the writer's batch, not by this request's db.session.
+    """
+    executed_at = datetime.now(UTC)
+    command = {
+        'session_id': session.session_id,
+        'command_text': raw_command,
+        'user_id': user_id,
+        'device_id': device.device_id,
+        'output': output,
+        'status': 'success' if exit_code == 0 else 'failed',
+        'execution_time': _execution_time_ms(timings) if timings else None,
+        'phase_timings': phase_timings_ms(timings) if timings else None,
+        'executed_at': executed_at,
+        'is_approved': True
+    }
+
+    # Nếu là lệnh chỉnh sửa file và thực hiện thành công, lưu mỗi file vào file_edit_logs
+    edits = []
+    if file_edits and exit_code == 0:
+        for edit in file_edits:
+            edits.append({
+                'session_id': session.session_id,
+                'user_id': user_id,
+                'device_id': device.device_id,
+                'file_path': edit.path,
+                'edit_type': edit.edit_type,
+                'content_before': (contents_before or {}).get(edit.path),
+                'content_after': (contents_after or {}).get(edit.path),
+                'diff': None,  # Diff được tạo ở nền bởi diff_worker
+                'edit_started_at': executed_at,
+                'edit_finished_at': executed_at
+            })
+
+    pending = log_writer.submit(command, edits)
+
+    command_log = CommandLog(
+        session_id=command['session_id'],
+        command_text=raw_command,
+        user_id=user_id,
+        device_id=device.device_id,
+        output=command['output'],  # Đã bị cắt bởi log_writer nếu quá dài
+        status=command['status'],
+        execution_time=command['execution_time'],
+        is_approved=True,
+        phase_timings=command['phase_timings']
+    )
+    command_log.log_id = pending.command_log_id
+    command_log.executed_at = executed_at
+    command_log.output_size = command['output_size']
+    command_log.output_chunks = command['output_chunks']
+    return command_log
+
+def run_command(session, device, user_id, raw_command):
+    """Run a command over the session's pooled SSH connection and log it.
+
+    Returns the CommandLog (log_id is None when LOG_WRITER_DURABILITY is
+    async). SSH errors are propagated so callers can
+    map them to a response.
+    """
+    file_edits = detect_file_edits(raw_command)
+
+    # Reuse the connection kept open for this session
+    timings = {}
+    ssh_client = ssh_pool.checkout(session.session_id, device, timings)
+
+    # Nếu là lệnh chỉnh sửa file, lưu nội dung trước khi thực hiện
+    contents_before = _read_snapshots(ssh_client, file_edits)
+
+    # Execute the command
+    exit_code, output = ssh_client.execute_command(raw_command, timings)
+
+    # Nếu là lệnh chỉnh sửa file và thực hiện thành công, lưu nội dung sau khi thực hiện
+    contents_after = None
+    if file_edits and exit_code == 0:
+        contents_after = _read_snapshots(ssh_client, file_edits, skip_deleted=True)
+
+    return _save_logs(session, device, user_id, raw_command, exit_code, output,
+                      file_edits, contents_before, contents_after, timings)
+
+def _stream_output(stdout_parts, stderr_parts, truncated, max_log_bytes, aborted=False):
+    """Combine output and error the same way SSHClient.execute_command does"""
+    output = ''.join(stdout_parts)
+    error = ''.join(stderr_parts)
+    if error:
+        output = f"{output}\n{error}"
+    if truncated:
+        output = f"{output}\n[output truncated after {max_log_bytes} bytes]"
+    if aborted:
+        output = f"{output}\n[stream aborted before the command finished]"
+    return output
+
+def stream_command(session, device, user_id, raw_command, chunk_size=4096, max_log_bytes=1048576):
+    """Run a command and yield its output incrementally.
+
+    Yields ('stdout' | 'stderr', text) tuples as data arrives and finally
+    ('done', CommandLog). At most max_log_bytes (UTF-8) of output are kept
+    for the log. If the consumer stops early (client disconnect) or the
+    stream fails, the output collected so far is still logged, marked as
+    aborted, since the command has already run on the device.
+    """
+    file_edits = detect_file_edits(raw_command)
+
+    timings = {}
+    ssh_client = ssh_pool.checkout(session.session_id, device, timings)
+    contents_before = _read_snapshots(ssh_client, file_edits)
+
+    stdout_parts = []
+    stderr_parts = []
+    logged_bytes = 0
+    truncated = False
+    exit_code = None
+    finished = False
+
+    chunks = ssh_client.execute_command_stream(raw_command, chunk_size=chunk_size, timings=timings)
+    try:
+        for stream, data in chunks:
+            if stream == 'exit':
+                exit_code = data
+                continue
+
+            yield stream, data
+
+            # Only keep a bounded prefix of the output for the CommandLog
+            if logged_bytes < max_log_bytes:
+                encoded = data.encode('utf-8')
+                kept = encoded[:max_log_bytes - logged_bytes]
+                logged_bytes += len(kept)
+                (stdout_parts if stream == 'stdout' else stderr_parts).append(
+                    kept.decode('utf-8', errors='ignore'))
+                truncated = truncated or len(kept) < len(encoded)
+            else:
+                truncated = True
+        finished = True
+    finally:
+        if not finished:
+            chunks.close()
+            # Lệnh đã chạy trên thiết bị: vẫn ghi log khi client ngắt kết nối giữa chừng
+            try:
+                _save_logs(session, device, user_id, raw_command, None,
+                           _stream_output(stdout_parts, stderr_parts, truncated, max_log_bytes, aborted=True),
+                           timings=timings)
+            except Exception as e:
+                print(f"Error saving aborted stream command log: {str(e)}")
+
+    output = _stream_output(stdout_parts, stderr_parts, truncated, max_log_bytes)
+
+    contents_after = None
+    if file_edits and exit_code == 0:
+        contents_after = _read_snapshots(ssh_client, file_edits, skip_deleted=True)
+
+    command_log = _save_logs(session, device, user_id, raw_command, exit_code, output,
+                             file_edits, contents_before, contents_after, timings)
+    yield 'done', command_log
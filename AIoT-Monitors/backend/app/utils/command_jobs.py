@@ -0,0 +1,175 @@
+import paramiko
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, UTC
+
+
+class JobQueueFullError(Exception):
+    pass
+
+
+class JobStatus:
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    COMPLETED = 'completed'
+    FAILED = 'failed'
+
+    @classmethod
+    def all_statuses(cls):
+        return [cls.QUEUED, cls.RUNNING, cls.COMPLETED, cls.FAILED]
+
+
+class CommandJob:
+    def __init__(self, session_id, user_id, command):
+        self.job_id = uuid.uuid4().hex
+        self.session_id = session_id
+        self.user_id = user_id
+        self.command = command
+        self.status = JobStatus.QUEUED
+        self.created_at = datetime.now(UTC)
+        self.started_at = None
+        self.finished_at = None
+        self.result = None
+        self.output = None
+        self.error = None
+        self.command_log_id = None
+
+    def is_finished(self):
+        return self.status in (JobStatus.COMPLETED, JobStatus.FAILED)
+
+    def to_dict(self, include_output=False):
+        result = {
+            'id': self.job_id,
+            'session_id': self.session_id,
+            'user_id': self.user_id,
+            'command': self.command,
+            'status': self.status,
+            'created_at': self.created_at.isoformat(),
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'result': self.result,
+            'error': self.error,
+            'command_log_id': self.command_log_id
+        }
+        if include_output:
+            result['output'] = self.output
+        return result
+
+
+class CommandJobManager:
+    """Runs session commands on a bounded worker pool.
+
+    Requests submit a job and return immediately; the worker executes the
+    command over the pooled SSH connection and writes the CommandLog when
+    it completes. Finished jobs are kept in memory for JOB_RESULT_TTL seconds
+    so clients can poll for the result.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.max_workers = 8
+        self.max_pending = 100
+        self.result_ttl = 3600
+        self._jobs = {}
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._executor = None
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.max_workers = app.config.get('JOB_MAX_WORKERS', self.max_workers)
+        self.max_pending = app.config.get('JOB_MAX_PENDING', self.max_pending)
+        self.result_ttl = app.config.get('JOB_RESULT_TTL', self.result_ttl)
+        app.extensions['command_jobs'] = self
+
+    def submit(self, session_id, user_id, command):
+        """Queue a command for a session and return the new job"""
+        job = CommandJob(session_id, user_id, command)
+
+        with self._lock:
+            self._prune()
+            if self._pending >= self.max_pending:
+                raise JobQueueFullError('Too many pending command jobs')
+            self._pending += 1
+            self._jobs[job.job_id] = job
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix='command-job')
+
+        self._executor.submit(self._run, job)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def get_session_jobs(self, session_id):
+        with self._lock:
+            jobs = [job for job in self._jobs.values() if job.session_id == session_id]
+        return sorted(jobs, key=lambda job: job.created_at)
+
+    def get_stats(self):
+        with self._lock:
+            counts = {status: 0 for status in JobStatus.all_statuses()}
+            for job in self._jobs.values():
+                counts[job.status] += 1
+            return dict(counts, pending=self._pending, max_pending=self.max_pending,
+                        max_workers=self.max_workers)
+
+    def _run(self, job):
+        from app import db
+        from app.models.session import Session, SessionStatus
+        from app.models.device import Device
+        from app.utils.command_executor import run_command
+        from app.utils.ssh_pool import ssh_pool
+
+        job.status = JobStatus.RUNNING
+        job.started_at = datetime.now(UTC)
+
+        with self.app.app_context():
+            try:
+                session = Session.query.get(job.session_id)
+                # Phiên có thể đã kết thúc khi job còn trong hàng đợi
+                if session is None or session.status != SessionStatus.ACTIVE:
+                    job.error = 'Session is not active'
+                    job.status = JobStatus.FAILED
+                    return
+                device = Device.query.get(session.device_id)
+                command_log = run_command(session, device, job.user_id, job.command)
+
+                job.command_log_id = command_log.log_id
+                job.output = command_log.output
+                job.result = command_log.status  # 'success' | 'failed', as in the CommandLog
+                job.status = JobStatus.COMPLETED
+            except paramiko.AuthenticationException:
+                job.error = 'Authentication failed'
+                job.status = JobStatus.FAILED
+            except Exception as e:
+                print(f"Error running job {job.job_id} for session {job.session_id}: {str(e)}")
+                db.session.rollback()
+                ssh_pool.discard_session(job.session_id, force=isinstance(e, paramiko.SSHException))
+                job.error = str(e)
+                job.status = JobStatus.FAILED
+            finally:
+                job.finished_at = datetime.now(UTC)
+                with self._lock:
+                    self._pending -= 1
+                db.session.remove()
+
+    def _prune(self):
+        now = time.time()
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.is_finished() and job.finished_at
+            and now - job.finished_at.timestamp() > self.result_ttl
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+
+command_jobs = CommandJobManager()
@@ -0,0 +1,58 @@
+import re
+
+# {name} in a command text stands for one argument. Shell metacharacters and
+# quotes are excluded so a template cannot be stretched into a second command.
+PLACEHOLDER_RE = re.compile(r'\{[A-Za-z_][A-Za-z0-9_]*\}')
+ARGUMENT_PATTERN = r'[^\s;&|`$<>()\\\'"]+'
+
+
+class CommandMatcher:
+    """Compiled form of a set of allowed command texts.
+
+    Plain commands go into a hash set. Templates (commands containing
+    {placeholders}) are grouped by their first word and each group is
+    compiled into one anchored alternation, so a lookup is a set probe
+    plus at most two regex matches.
+    """
+
+    def __init__(self, command_texts):
+        self.exact = set()
+        templates = {}
+        for text in command_texts:
+            text = text.strip()
+            if not PLACEHOLDER_RE.search(text):
+                self.exact.add(text)
+                continue
+            first_word = text.split(None, 1)[0]
+            key = None if PLACEHOLDER_RE.search(first_word) else first_word
+            templates.setdefault(key, []).append(_template_pattern(text))
+
+        self.exact = frozenset(self.exact)
+        self.templates = {
+            key: re.compile('(?:' + '|'.join(patterns) + r')\Z')
+            for key, patterns in templates.items()
+        }
+
+    def matches(self, command):
+        command = command.strip()
+        if command in self.exact:
+            return True
+        if not self.templates or not command:
+            return False
+
+        pattern = self.templates.get(command.split(None, 1)[0])
+        if pattern is not None and pattern.match(command):
+            return True
+        pattern = self.templates.get(None)
+        return pattern is not None and pattern.match(command) is not None
+
+
+def _template_pattern(text):
+    parts = []
+    position = 0
+    for placeholder in PLACEHOLDER_RE.finditer(text):
+        parts.append(re.escape(text[position:placeholder.start()]))
+        parts.append(ARGUMENT_PATTERN)
+        position = placeholder.end()
+    parts.append(re.escape(text[position:]))
+    return ''.join(parts)
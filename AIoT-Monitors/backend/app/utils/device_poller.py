@@ -0,0 +1,189 @@
+import asyncio
+import threading
+import time
+from datetime import datetime, UTC
+from sqlalchemy import or_, text
+
+
+class DevicePoller:
+    """Periodically probes every active device and records its reachability.
+
+    A sweep opens TCP connections to all devices concurrently from one event
+    loop (bounded by DEVICE_POLL_CONCURRENCY), optionally waits for the SSH
+    banner, and writes the results with one UPDATE per status. A sweep
+    holds a PostgreSQL advisory lock, so when every backend worker runs the
+    poller only one of them sweeps at a time and the others skip the round.
+    """
+
+    # Chunk size for the IN (...) lists of the batched UPDATEs
+    UPDATE_BATCH_SIZE = 1000
+    # pg_try_advisory_lock key shared by every worker ('AIoT')
+    ADVISORY_LOCK_KEY = 0x41496F54
+
+    def __init__(self, app=None):
+        self.app = None
+        self.interval = 60
+        self.timeout = 3.0
+        self.concurrency = 1000
+        self.check_banner = True
+        self.last_sweep = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._sweep_lock = threading.Lock()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.interval = app.config.get('DEVICE_POLL_INTERVAL', self.interval)
+        self.timeout = app.config.get('DEVICE_POLL_TIMEOUT', self.timeout)
+        self.concurrency = app.config.get('DEVICE_POLL_CONCURRENCY', self.concurrency)
+        self.check_banner = app.config.get('DEVICE_POLL_CHECK_BANNER', self.check_banner)
+        app.extensions['device_poller'] = self
+
+        if app.config.get('DEVICE_POLL_ENABLED'):
+            self.start()
+
+    def start(self):
+        if self.is_running():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name='device-poller', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"Error during device health sweep: {str(e)}")
+            self._stop.wait(self.interval)
+
+    def sweep(self):
+        """Probe all active devices once and persist their status.
+
+        Returns None without probing if another worker is already sweeping.
+        """
+        from app import db
+
+        with self._sweep_lock, self.app.app_context():
+            # Khóa giữ trên một kết nối riêng suốt lượt quét, không qua db.session
+            with db.engine.connect() as lock_conn:
+                locked = lock_conn.execute(
+                    text("SELECT pg_try_advisory_lock(:key)"), {'key': self.ADVISORY_LOCK_KEY}
+                ).scalar()
+                lock_conn.commit()
+                if not locked:
+                    return None
+                try:
+                    return self._sweep()
+                finally:
+                    try:
+                        lock_conn.execute(text("SELECT pg_advisory_unlock(:key)"), {'key': self.ADVISORY_LOCK_KEY})
+                        lock_conn.commit()
+                    except Exception as e:
+                        # Đóng hẳn kết nối để Postgres nhả khóa, thay vì trả nó về pool
+                        print(f"Error releasing the device poll lock: {str(e)}")
+                        lock_conn.invalidate()
+
+    def _sweep(self):
+        from app import db
+        from app.models.device import Device, DeviceStatus
+
+        started = time.monotonic()
+        targets = db.session.query(
+            Device.device_id, Device.ip_address, Device.ssh_port, Device.status
+        ).filter(
+            Device.is_active == True,
+            or_(Device.status.is_(None), Device.status != DeviceStatus.MAINTENANCE)
+        ).all()
+        db.session.commit()
+
+        results = self.probe([(ip_address, ssh_port) for _, ip_address, ssh_port, _ in targets])
+        changed = sum(
+            1 for (_, _, _, old_status), online in zip(targets, results)
+            if old_status != (DeviceStatus.ONLINE if online else DeviceStatus.OFFLINE)
+        )
+        by_status = self.write_status(
+            [(device_id, online) for (device_id, _, _, _), online in zip(targets, results)])
+        db.session.remove()
+
+        self.last_sweep = {
+            'checked_at': datetime.now(UTC).isoformat(),
+            'devices': len(targets),
+            'online': len(by_status[DeviceStatus.ONLINE]),
+            'offline': len(by_status[DeviceStatus.OFFLINE]),
+            'changed': changed,
+            'duration_ms': int((time.monotonic() - started) * 1000)
+        }
+        return self.last_sweep
+
+    def probe(self, targets):
+        """Probe (host, port) pairs concurrently; returns one bool per target"""
+        if not targets:
+            return []
+        return asyncio.run(self._probe_all(targets))
+
+    def write_status(self, results, commit=True):
+        """Write (device_id, online) results with one UPDATE per status.
+
+        Devices in MAINTENANCE are left alone, including ones an operator
+        switched to it while the probes were running.
+        """
+        from app import db
+        from app.models.device import Device, DeviceStatus
+
+        by_status = {DeviceStatus.ONLINE: [], DeviceStatus.OFFLINE: []}
+        for device_id, online in results:
+            by_status[DeviceStatus.ONLINE if online else DeviceStatus.OFFLINE].append(device_id)
+
+        checked_at = datetime.now(UTC)
+        for status, device_ids in by_status.items():
+            for i in range(0, len(device_ids), self.UPDATE_BATCH_SIZE):
+                chunk = device_ids[i:i + self.UPDATE_BATCH_SIZE]
+                db.session.query(Device).filter(
+                    Device.device_id.in_(chunk),
+                    or_(Device.status.is_(None), Device.status != DeviceStatus.MAINTENANCE)
+                ).update(
+                    {'status': status, 'last_checked_at': checked_at},
+                    synchronize_session=False
+                )
+        if commit:
+            db.session.commit()
+        return by_status
+
+    async def _probe_all(self, targets):
+        semaphore = asyncio.Semaphore(self.concurrency)
+        return await asyncio.gather(*[
+            self._probe(semaphore, host, port or 22) for host, port in targets
+        ])
+
+    async def _probe(self, semaphore, host, port):
+        async with semaphore:
+            writer = None
+            try:
+                reader, writer = await asyncio.wait_for(
+                    asyncio.open_connection(host, port), self.timeout)
+                if self.check_banner:
+                    banner = await asyncio.wait_for(reader.readline(), self.timeout)
+                    return banner.startswith(b'SSH-')
+                return True
+            except Exception:
+                return False
+            finally:
+                if writer is not None:
+                    writer.close()
+                    try:
+                        await writer.wait_closed()
+                    except Exception:
+                        pass
+
+
+device_poller = DevicePoller()
@@ -0,0 +1,136 @@
+import difflib
+import queue
+import threading
+
+
+def unified_diff(before, after, file_path, max_input_bytes=1048576, max_diff_bytes=65536):
+    """Unified diff between two snapshots, built line by line under size caps.
+
+    Files larger than max_input_bytes are not diffed at all (difflib is
+    quadratic in the worst case); the diff output stops at max_diff_bytes.
+    """
+    before = before or ''
+    after = after or ''
+    if len(before) > max_input_bytes or len(after) > max_input_bytes:
+        return f"[diff skipped: file larger than {max_input_bytes} bytes]"
+
+    lines = difflib.unified_diff(
+        before.splitlines(keepends=True),
+        after.splitlines(keepends=True),
+        fromfile=f'a{file_path}' if file_path.startswith('/') else f'a/{file_path}',
+        tofile=f'b{file_path}' if file_path.startswith('/') else f'b/{file_path}'
+    )
+
+    parts = []
+    size = 0
+    for line in lines:
+        if not line.endswith('\n'):
+            line += '\n\\ No newline at end of file\n'
+        if size + len(line) > max_diff_bytes:
+            parts.append(f"[diff truncated after {max_diff_bytes} bytes]\n")
+            break
+        parts.append(line)
+        size += len(line)
+    return ''.join(parts)
+
+
+class DiffWorker:
+    """Computes FileEditLog.diff in a background thread.
+
+    The request that logs a file edit only enqueues the log id; the worker
+    loads both snapshots, builds the unified diff and stores it with an
+    UPDATE, so the request never pays for difflib on large files.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.max_input_bytes = 1048576
+        self.max_diff_bytes = 65536
+        self._queue = queue.Queue(1000)
+        self._thread = None
+        self._lock = threading.Lock()
+        self.stats = {
+            'queued': 0,
+            'computed': 0,
+            'skipped': 0,
+            'dropped': 0,
+            'failed': 0
+        }
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.max_input_bytes = app.config.get('DIFF_MAX_INPUT_BYTES', self.max_input_bytes)
+        self.max_diff_bytes = app.config.get('DIFF_MAX_BYTES', self.max_diff_bytes)
+        self._queue = queue.Queue(app.config.get('DIFF_QUEUE_SIZE', 1000))
+        app.extensions['diff_worker'] = self
+
+    def enqueue(self, log_ids):
+        """Schedule diffs for committed FileEditLog rows"""
+        self._start()
+        for log_id in log_ids:
+            try:
+                self._queue.put_nowait(log_id)
+                self._count('queued')
+            except queue.Full:
+                # The row keeps diff=NULL; the snapshots are still available
+                self._count('dropped')
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self.stats, backlog=self._queue.qsize())
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, name='diff-worker', daemon=True)
+                self._thread.start()
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def _loop(self):
+        while True:
+            log_id = self._queue.get()
+            try:
+                self._compute(log_id)
+            except Exception as e:
+                self._count('failed')
+                print(f"Error computing diff for file edit {log_id}: {str(e)}")
+            finally:
+                self._queue.task_done()
+
+    def _compute(self, log_id):
+        from app import db
+        from app.models.file_edit_log import FileEditLog
+
+        with self.app.app_context():
+            try:
+                file_edit = FileEditLog.query.get(log_id)
+                if file_edit is None:
+                    return
+
+                before = file_edit.get_content_before()
+                after = file_edit.get_content_after()
+                if before is None and after is None:
+                    self._count('skipped')
+                    return
+
+                diff = unified_diff(before, after, file_edit.file_path,
+                                    self.max_input_bytes, self.max_diff_bytes)
+                db.session.query(FileEditLog).filter(FileEditLog.log_id == log_id).update(
+                    {'diff': diff}, synchronize_session=False
+                )
+                db.session.commit()
+                self._count('computed')
+            except Exception:
+                db.session.rollback()
+                raise
+            finally:
+                db.session.remove()
+
+
+diff_worker = DiffWorker()
@@ -0,0 +1,84 @@
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from app.utils.ssh_pool import ssh_pool
+from app.utils.ssh_client import phase_timings_ms
+
+# Plain copy of the Device fields needed to connect, safe to hand to worker threads
+DeviceTarget = namedtuple('DeviceTarget', [
+    'device_id', 'device_name', 'ip_address', 'ssh_port',
+    'username', 'password', 'authentication_method', 'session_id'
+])
+
+def make_target(device, session_id):
+    return DeviceTarget(
+        device_id=device.device_id,
+        device_name=device.device_name,
+        ip_address=device.ip_address,
+        ssh_port=device.ssh_port,
+        username=device.username,
+        password=device.password,
+        authentication_method=device.authentication_method,
+        session_id=session_id
+    )
+
+def _run_on_target(target, command):
+    started = time.monotonic()
+    timings = {}
+    try:
+        ssh_client = ssh_pool.checkout(target.session_id, target, timings)
+        exit_code, output = ssh_client.execute_command(command, timings)
+        status = 'success' if exit_code == 0 else 'failed'
+        error = None
+    except Exception as e:
+        ssh_pool.discard_session(target.session_id, force=False)
+        exit_code, output, status, error = None, None, 'failed', str(e)
+    finally:
+        ssh_pool.release_session(target.session_id)
+
+    return {
+        'device_id': target.device_id,
+        'device_name': target.device_name,
+        'session_id': target.session_id,
+        'status': status,
+        'exit_code': exit_code,
+        'output': output,
+        'error': error,
+        'execution_time': int((time.monotonic() - started) * 1000),
+        'phase_timings': phase_timings_ms(timings)
+    }
+
+def run_fanout(targets, command, concurrency, collected=None):
+    """Run one command on many devices, yielding each result as it finishes.
+
+    Every result of a command that actually ran is appended to collected,
+    including those still in flight when the generator is closed early
+    (client disconnect): closing cancels the targets that have not started
+    and waits for the running ones, so the caller can log all of them.
+    """
+    if collected is None:
+        collected = []
+    if not targets:
+        return
+
+    # The asyncio engine drives every device from one event loop instead of a thread each
+    if ssh_pool.engine == 'asyncssh':
+        from app.utils.async_ssh_client import run_many
+        yield from run_many(targets, command, concurrency, collected)
+        return
+
+    executor = ThreadPoolExecutor(max_workers=min(concurrency, len(targets)),
+                                  thread_name_prefix='fanout')
+    futures = [executor.submit(_run_on_target, target, command) for target in targets]
+    reported = set()
+    try:
+        for future in as_completed(futures):
+            reported.add(future)
+            collected.append(future.result())
+            yield collected[-1]
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+        # Lệnh đang chạy dở khi client ngắt kết nối: vẫn thu kết quả để ghi log
+        for future in futures:
+            if future not in reported and not future.cancelled():
+                collected.append(future.result())
@@ -0,0 +1,226 @@
+import re
+from collections import namedtuple
+
+FileEdit = namedtuple('FileEdit', ['edit_type', 'path'])
+
+# Control operators end a simple command; redirections apply to the current one
+CONTROL_OPERATORS = frozenset(['|', '||', '|&', '&', '&&', ';', ';;', '\n'])
+
+# One alternation scanned left to right; a word is a run of adjacent
+# bare/quoted/escaped pieces
+TOKEN_RE = re.compile(r"""
+    (?P<space>[^\S\n]+)
+  | (?P<op>&>>|<<<|<<-|>>|>\||&>|>&|<&|<<|<>|&&|\|\||\|&|;;|[<>|&;\n])
+  | (?P<hash>\#)
+  | (?P<single>'[^']*'?)
+  | (?P<double>"(?:[^"\\]|\\.)*"?)
+  | (?P<escape>\\.?)
+  | (?P<bare>[^\s'"\\|&;<>#][^\s'"\\|&;<>]*)
+""", re.VERBOSE | re.DOTALL)
+DOUBLE_QUOTE_ESCAPE_RE = re.compile(r'\\([\\"$`])')
+EXPANSION_RE = re.compile(r'[$`*?\[]')
+
+# Commands that cannot touch a file skip tokenizing altogether
+CANDIDATE_RE = re.compile(r'[<>]|\b(?:touch|mkdir|rm|rmdir|unlink|tee|truncate|sed|cp|mv|dd)\b')
+
+# Redirection operator -> edit type of its target (None: the target is only read)
+REDIRECTIONS = {
+    '>': 'create', '>|': 'create', '&>': 'create', '>&': 'create',
+    '>>': 'modify', '&>>': 'modify',
+    '<': None, '<<': None, '<<-': None, '<<<': None, '<&': None, '<>': None,
+}
+
+IGNORED_TARGETS = frozenset(['/dev/null', '/dev/stdout', '/dev/stderr', '/dev/tty'])
+ASSIGNMENT_RE = re.compile(r'[A-Za-z_][A-Za-z0-9_]*=')
+
+# Prefixes that run the command that follows them, with their options taking a value
+WRAPPERS = {
+    'sudo': frozenset(['-u', '-g', '-h', '-p', '-C', '-U']),
+    'nohup': frozenset(),
+    'env': frozenset(['-u']),
+    'command': frozenset(),
+    'time': frozenset(),
+    'nice': frozenset(['-n']),
+}
+
+# Options that consume the next argument, per command
+OPTION_ARGS = {
+    'touch': frozenset(['-d', '-t', '-r']),
+    'mkdir': frozenset(['-m']),
+    'truncate': frozenset(['-s', '-r']),
+    'sed': frozenset(['-e', '-f', '-l']),
+    'cp': frozenset(['-S']),
+    'mv': frozenset(['-S']),
+}
+
+
+def detect_file_edits(raw_command):
+    """Return the FileEdits a shell command makes, in order of appearance.
+
+    The command is tokenized and classified in one pass: a single
+    precompiled pattern resolves quotes, escapes and operators while
+    scanning, and each simple command is classified as soon as a control
+    operator (|, ;, &&, ...) ends it.
+    Targets that depend on shell expansion ($VAR, globs) are skipped
+    because their path cannot be known before the command runs.
+    """
+    edits = []
+    if not CANDIDATE_RE.search(raw_command):
+        return edits
+
+    seen = set()
+    argv = []
+    redirect = False
+
+    for kind, value, literal in _tokens(raw_command):
+        if kind == 'word':
+            if redirect is not False:
+                # Redirection target: '>&2' duplicates a descriptor instead of naming a file
+                if redirect and literal and not (value.isdigit() or value == '-'):
+                    _add(edits, seen, redirect, value)
+                redirect = False
+            else:
+                argv.append((value, literal))
+        elif value in CONTROL_OPERATORS:
+            _classify(argv, edits, seen)
+            argv = []
+            redirect = False
+        else:
+            redirect = REDIRECTIONS.get(value)
+
+    _classify(argv, edits, seen)
+    return edits
+
+
+def _tokens(command):
+    """Yield ('word', text, literal) and ('op', operator, True) tokens.
+
+    literal is False when the word contains unquoted or double-quoted
+    expansions, i.e. its final value depends on the shell.
+    """
+    pieces = []
+    literal = True
+
+    for match in TOKEN_RE.finditer(command):
+        kind = match.lastgroup
+        text = match.group()
+
+        if kind == 'bare':
+            if EXPANSION_RE.search(text) or (not pieces and text[0] == '~'):
+                literal = False
+            pieces.append(text)
+        elif kind == 'single':
+            pieces.append(text[1:-1] if text.endswith("'") and len(text) > 1 else text[1:])
+        elif kind == 'double':
+            inner = text[1:-1] if text.endswith('"') and len(text) > 1 else text[1:]
+            if '$' in inner or '`' in inner:
+                literal = False
+            pieces.append(DOUBLE_QUOTE_ESCAPE_RE.sub(r'\1', inner) if '\\' in inner else inner)
+        elif kind == 'escape':
+            if text != '\\\n':
+                pieces.append(text[1:])
+        elif kind == 'hash':
+            if not pieces:
+                break
+            pieces.append(text)
+        else:
+            if pieces:
+                word = ''.join(pieces)
+                # '2>' and '1>>': a descriptor number right before a redirection is not a word
+                if not (kind == 'op' and text[0] in '<>' and word.isdigit()):
+                    yield 'word', word, literal
+                pieces = []
+                literal = True
+            if kind == 'op':
+                yield 'op', text, True
+
+    if pieces:
+        yield 'word', ''.join(pieces), literal
+
+
+def _add(edits, seen, edit_type, path):
+    if path in IGNORED_TARGETS or path in seen:
+        return
+    seen.add(path)
+    edits.append(FileEdit(edit_type, path))
+
+
+def _classify(argv, edits, seen):
+    """Record the files a simple command (argv of (text, literal)) touches"""
+    # Skip variable assignments and wrappers such as sudo/nohup
+    start = 0
+    while start < len(argv):
+        text = argv[start][0]
+        if ASSIGNMENT_RE.match(text):
+            start += 1
+        elif text in WRAPPERS:
+            takes_value = WRAPPERS[text]
+            start += 1
+            while start < len(argv) and argv[start][0].startswith('-'):
+                start += 2 if argv[start][0] in takes_value else 1
+        else:
+            break
+    if start >= len(argv):
+        return
+
+    name = argv[start][0].rsplit('/', 1)[-1]
+    args = argv[start + 1:]
+
+    if name == 'dd':
+        for text, literal in args:
+            if text.startswith('of=') and literal:
+                _add(edits, seen, 'create', text[3:])
+        return
+
+    options, operands = _split_options(args, OPTION_ARGS.get(name, ()))
+
+    if name in ('touch', 'mkdir'):
+        edit_type, targets = 'create', operands
+    elif name in ('rm', 'rmdir', 'unlink'):
+        edit_type, targets = 'delete', operands
+    elif name == 'tee':
+        append = any(opt in ('-a', '--append') or (not opt.startswith('--') and 'a' in opt)
+                     for opt, _ in options)
+        edit_type, targets = ('modify' if append else 'create'), operands
+    elif name == 'truncate':
+        edit_type, targets = 'modify', operands
+    elif name == 'sed':
+        if not any(opt.startswith('-i') or opt.startswith('--in-place') for opt, _ in options):
+            return
+        # Without -e/-f the first operand is the script
+        has_script = any(opt in ('-e', '-f') for opt, _ in options)
+        edit_type, targets = 'modify', (operands if has_script else operands[1:])
+    elif name in ('cp', 'mv') and len(operands) >= 2:
+        if name == 'mv':
+            for text, literal in operands[:-1]:
+                if literal:
+                    _add(edits, seen, 'delete', text)
+        edit_type, targets = 'create', operands[-1:]
+    else:
+        return
+
+    for text, literal in targets:
+        if literal:
+            _add(edits, seen, edit_type, text)
+
+
+def _split_options(args, takes_value):
+    """Split arguments into (option, value) pairs and operands"""
+    options = []
+    operands = []
+    i = 0
+    while i < len(args):
+        text, literal = args[i]
+        if text == '--':
+            operands.extend(args[i + 1:])
+            break
+        if text.startswith('-') and len(text) > 1:
+            if text in takes_value and i + 1 < len(args):
+                options.append((text, args[i + 1][0]))
+                i += 2
+                continue
+            options.append((text, None))
+        else:
+            operands.append((text, literal))
+        i += 1
+    return options, operands
@@ -0,0 +1,319 @@
+import atexit
+import queue
+import threading
+import time
+
+
+class LogWriteError(Exception):
+    """Raised to a sync caller whose log rows could not be committed"""
+    pass
+
+
+class PendingLog:
+    """One CommandLog row (plus its FileEditLog rows) waiting to be written"""
+
+    __slots__ = ('command', 'file_edits', 'output_chunks', 'command_log_id', 'file_edit_ids', 'error', '_done')
+
+    def __init__(self, command, file_edits=(), output_chunks=()):
+        self.command = command
+        self.file_edits = list(file_edits)
+        self.output_chunks = list(output_chunks)
+        self.command_log_id = None
+        self.file_edit_ids = []
+        self.error = None
+        self._done = threading.Event()
+
+    def wait(self, timeout=None):
+        """Block until the rows are committed and return the CommandLog id"""
+        if not self._done.wait(timeout):
+            raise LogWriteError('Timed out waiting for the command log to be written')
+        if self.error is not None:
+            raise LogWriteError(self.error)
+        return self.command_log_id
+
+    def _finish(self, error=None):
+        self.error = error
+        self._done.set()
+
+
+class LogWriter:
+    """Group-commits CommandLog and FileEditLog rows from a background thread.
+
+    Requests put their rows on a bounded queue; the flusher drains up to
+    batch_size rows (or whatever arrived within flush_interval), stores the
+    file snapshots and writes each table with one multi-row INSERT ...
+    RETURNING, then commits once for the whole batch.
+
+    Durability per call:
+      sync  - the caller waits for the commit and gets the row ids back
+              (interactive commands, whose response includes the log id)
+      async - the caller returns as soon as the rows are queued
+              (batch fan-out, where nobody reads the ids)
+
+    When the queue is full the caller blocks for up to put_timeout, then
+    writes its rows itself, so logs are never dropped; both cases are
+    counted in the stats.
+
+    Outputs longer than output_inline_limit are cut before queueing: the
+    row keeps a prefix and the full text goes to command_output_chunks.
+    """
+
+    DURABILITY_MODES = ('sync', 'async')
+
+    def __init__(self, app=None):
+        self.app = None
+        self.enabled = True
+        self.batch_size = 200
+        self.flush_interval = 0.02
+        self.put_timeout = 5.0
+        self.sync_timeout = 30.0
+        self.durability = 'sync'
+        self.bulk_durability = 'async'
+        self.output_inline_limit = 65536
+        self.output_chunk_size = 262144
+        self._queue = queue.Queue(10000)
+        self._thread = None
+        self._lock = threading.Lock()
+        self.stats = {
+            'submitted': 0,
+            'written': 0,
+            'file_edits_written': 0,
+            'batches': 0,
+            'failed': 0,
+            'blocked': 0,
+            'blocked_seconds': 0.0,
+            'inline_writes': 0,
+            'outputs_spilled': 0,
+            'max_batch_size': 0,
+            'max_queue_depth': 0,
+            'last_flush_ms': None
+        }
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.enabled = app.config.get('LOG_WRITER_ENABLED', self.enabled)
+        self.batch_size = app.config.get('LOG_WRITER_BATCH_SIZE', self.batch_size)
+        self.flush_interval = app.config.get('LOG_WRITER_FLUSH_INTERVAL', self.flush_interval)
+        self.put_timeout = app.config.get('LOG_WRITER_PUT_TIMEOUT', self.put_timeout)
+        self.sync_timeout = app.config.get('LOG_WRITER_SYNC_TIMEOUT', self.sync_timeout)
+        self.durability = app.config.get('LOG_WRITER_DURABILITY', self.durability)
+        self.bulk_durability = app.config.get('LOG_WRITER_BULK_DURABILITY', self.bulk_durability)
+        self.output_inline_limit = app.config.get('COMMAND_OUTPUT_INLINE_LIMIT', self.output_inline_limit)
+        self.output_chunk_size = app.config.get('COMMAND_OUTPUT_CHUNK_SIZE', self.output_chunk_size)
+        self._queue = queue.Queue(app.config.get('LOG_WRITER_QUEUE_SIZE', 10000))
+        app.extensions['log_writer'] = self
+
+    def submit(self, command, file_edits=(), durability=None):
+        """Queue one command_logs row and its file_edit_logs rows.
+
+        command and each file edit are column dicts; file edits carry the raw
+        content_before/content_after, which are stored as snapshots by the
+        flusher. The command's output is capped in place (see _spill_output).
+        Returns the PendingLog, already committed for sync durability.
+        """
+        return self.submit_many([(command, file_edits)], durability)[0]
+
+    def submit_many(self, items, durability=None):
+        """Queue (command, file_edits) pairs; see submit()"""
+        durability = durability or self.durability
+        if durability not in self.DURABILITY_MODES:
+            raise ValueError(f"Unknown durability mode: {durability}")
+
+        entries = [PendingLog(command, file_edits, self._spill_output(command))
+                   for command, file_edits in items]
+        self._count('submitted', len(entries))
+
+        if not self.enabled:
+            self._write_inline(entries)
+            return entries
+
+        self._start()
+        inline = []
+        for entry in entries:
+            if not self._put(entry):
+                inline.append(entry)
+        if inline:
+            self._write_inline(inline)
+
+        if durability == 'sync':
+            for entry in entries:
+                entry.wait(self.sync_timeout)
+        return entries
+
+    def flush(self, timeout=None):
+        """Wait until everything queued so far has been written"""
+        if self._thread is None or not self._thread.is_alive():
+            return True
+        marker = threading.Event()
+        self._queue.put(marker)
+        return marker.wait(timeout)
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+        stats['queue_depth'] = self._queue.qsize()
+        stats['queue_capacity'] = self._queue.maxsize
+        stats['avg_batch_size'] = round(stats['written'] / stats['batches'], 2) if stats['batches'] else 0
+        stats['blocked_seconds'] = round(stats['blocked_seconds'], 3)
+        return stats
+
+    def _spill_output(self, command):
+        """Cap command['output'] and return the compressed chunks of the full text"""
+        from app.models.command_output import CommandOutputChunk
+
+        output = command.get('output')
+        inline, chunks = CommandOutputChunk.split(output, self.output_inline_limit, self.output_chunk_size)
+        command['output'] = inline
+        command['output_size'] = len(output) if output is not None else None
+        command['output_chunks'] = len(chunks)
+        if chunks:
+            self._count('outputs_spilled')
+        return chunks
+
+    def _put(self, entry):
+        """Queue an entry, blocking while the queue is full; False if it stayed full"""
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            started = time.monotonic()
+            try:
+                self._queue.put(entry, timeout=self.put_timeout)
+            except queue.Full:
+                return False
+            finally:
+                self._count('blocked')
+                self._count('blocked_seconds', time.monotonic() - started)
+
+        depth = self._queue.qsize()
+        with self._lock:
+            if depth > self.stats['max_queue_depth']:
+                self.stats['max_queue_depth'] = depth
+        return True
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, name='log-writer', daemon=True)
+                self._thread.start()
+                atexit.register(self.flush, self.sync_timeout)
+
+    def _count(self, key, amount=1):
+        with self._lock:
+            self.stats[key] += amount
+
+    def _loop(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+
+            # Gom thêm bản ghi cho đến khi đủ batch_size hoặc hết flush_interval
+            while len(batch) < self.batch_size and not isinstance(batch[-1], threading.Event):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            entries = [item for item in batch if isinstance(item, PendingLog)]
+            if entries:
+                self._write_batch(entries)
+            for item in batch:
+                if isinstance(item, threading.Event):
+                    item.set()
+
+    def _write_inline(self, entries):
+        """Write entries from the calling thread (writer disabled or queue full)"""
+        self._count('inline_writes', len(entries))
+        self._write_batch(entries)
+
+    def _write_batch(self, entries):
+        started = time.monotonic()
+        try:
+            self._write(entries)
+        except Exception as e:
+            if len(entries) > 1:
+                # One bad row (e.g. a deleted session) must not lose the whole batch
+                for entry in entries:
+                    self._write_batch([entry])
+                return
+            self._count('failed')
+            print(f"Error writing command log: {str(e)}")
+            entries[0]._finish(str(e))
+            return
+
+        elapsed_ms = round((time.monotonic() - started) * 1000, 2)
+        with self._lock:
+            self.stats['batches'] += 1
+            self.stats['written'] += len(entries)
+            self.stats['file_edits_written'] += sum(len(entry.file_edit_ids) for entry in entries)
+            self.stats['max_batch_size'] = max(self.stats['max_batch_size'], len(entries))
+            self.stats['last_flush_ms'] = elapsed_ms
+
+        for entry in entries:
+            entry._finish()
+
+        file_edit_ids = [log_id for entry in entries for log_id in entry.file_edit_ids]
+        if file_edit_ids:
+            from app.utils.diff_worker import diff_worker
+            diff_worker.enqueue(file_edit_ids)
+
+    def _write(self, entries):
+        from app import db
+        from app.models.session import CommandLog
+        from app.models.file_edit_log import FileEditLog
+        from app.models.file_snapshot import FileSnapshot
+        from app.models.command_output import CommandOutputChunk
+
+        with self.app.app_context():
+            try:
+                # Snapshots first: file_edit_logs reference them by hash
+                edit_rows = []
+                owners = []
+                for entry in entries:
+                    for edit in entry.file_edits:
+                        row = dict(edit)
+                        row['content_before_hash'] = FileSnapshot.store(row.pop('content_before', None))
+                        row['content_after_hash'] = FileSnapshot.store(row.pop('content_after', None))
+                        edit_rows.append(row)
+                        owners.append(entry)
+
+                command_ids = db.session.execute(
+                    db.insert(CommandLog).returning(CommandLog.log_id, sort_by_parameter_order=True),
+                    [entry.command for entry in entries]
+                ).scalars().all()
+
+                chunk_rows = [
+                    dict(chunk, log_id=log_id)
+                    for entry, log_id in zip(entries, command_ids)
+                    for chunk in entry.output_chunks
+                ]
+                if chunk_rows:
+                    db.session.execute(db.insert(CommandOutputChunk), chunk_rows)
+
+                edit_ids = []
+                if edit_rows:
+                    edit_ids = db.session.execute(
+                        db.insert(FileEditLog).returning(FileEditLog.log_id, sort_by_parameter_order=True),
+                        edit_rows
+                    ).scalars().all()
+
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+            finally:
+                db.session.remove()
+
+        for entry, log_id in zip(entries, command_ids):
+            entry.command_log_id = log_id
+            entry.file_edit_ids = []
+        for entry, log_id in zip(owners, edit_ids):
+            entry.file_edit_ids.append(log_id)
+
+
+log_writer = LogWriter()
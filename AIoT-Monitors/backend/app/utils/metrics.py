@@ -0,0 +1,313 @@
+import threading
+import time
+from flask import Response, g, request
+from sqlalchemy.pool import QueuePool
+
+# Bucket bounds in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SSH_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+POOL_WAIT_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+
+class _ThreadShards:
+    """Per-thread value dicts merged at scrape time.
+
+    Each thread only writes to its own dict, so recording a value takes no
+    lock; the lock is taken once per thread (registration) and per scrape.
+    Shards of finished threads are folded into a retired dict so that
+    thread-per-request servers do not accumulate them.
+    """
+
+    def __init__(self, merge, copy):
+        self._merge = merge
+        self._copy = copy
+        self._local = threading.local()
+        self._shards = []
+        self._retired = {}
+        self._lock = threading.Lock()
+
+    def mine(self):
+        shard = getattr(self._local, 'values', None)
+        if shard is None:
+            shard = {}
+            self._local.values = shard
+            with self._lock:
+                self._shards.append((threading.current_thread(), shard))
+        return shard
+
+    def collect(self):
+        with self._lock:
+            live = []
+            for thread, shard in self._shards:
+                if thread.is_alive():
+                    live.append((thread, shard))
+                else:
+                    self._fold(self._retired, shard)
+            self._shards = live
+
+            merged = {key: self._copy(value) for key, value in self._retired.items()}
+            for _, shard in live:
+                self._fold(merged, shard)
+        return merged
+
+    def _fold(self, target, shard):
+        for key, value in shard.copy().items():
+            if key in target:
+                target[key] = self._merge(target[key], value)
+            else:
+                target[key] = self._copy(value)
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def samples(self):
+        """Yield (suffix, label pairs, value) tuples for the exposition"""
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._shards = _ThreadShards(lambda a, b: a + b, lambda value: value)
+
+    def inc(self, *labelvalues, amount=1):
+        shard = self._shards.mine()
+        shard[labelvalues] = shard.get(labelvalues, 0) + amount
+
+    def samples(self):
+        for labelvalues, value in sorted(self._shards.collect().items()):
+            yield '', tuple(zip(self.labelnames, labelvalues)), value
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._shards = _ThreadShards(self._merge, lambda value: list(value))
+
+    @staticmethod
+    def _merge(a, b):
+        return [x + y for x, y in zip(a, b)]
+
+    def observe(self, value, *labelvalues):
+        shard = self._shards.mine()
+        # [count per bucket..., +Inf count, sum]
+        state = shard.get(labelvalues)
+        if state is None:
+            state = shard[labelvalues] = [0] * (len(self.buckets) + 2)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                state[i] += 1
+                break
+        else:
+            state[len(self.buckets)] += 1
+        state[-1] += value
+
+    def samples(self):
+        for labelvalues, state in sorted(self._shards.collect().items()):
+            labels = tuple(zip(self.labelnames, labelvalues))
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                yield '_bucket', labels + (('le', _format_value(bound)),), cumulative
+            cumulative += state[len(self.buckets)]
+            yield '_bucket', labels + (('le', '+Inf'),), cumulative
+            yield '_sum', labels, state[-1]
+            yield '_count', labels, cumulative
+
+
+class Gauge(Metric):
+    """Value read from a callback at scrape time: {labelvalues: value} or a number"""
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), callback=None):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+
+    def samples(self):
+        values = self.callback()
+        if not isinstance(values, dict):
+            values = {(): values}
+        for labelvalues, value in sorted(values.items()):
+            if value is not None:
+                yield '', tuple(zip(self.labelnames, labelvalues)), value
+
+
+def _format_value(value):
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each connection checkout waited"""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            metrics.db_pool_checkout_seconds.observe(time.perf_counter() - started)
+
+
+class Metrics:
+    """Process-wide metrics registry exposed on /metrics in the Prometheus text format"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self.enabled = True
+        self.token = None
+        self._metrics = []
+        self._gauges_registered = False
+        self._lock = threading.Lock()
+
+        self.http_requests = self.counter(
+            'aiot_http_requests_total', 'HTTP requests by route and status',
+            ('blueprint', 'route', 'method', 'status'))
+        self.http_latency = self.histogram(
+            'aiot_http_request_duration_seconds', 'HTTP request latency by route',
+            ('blueprint', 'route', 'method'), LATENCY_BUCKETS)
+        self.ssh_phase_seconds = self.histogram(
+            'aiot_ssh_phase_duration_seconds', 'SSH connect, auth and exec phase durations',
+            ('engine', 'phase'), SSH_BUCKETS)
+        self.ssh_errors = self.counter(
+            'aiot_ssh_errors_total', 'SSH failures by phase', ('engine', 'phase'))
+        self.db_pool_checkout_seconds = self.histogram(
+            'aiot_db_pool_checkout_wait_seconds', 'Time spent waiting for a DB pool connection',
+            (), POOL_WAIT_BUCKETS)
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.enabled = app.config.get('METRICS_ENABLED', self.enabled)
+        self.token = app.config.get('METRICS_TOKEN', self.token)
+        app.extensions['metrics'] = self
+
+        # Route inventory, pool sizes and session counts: never served anonymously outside development
+        if self.enabled and not self.token and not app.debug:
+            print("METRICS_TOKEN is not set: /metrics is disabled (set it, or run with FLASK_DEBUG=1)")
+            self.enabled = False
+        if not self.enabled:
+            return
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.add_url_rule('/metrics', 'metrics', self._export_view)
+        self._register_gauges()
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name, documentation, labelnames=(), callback=None):
+        return self._register(Gauge(name, documentation, labelnames, callback))
+
+    def observe_ssh_phase(self, engine, phase, seconds):
+        self.ssh_phase_seconds.observe(seconds, engine, phase)
+
+    def count_ssh_error(self, engine, phase):
+        self.ssh_errors.inc(engine, phase)
+
+    def render(self):
+        """Text exposition of every registered metric"""
+        lines = []
+        with self._lock:
+            registered = list(self._metrics)
+        for metric in registered:
+            try:
+                samples = list(metric.samples())
+            except Exception as e:
+                print(f"Error collecting metric {metric.name}: {str(e)}")
+                continue
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for suffix, labels, value in samples:
+                label_text = ','.join(f'{name}="{_escape(label)}"' for name, label in labels)
+                label_text = f"{{{label_text}}}" if label_text else ''
+                lines.append(f"{metric.name}{suffix}{label_text} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+    def _register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def _register_gauges(self):
+        if self._gauges_registered:
+            return
+        self._gauges_registered = True
+
+        from app import db
+        from app.models.session import Session, SessionStatus
+        from app.utils.ssh_pool import ssh_pool
+        from app.utils.log_writer import log_writer
+        from app.utils.diff_worker import diff_worker
+        from app.utils.permission_cache import permission_cache
+
+        def active_sessions():
+            return Session.query.filter(Session.status == SessionStatus.ACTIVE).count()
+
+        def ssh_pool_connections():
+            stats = ssh_pool.get_stats()
+            return {('in_use',): stats['in_use'], ('idle',): stats['idle'], ('pending',): stats['pending']}
+
+        def db_pool():
+            pool = db.engine.pool
+            if not isinstance(pool, QueuePool):
+                return {}
+            return {('size',): pool.size(), ('checked_out',): pool.checkedout(), ('overflow',): max(pool.overflow(), 0)}
+
+        self.gauge('aiot_active_sessions', 'Sessions with status active', (), active_sessions)
+        self.gauge('aiot_ssh_pool_connections', 'Pooled SSH connections by state', ('state',), ssh_pool_connections)
+        self.gauge('aiot_ssh_pool_max_per_device', 'SSH connections allowed per device', (),
+                   lambda: ssh_pool.max_per_device)
+        self.gauge('aiot_db_pool_connections', 'SQLAlchemy pool connections by state', ('state',), db_pool)
+        self.gauge('aiot_log_writer_queue_depth', 'Command log rows waiting to be written', (),
+                   lambda: log_writer.get_stats()['queue_depth'])
+        self.gauge('aiot_diff_worker_backlog', 'File edit diffs waiting to be computed', (),
+                   lambda: diff_worker.get_stats()['backlog'])
+        self.gauge('aiot_permission_cache_hit_rate', 'Effective-permissions cache hit rate', (),
+                   lambda: permission_cache.get_stats()['hit_rate'])
+
+    def _before_request(self):
+        g._metrics_started = time.perf_counter()
+
+    def _after_request(self, response):
+        started = g.pop('_metrics_started', None)
+        if started is None:
+            return response
+
+        # Label by URL rule, not raw path, to keep label cardinality bounded
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        blueprint = request.blueprint or ''
+        self.http_latency.observe(time.perf_counter() - started, blueprint, route, request.method)
+        self.http_requests.inc(blueprint, route, request.method, str(response.status_code))
+        return response
+
+    def _export_view(self):
+        if self.token and request.headers.get('Authorization') != f"Bearer {self.token}":
+            return Response('Unauthorized\n', status=401, mimetype='text/plain')
+        return Response(self.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+
+metrics = Metrics()
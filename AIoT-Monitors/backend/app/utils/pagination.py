@@ -0,0 +1,87 @@
+import base64
+import json
+from datetime import datetime
+from sqlalchemy import and_, or_, text, tuple_
+
+COUNT_MODES = ('none', 'estimate', 'exact')
+
+
+class InvalidCursorError(ValueError):
+    pass
+
+
+def encode_cursor(timestamp, row_id):
+    """Opaque cursor for the row a page ended on"""
+    payload = json.dumps([timestamp.isoformat() if timestamp else None, row_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return (timestamp, row_id) from a cursor made by encode_cursor; timestamp may be None"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        timestamp, row_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        return (datetime.fromisoformat(timestamp) if timestamp is not None else None), int(row_id)
+    except Exception:
+        raise InvalidCursorError('Invalid cursor')
+
+
+def keyset_page(query, time_column, id_column, cursor=None, limit=20, descending=True):
+    """Fetch one page ordered by (time_column, id_column) after the cursor.
+
+    The cursor is compared as a row value, so with an index on both columns
+    every page is an index range scan, however deep it is.
+    Rows whose time_column is NULL sort after every timestamp, as they do
+    in a PostgreSQL index: first when descending, last when ascending.
+    Returns (rows, next_cursor); next_cursor is None on the last page.
+    """
+    if cursor:
+        timestamp, row_id = decode_cursor(cursor)
+        query = query.filter(_after_cursor(time_column, id_column, timestamp, row_id, descending))
+
+    if descending:
+        query = query.order_by(time_column.desc().nulls_first(), id_column.desc())
+    else:
+        query = query.order_by(time_column.asc().nulls_last(), id_column.asc())
+
+    # Lấy thêm một bản ghi để biết còn trang sau hay không
+    rows = query.limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor(getattr(last, time_column.key), getattr(last, id_column.key))
+
+
+def _after_cursor(time_column, id_column, timestamp, row_id, descending):
+    """Filter for the rows that come after (timestamp, row_id) in keyset_page's order"""
+    if timestamp is None:
+        # Con trỏ nằm trong nhóm NULL: các bản ghi NULL còn lại, rồi (nếu giảm dần) mọi bản ghi có thời gian
+        null_rest = and_(time_column.is_(None), id_column < row_id if descending else id_column > row_id)
+        return or_(null_rest, time_column.isnot(None)) if descending else null_rest
+
+    # So sánh hàng với NULL cho kết quả NULL, nên nhóm NULL phải được thêm tường minh
+    key = tuple_(time_column, id_column)
+    if descending:
+        return key < (timestamp, row_id)
+    return or_(key > (timestamp, row_id), time_column.is_(None))
+
+
+def count_rows(session, query, mode):
+    """Total rows of a query: None, the planner's estimate, or an exact COUNT"""
+    query = query.order_by(None).enable_eagerloads(False)
+    if mode == 'exact':
+        return query.count()
+    if mode != 'estimate':
+        return None
+
+    # EXPLAIN chỉ đọc thống kê của planner, không quét bảng
+    statement = query.statement.compile(
+        dialect=session.get_bind().dialect,
+        compile_kwargs={'literal_binds': True}
+    )
+    plan = session.execute(text(f"EXPLAIN (FORMAT JSON) {statement}")).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
@@ -0,0 +1,240 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from app.utils.command_matcher import CommandMatcher
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+
+class EffectivePermissions:
+    """A user's effective access: the devices they can reach and the commands allowed per group"""
+
+    def __init__(self, device_ids, commands_by_group):
+        self.device_ids = frozenset(device_ids)
+        self.commands_by_group = {
+            group_id: frozenset(commands) for group_id, commands in commands_by_group.items()
+        }
+        self._matchers = {}
+
+    def can_access_device(self, device_id):
+        return device_id in self.device_ids
+
+    def allowed_commands(self, group_id):
+        return self.commands_by_group.get(group_id, frozenset())
+
+    def can_run(self, group_id, command):
+        """Check a command against the group's allowed commands and templates"""
+        matcher = self._matchers.get(group_id)
+        if matcher is None:
+            # Compiled on first use; the entry is rebuilt whenever the cache is invalidated
+            matcher = self._matchers[group_id] = CommandMatcher(self.allowed_commands(group_id))
+        return matcher.matches(command)
+
+    def to_json(self):
+        # group_id may be None, so the mapping is stored as pairs rather than a JSON object
+        return json.dumps({
+            'device_ids': sorted(self.device_ids),
+            'commands_by_group': [
+                [group_id, sorted(commands)] for group_id, commands in self.commands_by_group.items()
+            ]
+        })
+
+    @classmethod
+    def from_json(cls, raw):
+        data = json.loads(raw)
+        return cls(data['device_ids'], {group_id: commands for group_id, commands in data['commands_by_group']})
+
+
+class RedisPermissionBackend:
+    """Shared second-level store so several backend workers reuse each other's results.
+
+    Keys are namespaced by a generation counter; invalidating bumps the
+    counter, which makes every worker's cached entries stale at once.
+    """
+
+    GENERATION_KEY = 'aiot:permissions:generation'
+
+    def __init__(self, url, ttl):
+        if redis is None:
+            raise Exception("PERMISSION_CACHE_REDIS_URL requires the redis package (pip install redis)")
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+
+    def generation(self):
+        return int(self.client.get(self.GENERATION_KEY) or 0)
+
+    def bump_generation(self):
+        return self.client.incr(self.GENERATION_KEY)
+
+    def get(self, generation, user_id):
+        raw = self.client.get(self._key(generation, user_id))
+        return EffectivePermissions.from_json(raw) if raw is not None else None
+
+    def set(self, generation, user_id, permissions):
+        self.client.set(self._key(generation, user_id), permissions.to_json(), ex=self.ttl)
+
+    def _key(self, generation, user_id):
+        return f'aiot:permissions:{generation}:{user_id}'
+
+
+class PermissionCache:
+    """Per-user cache of effective permissions (LRU with TTL).
+
+    Entries are computed by app.utils.permissions.load_effective_permissions
+    and dropped explicitly by the endpoints that change profiles, profile
+    assignments, device groups or command lists. Each user also has a
+    version, read before their permissions are loaded and checked again
+    before the result is stored, so a load that raced an invalidation is
+    returned once but never cached. With a shared backend configured every
+    invalidation is global, because other workers cannot be told which
+    user changed. Without one, other workers only see an invalidation when
+    their entry expires, which is why the default TTL is then a few seconds.
+    """
+
+    def __init__(self, app=None):
+        self.enabled = True
+        self.max_size = 1024
+        self.ttl = 300
+        self.backend = None
+        self._entries = OrderedDict()
+        self._generation = 0
+        self._user_versions = {}
+        self._lock = threading.Lock()
+        self.stats = {
+            'hits': 0,
+            'shared_hits': 0,
+            'misses': 0,
+            'expired': 0,
+            'evictions': 0,
+            'invalidations': 0,
+            'backend_errors': 0
+        }
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('PERMISSION_CACHE_ENABLED', self.enabled)
+        self.max_size = app.config.get('PERMISSION_CACHE_SIZE', self.max_size)
+        self.ttl = app.config.get('PERMISSION_CACHE_TTL', self.ttl)
+        if app.config.get('PERMISSION_CACHE_REDIS_URL'):
+            self.backend = RedisPermissionBackend(app.config['PERMISSION_CACHE_REDIS_URL'], self.ttl)
+        app.extensions['permission_cache'] = self
+
+    def get(self, user_id):
+        """Return the user's EffectivePermissions, computing them on a miss"""
+        from app.utils.permissions import load_effective_permissions
+
+        if not self.enabled:
+            return load_effective_permissions(user_id)
+
+        generation = self._current_generation()
+        now = time.monotonic()
+        with self._lock:
+            version = (self._generation, self._user_versions.get(user_id, 0))
+            entry = self._entries.get(user_id)
+            if entry is not None:
+                expires_at, entry_generation, permissions = entry
+                if expires_at > now and entry_generation == generation:
+                    self._entries.move_to_end(user_id)
+                    self.stats['hits'] += 1
+                    return permissions
+                del self._entries[user_id]
+                self.stats['expired'] += 1
+
+        permissions = self._backend_get(generation, user_id)
+        if permissions is not None:
+            with self._lock:
+                self.stats['shared_hits'] += 1
+        else:
+            permissions = load_effective_permissions(user_id)
+            with self._lock:
+                self.stats['misses'] += 1
+            self._backend_set(generation, user_id, permissions)
+
+        self._store(user_id, generation, version, permissions)
+        return permissions
+
+    def invalidate_user(self, user_id):
+        """Drop one user's entry after their profile assignments changed"""
+        if self.backend is not None:
+            self.invalidate_all()
+            return
+        with self._lock:
+            self._entries.pop(user_id, None)
+            self._user_versions[user_id] = self._user_versions.get(user_id, 0) + 1
+            self.stats['invalidations'] += 1
+
+    def invalidate_all(self):
+        """Drop every entry after a profile, device group or command list changed"""
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+            self.stats['invalidations'] += 1
+        if self.backend is not None:
+            try:
+                self.backend.bump_generation()
+            except Exception as e:
+                self._backend_error(e)
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats['size'] = len(self._entries)
+        lookups = stats['hits'] + stats['shared_hits'] + stats['misses']
+        stats.update(
+            enabled=self.enabled,
+            max_size=self.max_size,
+            ttl=self.ttl,
+            shared_backend=self.backend is not None,
+            hit_rate=round((stats['hits'] + stats['shared_hits']) / lookups, 4) if lookups else None
+        )
+        return stats
+
+    def _store(self, user_id, generation, version, permissions):
+        with self._lock:
+            # Invalidated while loading: the result may predate the change
+            if version != (self._generation, self._user_versions.get(user_id, 0)):
+                return
+            self._entries[user_id] = (time.monotonic() + self.ttl, generation, permissions)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.stats['evictions'] += 1
+
+    def _current_generation(self):
+        if self.backend is not None:
+            try:
+                return self.backend.generation()
+            except Exception as e:
+                self._backend_error(e)
+        return self._generation
+
+    def _backend_get(self, generation, user_id):
+        if self.backend is None:
+            return None
+        try:
+            return self.backend.get(generation, user_id)
+        except Exception as e:
+            self._backend_error(e)
+            return None
+
+    def _backend_set(self, generation, user_id, permissions):
+        if self.backend is None:
+            return
+        try:
+            self.backend.set(generation, user_id, permissions)
+        except Exception as e:
+            self._backend_error(e)
+
+    def _backend_error(self, error):
+        with self._lock:
+            self.stats['backend_errors'] += 1
+        print(f"Permission cache backend error: {str(error)}")
+
+
+permission_cache = PermissionCache()
@@ -0,0 +1,70 @@
+from app import db
+from app.models.user import UserProfile
+from app.models.profile import Profile
+from app.models.device import Device
+from app.models.command import Command
+from app.utils.permission_cache import permission_cache, EffectivePermissions
+
+def _active_profiles(user_id):
+    """Query of the active profiles assigned to a user, one join instead of one load per profile"""
+    return db.session.query(Profile).join(
+        UserProfile, UserProfile.profile_id == Profile.profile_id
+    ).filter(
+        UserProfile.user_id == user_id,
+        UserProfile.is_active == True,
+        Profile.is_active == True
+    )
+
+def can_access_device(user_id, device_id):
+    """Check against the user's cached effective device set"""
+    return permission_cache.get(user_id).can_access_device(device_id)
+
+def get_device_profiles(user_id, group_id):
+    """Active profiles of the user that grant access to a device group"""
+    if group_id is None:
+        return []
+    return _active_profiles(user_id).filter(Profile.group_id == group_id).all()
+
+def get_allowed_commands(user_id):
+    """(Command, Profile) pairs for every command the user's active profiles allow"""
+    return db.session.query(Command, Profile).join(
+        Profile, Profile.list_id == Command.list_id
+    ).join(
+        UserProfile, UserProfile.profile_id == Profile.profile_id
+    ).filter(
+        UserProfile.user_id == user_id,
+        UserProfile.is_active == True,
+        Profile.is_active == True
+    ).order_by(Profile.profile_id, Command.command_id).all()
+
+def can_run_command(user_id, group_id, command):
+    """Check a command against the user's compiled allowed-command matcher for a device group"""
+    return permission_cache.get(user_id).can_run(group_id, command)
+
+def load_effective_permissions(user_id):
+    """Compute a user's effective device set and per-group command sets with two queries"""
+    device_ids = db.session.query(Device.device_id).join(
+        Profile, Profile.group_id == Device.group_id
+    ).join(
+        UserProfile, UserProfile.profile_id == Profile.profile_id
+    ).filter(
+        UserProfile.user_id == user_id,
+        UserProfile.is_active == True,
+        Profile.is_active == True
+    ).distinct().all()
+
+    rows = db.session.query(Profile.group_id, Command.command_text).join(
+        UserProfile, UserProfile.profile_id == Profile.profile_id
+    ).join(
+        Command, Command.list_id == Profile.list_id
+    ).filter(
+        UserProfile.user_id == user_id,
+        UserProfile.is_active == True,
+        Profile.is_active == True
+    ).all()
+
+    commands_by_group = {}
+    for group_id, command_text in rows:
+        commands_by_group.setdefault(group_id, set()).add(command_text.strip())
+
+    return EffectivePermissions([device_id for device_id, in device_ids], commands_by_group)
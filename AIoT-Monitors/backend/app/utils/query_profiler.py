@@ -0,0 +1,126 @@
+import threading
+import time
+from collections import Counter
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+class QueryProfiler:
+    """Counts SQL queries and DB time per Flask request and flags N+1 patterns.
+
+    Cursor listeners are attached to every Engine only while the profiler is
+    enabled, so a disabled profiler costs one attribute check per request.
+    A statement executed n_plus_one_threshold times or more in one request
+    (same SQL, different parameters) is reported as a likely N+1.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.enabled = False
+        self.add_headers = True
+        self.n_plus_one_threshold = 5
+        self.log_threshold = 0
+        self._listening = False
+        self._lock = threading.Lock()
+        self.stats = {
+            'requests': 0,
+            'queries': 0,
+            'db_time_ms': 0.0,
+            'n_plus_one_requests': 0,
+            'max_queries': 0
+        }
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.add_headers = app.config.get('QUERY_PROFILER_HEADERS', self.add_headers)
+        self.n_plus_one_threshold = app.config.get('QUERY_PROFILER_N_PLUS_ONE_THRESHOLD', self.n_plus_one_threshold)
+        self.log_threshold = app.config.get('QUERY_PROFILER_LOG_THRESHOLD', self.log_threshold)
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.extensions['query_profiler'] = self
+
+        if app.config.get('QUERY_PROFILER_ENABLED', False):
+            self.enable()
+
+    def enable(self):
+        with self._lock:
+            if not self._listening:
+                event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+                event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+                self._listening = True
+            self.enabled = True
+
+    def disable(self):
+        with self._lock:
+            self.enabled = False
+            if self._listening:
+                event.remove(Engine, 'before_cursor_execute', self._before_cursor_execute)
+                event.remove(Engine, 'after_cursor_execute', self._after_cursor_execute)
+                self._listening = False
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+        stats['enabled'] = self.enabled
+        stats['db_time_ms'] = round(stats['db_time_ms'], 2)
+        stats['avg_queries'] = round(stats['queries'] / stats['requests'], 2) if stats['requests'] else 0
+        return stats
+
+    def _before_request(self):
+        if self.enabled:
+            g._query_profile = {'count': 0, 'time': 0.0, 'statements': Counter()}
+
+    def _after_request(self, response):
+        profile = g.pop('_query_profile', None)
+        if profile is None:
+            return response
+
+        count = profile['count']
+        db_time_ms = round(profile['time'] * 1000, 2)
+        repeated = [(statement, times) for statement, times in profile['statements'].most_common()
+                    if times >= self.n_plus_one_threshold]
+
+        with self._lock:
+            self.stats['requests'] += 1
+            self.stats['queries'] += count
+            self.stats['db_time_ms'] += db_time_ms
+            self.stats['max_queries'] = max(self.stats['max_queries'], count)
+            if repeated:
+                self.stats['n_plus_one_requests'] += 1
+
+        if self.add_headers:
+            response.headers['X-Query-Count'] = str(count)
+            response.headers['X-Query-Time-Ms'] = str(db_time_ms)
+            if repeated:
+                response.headers['X-Query-Repeated'] = str(len(repeated))
+
+        if count >= self.log_threshold:
+            print(f"[query-profiler] {request.method} {request.path}: {count} queries, {db_time_ms} ms")
+        for statement, times in repeated:
+            print(f"[query-profiler] possible N+1 in {request.method} {request.path}: "
+                  f"{times}x {' '.join(statement.split())[:200]}")
+        return response
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_profiler_start', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get('query_profiler_start')
+        started = starts.pop() if starts else None
+        # Chỉ tính các truy vấn chạy trong request đang được profile
+        if not has_request_context():
+            return
+        profile = g.get('_query_profile')
+        if profile is None:
+            return
+        profile['count'] += 1
+        if started is not None:
+            profile['time'] += time.perf_counter() - started
+        profile['statements'][statement] += 1
+
+
+query_profiler = QueryProfiler()
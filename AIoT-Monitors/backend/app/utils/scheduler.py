@@ -0,0 +1,207 @@
+import heapq
+import threading
+from datetime import datetime, timedelta, UTC
+
+
+class MonitoringScheduler:
+    """Runs scheduled_monitoring checks when they come due.
+
+    Pending rows due within the next refresh window are kept in a min-heap
+    ordered by scheduled_time, so the thread sleeps exactly until the next
+    row is due. Due rows are claimed with SELECT ... FOR UPDATE SKIP LOCKED
+    and marked completed in the same short transaction, which lets several
+    backend workers share the table without running a check twice. The
+    checks (device probes, see DevicePoller) run after that commit, so no
+    row lock is held while waiting on the network; completed_at is set
+    once they finish. If the checks raise, the claim is undone so the rows
+    are picked up again on the next refresh. A row left with
+    completed = TRUE and no completed_at was claimed by a worker that died
+    before finishing its check; it is not retried automatically.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.refresh_interval = 30
+        self.batch_size = 100
+        self.last_run = None
+        self._heap = []
+        self._queued = set()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.refresh_interval = app.config.get('SCHEDULER_REFRESH_INTERVAL', self.refresh_interval)
+        self.batch_size = app.config.get('SCHEDULER_BATCH_SIZE', self.batch_size)
+        app.extensions['monitoring_scheduler'] = self
+
+        if app.config.get('SCHEDULER_ENABLED'):
+            self.start()
+
+    def start(self):
+        if self.is_running():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name='monitoring-scheduler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def notify(self, schedule_id, scheduled_time):
+        """Add a newly created schedule to the heap and wake the thread if it is due sooner"""
+        with self._lock:
+            if schedule_id in self._queued:
+                return
+            heapq.heappush(self._heap, (_as_utc(scheduled_time), schedule_id))
+            self._queued.add(schedule_id)
+            is_next = self._heap[0][1] == schedule_id
+        if is_next:
+            self._wakeup.set()
+
+    def _loop(self):
+        next_refresh = datetime.now(UTC)
+        while not self._stop.is_set():
+            now = datetime.now(UTC)
+            try:
+                if now >= next_refresh:
+                    self._refresh(now)
+                    next_refresh = now + timedelta(seconds=self.refresh_interval)
+
+                if self._pop_due(now):
+                    # Keep claiming until no due rows are left
+                    while self.run_due() == self.batch_size:
+                        pass
+            except Exception as e:
+                print(f"Error in monitoring scheduler: {str(e)}")
+
+            with self._lock:
+                next_due = self._heap[0][0] if self._heap else next_refresh
+            timeout = (min(next_due, next_refresh) - datetime.now(UTC)).total_seconds()
+            self._wakeup.wait(max(0, timeout))
+            self._wakeup.clear()
+
+    def _refresh(self, now):
+        """Load pending rows due before the next refresh into the heap"""
+        from app import db
+        from app.models.scheduled_monitoring import ScheduledMonitoring
+
+        horizon = now + timedelta(seconds=self.refresh_interval)
+        with self.app.app_context():
+            rows = db.session.query(
+                ScheduledMonitoring.schedule_id, ScheduledMonitoring.scheduled_time
+            ).filter(
+                ScheduledMonitoring.completed == False,
+                ScheduledMonitoring.scheduled_time <= horizon
+            ).all()
+            db.session.remove()
+
+        for schedule_id, scheduled_time in rows:
+            self.notify(schedule_id, scheduled_time)
+
+    def _pop_due(self, now):
+        popped = False
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                _, schedule_id = heapq.heappop(self._heap)
+                self._queued.discard(schedule_id)
+                popped = True
+        return popped
+
+    def run_due(self):
+        """Claim one batch of due rows, then run their checks and record completion.
+
+        Returns the number of rows processed.
+        """
+        from app import db
+        from app.models.device import Device
+        from app.models.scheduled_monitoring import ScheduledMonitoring
+        from app.utils.device_poller import device_poller
+
+        with self.app.app_context():
+            now = datetime.now(UTC)
+            claimed_ids = None
+            try:
+                claimed = db.session.query(
+                    ScheduledMonitoring.schedule_id, ScheduledMonitoring.device_id
+                ).filter(
+                    ScheduledMonitoring.completed == False,
+                    ScheduledMonitoring.scheduled_time <= now
+                ).order_by(
+                    ScheduledMonitoring.scheduled_time
+                ).limit(self.batch_size).with_for_update(skip_locked=True).all()
+
+                if not claimed:
+                    db.session.commit()
+                    return 0
+
+                # Đánh dấu đã nhận rồi commit ngay để nhả row lock trước khi probe
+                schedule_ids = [schedule_id for schedule_id, _ in claimed]
+                db.session.query(ScheduledMonitoring).filter(
+                    ScheduledMonitoring.schedule_id.in_(schedule_ids)
+                ).update({'completed': True}, synchronize_session=False)
+
+                device_ids = {device_id for _, device_id in claimed if device_id is not None}
+                devices = db.session.query(
+                    Device.device_id, Device.ip_address, Device.ssh_port
+                ).filter(Device.device_id.in_(device_ids)).all() if device_ids else []
+                db.session.commit()
+                claimed_ids = schedule_ids
+
+                results = device_poller.probe([(ip_address, ssh_port) for _, ip_address, ssh_port in devices])
+                device_poller.write_status(
+                    [(device_id, online) for (device_id, _, _), online in zip(devices, results)],
+                    commit=False
+                )
+                db.session.query(ScheduledMonitoring).filter(
+                    ScheduledMonitoring.schedule_id.in_(schedule_ids)
+                ).update({'completed_at': datetime.now(UTC)}, synchronize_session=False)
+                db.session.commit()
+
+                self.last_run = {
+                    'ran_at': now.isoformat(),
+                    'completed': len(claimed),
+                    'devices_checked': len(devices),
+                    'online': sum(1 for online in results if online)
+                }
+                return len(claimed)
+            except Exception:
+                db.session.rollback()
+                if claimed_ids:
+                    self._release_claim(claimed_ids)
+                raise
+            finally:
+                db.session.remove()
+
+    def _release_claim(self, schedule_ids):
+        """Mark claimed rows pending again after their checks failed"""
+        from app import db
+        from app.models.scheduled_monitoring import ScheduledMonitoring
+
+        try:
+            db.session.query(ScheduledMonitoring).filter(
+                ScheduledMonitoring.schedule_id.in_(schedule_ids),
+                ScheduledMonitoring.completed_at.is_(None)
+            ).update({'completed': False}, synchronize_session=False)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"Error releasing {len(schedule_ids)} claimed scheduled checks: {str(e)}")
+
+
+def _as_utc(value):
+    if value.tzinfo is None:
+        return value.replace(tzinfo=UTC)
+    return value
+
+
+monitoring_scheduler = MonitoringScheduler()
@@ -1,9 +1,59 @@
 import paramiko
+import codecs
 import os
+import posixpath
+import select
+import socket
+import stat
 import time
+import threading
+import uuid
 from io import StringIO
+from app.utils.metrics import metrics
+
+# Same limit as Linux's MAXSYMLINKS
+MAX_SYMLINK_DEPTH = 40
+
+
+class SFTPOperationUnsupported(IOError):
+    """The SFTP server answered SSH_FX_OP_UNSUPPORTED"""
+    pass
+
+
+class _SFTPClient(paramiko.SFTPClient):
+    """SFTPClient that tells SSH_FX_OP_UNSUPPORTED apart from other failures.
+
+    paramiko raises a bare IOError for every status except no-such-file and
+    permission-denied, so a missing extension looks like a quota or
+    permission error from the server.
+    """
+
+    def _convert_status(self, msg):
+        position = msg.packet.tell()
+        code = msg.get_int()
+        if code == paramiko.SFTP_OP_UNSUPPORTED:
+            raise SFTPOperationUnsupported(msg.get_text())
+        msg.packet.seek(position)
+        return super()._convert_status(msg)
 
 class SSHClient:
+    # Every operation used to open its own SFTP channel; count how many
+    # channels are actually opened now that they are lazy and cached
+    sftp_stats = {'operations': 0, 'opened': 0}
+    _stats_lock = threading.Lock()
+    
+    @classmethod
+    def get_sftp_stats(cls):
+        with cls._stats_lock:
+            stats = dict(cls.sftp_stats)
+        stats['avoided'] = stats['operations'] - stats['opened']
+        return stats
+    
+    @classmethod
+    def _count_operation(cls):
+        with cls._stats_lock:
+            cls.sftp_stats['operations'] += 1
+    
     def __init__(self, hostname, port, username, password, authentication_method='password'):
         self.hostname = hostname
         self.port = port
@@ -11,33 +61,88 @@ class SSHClient:
         self.password = password
         self.authentication_method = authentication_method
         self.client = None
-        self.sftp = None
+        self._sftp = None
+        self._sftp_lock = threading.Lock()
+        # Whether the server has posix-rename@openssh.com (None until first upload)
+        self._posix_rename = None
+        # Seconds spent connecting and authenticating, and when (perf_counter) it finished
+        self.timings = {}
+        self.connected_at = None
     
     def connect(self):
         """Establish SSH connection"""
+        phase = 'connect'
+        sock = None
         try:
+            # TCP connect and SSH handshake/auth are timed separately
+            started = time.perf_counter()
+            sock = socket.create_connection((self.hostname, self.port))
+            self._record_phase('connect', started, self.timings)
+            
+            phase = 'auth'
+            started = time.perf_counter()
             self.client = paramiko.SSHClient()
             self.client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
             self.client.connect(
                 hostname=self.hostname,
                 port=self.port,
                 username=self.username,
-                password=self.password
+                password=self.password,
+                sock=sock
             )
-            self.sftp = self.client.open_sftp()
+            self._record_phase('auth', started, self.timings)
+            self.connected_at = time.perf_counter()
         except Exception as e:
+            metrics.count_ssh_error('paramiko', phase)
+            if sock is not None and phase == 'connect':
+                sock.close()
             raise Exception(f"Failed to connect: {str(e)}")
     
-    def execute_command(self, command):
-        """Execute a command on the remote server"""
+    def _record_phase(self, phase, started, timings=None):
+        elapsed = time.perf_counter() - started
+        if timings is not None:
+            timings[phase] = elapsed
+        metrics.observe_ssh_phase('paramiko', phase, elapsed)
+        return time.perf_counter()
+    
+    @property
+    def sftp(self):
+        """SFTP channel, opened on first use and kept for the connection lifetime"""
+        if self._sftp is None:
+            if not self.client:
+                return None
+            with self._sftp_lock:
+                if self._sftp is None:
+                    self._sftp = _SFTPClient.from_transport(self.client.get_transport())
+                    with SSHClient._stats_lock:
+                        SSHClient.sftp_stats['opened'] += 1
+        return self._sftp
+    
+    def execute_command(self, command, timings=None):
+        """Execute a command on the remote server.
+        
+        If a timings dict is given it receives the seconds spent opening the
+        channel, running the command (until its exit status arrives) and
+        transferring the remaining output.
+        """
         if not self.client:
             raise Exception("Not connected")
+        self._count_operation()
         
         try:
-            stdin, stdout, stderr = self.client.exec_command(command)
-            exit_code = stdout.channel.recv_exit_status()
+            started = time.perf_counter()
+            channel = self.client.get_transport().open_session()
+            started = self._record_phase('channel_open', started, timings)
+            
+            channel.exec_command(command)
+            stdout = channel.makefile('r')
+            stderr = channel.makefile_stderr('r')
+            exit_code = channel.recv_exit_status()
+            started = self._record_phase('exec', started, timings)
+            
             output = stdout.read().decode()
             error = stderr.read().decode()
+            self._record_phase('transfer', started, timings)
             
             # Combine output and error if there's an error
             if error:
@@ -45,34 +150,163 @@ class SSHClient:
             
             return exit_code, output
         except Exception as e:
+            metrics.count_ssh_error('paramiko', 'exec')
             raise Exception(f"Command execution failed: {str(e)}")
     
-    def read_file(self, file_path):
+    def execute_command_stream(self, command, chunk_size=4096, timeout=1.0, timings=None):
+        """Execute a command and yield output chunks as they arrive.
+        
+        Yields ('stdout', text) and ('stderr', text) tuples, then a final
+        ('exit', exit_code). At most chunk_size bytes are held per read.
+        Output is transferred while the command runs, so timings only gets
+        channel_open and exec.
+        """
+        if not self.client:
+            raise Exception("Not connected")
+        self._count_operation()
+        
+        try:
+            started = time.perf_counter()
+            channel = self.client.get_transport().open_session()
+            started = self._record_phase('channel_open', started, timings)
+            channel.exec_command(command)
+        except Exception as e:
+            metrics.count_ssh_error('paramiko', 'exec')
+            raise Exception(f"Command execution failed: {str(e)}")
+        
+        # Incremental decoders so multi-byte characters split across reads survive
+        stdout_decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        stderr_decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        
+        try:
+            while True:
+                received = False
+                if channel.recv_ready():
+                    text = stdout_decoder.decode(channel.recv(chunk_size))
+                    received = True
+                    if text:
+                        yield 'stdout', text
+                if channel.recv_stderr_ready():
+                    text = stderr_decoder.decode(channel.recv_stderr(chunk_size))
+                    received = True
+                    if text:
+                        yield 'stderr', text
+                if received:
+                    continue
+                if channel.exit_status_ready() and not channel.recv_ready() and not channel.recv_stderr_ready():
+                    break
+                select.select([channel], [], [], timeout)
+            
+            text = stdout_decoder.decode(b'', final=True)
+            if text:
+                yield 'stdout', text
+            text = stderr_decoder.decode(b'', final=True)
+            if text:
+                yield 'stderr', text
+            
+            exit_code = channel.recv_exit_status()
+            self._record_phase('exec', started, timings)
+            yield 'exit', exit_code
+        finally:
+            channel.close()
+    
+    def read_file(self, file_path, max_bytes=None):
         """Read content of a file"""
-        if not self.sftp:
+        if not self.client:
             raise Exception("Not connected")
+        self._count_operation()
         
         try:
             with self.sftp.open(file_path, 'r') as f:
+                if max_bytes is not None and f.stat().st_size > max_bytes:
+                    raise Exception(f"File is larger than {max_bytes} bytes")
                 content = f.read()
-            return content
+            # paramiko always returns bytes
+            return content.decode('utf-8', errors='replace')
+        except Exception as e:
+            raise Exception(f"Failed to read file: {str(e)}")
+    
+    def file_size(self, file_path):
+        """Size of a remote file in bytes"""
+        if not self.client:
+            raise Exception("Not connected")
+        self._count_operation()
+        
+        try:
+            return self.sftp.stat(file_path).st_size
+        except Exception as e:
+            raise Exception(f"Failed to read file: {str(e)}")
+    
+    def read_file_chunks(self, file_path, offset=0, length=None, chunk_size=32768, window=32):
+        """Yield a byte range of a remote file as chunks of at most chunk_size bytes.
+        
+        Reads are pipelined with paramiko's readv prefetch, `window` requests
+        at a time, so throughput does not wait on one round trip per chunk
+        while at most window * chunk_size bytes are buffered.
+        """
+        if not self.client:
+            raise Exception("Not connected")
+        self._count_operation()
+        
+        try:
+            f = self.sftp.open(file_path, 'rb')
+        except Exception as e:
+            raise Exception(f"Failed to read file: {str(e)}")
+        
+        with f:
+            size = f.stat().st_size
+            end = size if length is None else min(size, offset + length)
+            position = offset
+            while position < end:
+                requests = []
+                while position < end and len(requests) < window:
+                    n = min(chunk_size, end - position)
+                    requests.append((position, n))
+                    position += n
+                for data in f.readv(requests):
+                    yield data
+    
+    def tail_offset(self, file_path, lines, chunk_size=32768):
+        """Byte offset at which the last `lines` lines of a remote file start"""
+        if not self.client:
+            raise Exception("Not connected")
+        self._count_operation()
+        
+        try:
+            with self.sftp.open(file_path, 'rb') as f:
+                position = f.stat().st_size
+                at_end = True
+                newlines = 0
+                # Scan backwards block by block, counting newlines
+                while position > 0:
+                    n = min(chunk_size, position)
+                    position -= n
+                    f.seek(position)
+                    block = f.read(n)
+                    # A trailing newline ends the last line rather than starting a new one
+                    index = len(block) - 1 if at_end and block.endswith(b'\n') else len(block)
+                    at_end = False
+                    while True:
+                        index = block.rfind(b'\n', 0, index)
+                        if index < 0:
+                            break
+                        newlines += 1
+                        if newlines == lines:
+                            return position + index + 1
+                return 0
         except Exception as e:
             raise Exception(f"Failed to read file: {str(e)}")
     
     def edit_file(self, file_path, content, edit_type='modify'):
         """Edit a file on the remote server"""
-        if not self.sftp:
+        if not self.client:
             raise Exception("Not connected")
+        self._count_operation()
         
         try:
-            if edit_type == 'create':
-                # Create new file
-                with self.sftp.open(file_path, 'w') as f:
-                    f.write(content)
-            elif edit_type == 'modify':
-                # Modify existing file
-                with self.sftp.open(file_path, 'w') as f:
-                    f.write(content)
+            if edit_type in ('create', 'modify'):
+                # Upload to a temp file and rename it over the target
+                self._upload(file_path, [content.encode('utf-8') if isinstance(content, str) else content])
             elif edit_type == 'delete':
                 # Delete file
                 self.sftp.remove(file_path)
@@ -83,9 +317,168 @@ class SSHClient:
         except Exception as e:
             raise Exception(f"Failed to edit file: {str(e)}")
     
+    def write_file_chunks(self, file_path, chunks):
+        """Atomically replace a remote file with an iterable of byte chunks.
+        
+        Returns the number of bytes written.
+        """
+        if not self.client:
+            raise Exception("Not connected")
+        self._count_operation()
+        
+        try:
+            return self._upload(file_path, chunks)
+        except Exception as e:
+            raise Exception(f"Failed to edit file: {str(e)}")
+    
+    def _upload(self, file_path, chunks):
+        """Write chunks to a temp file beside the target, then rename it into place.
+        
+        Writes are pipelined (no wait for each SFTP ack). A symlink is
+        followed, so the file it points to is replaced and the link kept;
+        the new file gets the old one's mode and, where the server allows
+        chown, its owner and group. With posix-rename@openssh.com readers see
+        either the old or the new content; see _replace for servers without
+        it. If the directory does not accept a temp file, the target is
+        overwritten in place instead. The temp file is removed if anything
+        fails.
+        """
+        target, attrs = self._resolve_upload_target(file_path)
+        directory, name = posixpath.split(target)
+        tmp_path = posixpath.join(directory, f'.{name}.{uuid.uuid4().hex[:8]}.tmp')
+        
+        try:
+            f = self.sftp.open(tmp_path, 'wb')
+        except IOError:
+            # Thư mục cha không cho tạo file tạm: ghi đè trực tiếp như cách cũ
+            return self._write_in_place(target, chunks)
+        
+        written = 0
+        try:
+            with f:
+                f.set_pipelined(True)
+                for chunk in chunks:
+                    if chunk:
+                        f.write(chunk)
+                        written += len(chunk)
+            # Giữ nguyên quyền và chủ sở hữu của file cũ
+            if attrs is not None:
+                self.sftp.chmod(tmp_path, stat.S_IMODE(attrs.st_mode))
+                if attrs.st_uid is not None and attrs.st_gid is not None:
+                    try:
+                        self.sftp.chown(tmp_path, attrs.st_uid, attrs.st_gid)
+                    except IOError:
+                        pass  # Only root (or the owner, for its own groups) may chown
+            self._replace(tmp_path, target, attrs is not None)
+        except Exception:
+            try:
+                self.sftp.remove(tmp_path)
+            except Exception:
+                pass
+            raise
+        return written
+    
+    def _resolve_upload_target(self, file_path):
+        """Follow symlinks to the file an upload should replace.
+        
+        Returns (path, attributes), attributes being None if it does not exist.
+        """
+        path = file_path
+        for _ in range(MAX_SYMLINK_DEPTH):
+            try:
+                attrs = self.sftp.lstat(path)
+            except FileNotFoundError:
+                return path, None
+            if not stat.S_ISLNK(attrs.st_mode):
+                return path, attrs
+            path = posixpath.normpath(posixpath.join(posixpath.dirname(path), self.sftp.readlink(path)))
+        raise Exception(f"Too many levels of symbolic links: {file_path}")
+    
+    def _replace(self, tmp_path, target, exists):
+        """Rename tmp_path over target.
+        
+        posix-rename@openssh.com replaces atomically. Servers without it
+        (Dropbear, many embedded SFTP servers) only have the plain SFTP
+        rename, which refuses an existing target: the old file is moved
+        aside, the new one renamed in and the old one removed, so the
+        target is briefly missing but never truncated; it is restored if
+        the second rename fails.
+        """
+        if self._posix_rename is not False:
+            try:
+                self.sftp.posix_rename(tmp_path, target)
+                self._posix_rename = True
+                return
+            except SFTPOperationUnsupported:
+                # Mọi lỗi khác (quyền, quota, ...) được ném ra như bình thường
+                self._posix_rename = False
+        
+        if not exists:
+            self.sftp.rename(tmp_path, target)
+            return
+        
+        backup_path = f'{tmp_path}.old'
+        self.sftp.rename(target, backup_path)
+        try:
+            self.sftp.rename(tmp_path, target)
+        except Exception:
+            self.sftp.rename(backup_path, target)
+            raise
+        try:
+            self.sftp.remove(backup_path)
+        except IOError as e:
+            print(f"Could not remove {backup_path} on {self.hostname}: {str(e)}")
+    
+    def _write_in_place(self, target, chunks):
+        """Truncate and rewrite the target itself (not atomic)"""
+        written = 0
+        with self.sftp.open(target, 'wb') as f:
+            f.set_pipelined(True)
+            for chunk in chunks:
+                if chunk:
+                    f.write(chunk)
+                    written += len(chunk)
+        return written
+    
+    def set_keepalive(self, interval):
+        """Send transport keepalives every interval seconds"""
+        transport = self.client.get_transport() if self.client else None
+        if transport is not None and interval:
+            transport.set_keepalive(interval)
+    
+    def check_health(self):
+        """Round-trip an SSH_MSG_IGNORE to make sure the peer is still there"""
+        if not self.is_alive():
+            return False
+        try:
+            self.client.get_transport().send_ignore()
+            return True
+        except Exception:
+            return False
+    
+    def is_alive(self):
+        """Check whether the underlying transport is still usable"""
+        if not self.client:
+            return False
+        transport = self.client.get_transport()
+        return transport is not None and transport.is_active()
+    
     def close(self):
         """Close SSH connection"""
-        if self.sftp:
-            self.sftp.close()
+        if self._sftp:
+            self._sftp.close()
+            self._sftp = None
         if self.client:
-            self.client.close() 
\ No newline at end of file
+            self.client.close() 
+
+
+def phase_timings_ms(timings):
+    """Phase timings in seconds -> milliseconds, as stored in CommandLog.phase_timings"""
+    return {phase: round(seconds * 1000, 2) for phase, seconds in timings.items()}
+
+def create_ssh_client(hostname, port, username, password, authentication_method='password', engine='paramiko'):
+    """Build an SSH client for the configured engine ('paramiko' or 'asyncssh')"""
+    if engine == 'asyncssh':
+        from app.utils.async_ssh_client import AsyncSSHClient
+        return AsyncSSHClient(hostname, port, username, password, authentication_method)
+    return SSHClient(hostname, port, username, password, authentication_method)
\ No newline at end of file
@@ -0,0 +1,303 @@
+import threading
+import time
+from app.utils.ssh_client import SSHClient, create_ssh_client
+
+
+class PooledConnection:
+    """An authenticated SSHClient kept alive by the pool"""
+
+    def __init__(self, key, client):
+        self.key = key
+        self.client = client
+        self.sessions = set()
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.last_checked = self.created_at
+
+    def touch(self):
+        self.last_used = time.monotonic()
+
+
+class SSHConnectionPool:
+    """Keeps SSH connections open for the lifetime of active sessions.
+
+    Connections are keyed by device (host, port, username). Each active
+    session is bound to one connection; once the per-device cap is reached,
+    new sessions share the least loaded connection (paramiko multiplexes
+    channels over one transport). Callers only bind ACTIVE sessions.
+    A background reaper closes connections that no session is bound to
+    once they were unused for longer than the idle timeout, and bound ones
+    after the (longer) bound idle timeout: a quiet session does not pay a
+    reconnect, but a binding that is never released (the session was
+    ended through another worker, or abandoned) does not keep the
+    transport open forever.
+    """
+
+    def __init__(self, app=None):
+        self.idle_timeout = 300
+        self.bound_idle_timeout = 1800
+        self.max_per_device = 4
+        self.health_check_interval = 30
+        self.keepalive_interval = 30
+        self.engine = 'paramiko'
+        self._lock = threading.Condition()
+        self._connections = {}
+        self._pending = {}
+        self._by_session = {}
+        self._reaper = None
+        self.stats = {
+            'created': 0,
+            'reused': 0,
+            'evicted': 0,
+            'failed_health_checks': 0
+        }
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.idle_timeout = app.config.get('SSH_POOL_IDLE_TIMEOUT', self.idle_timeout)
+        self.bound_idle_timeout = app.config.get('SSH_POOL_BOUND_IDLE_TIMEOUT', self.bound_idle_timeout)
+        self.max_per_device = app.config.get('SSH_POOL_MAX_PER_DEVICE', self.max_per_device)
+        self.health_check_interval = app.config.get(
+            'SSH_POOL_HEALTH_CHECK_INTERVAL', self.health_check_interval)
+        self.keepalive_interval = app.config.get('SSH_POOL_KEEPALIVE', self.keepalive_interval)
+        self.engine = app.config.get('SSH_ENGINE', self.engine)
+        app.extensions['ssh_pool'] = self
+
+    @staticmethod
+    def device_key(device):
+        return (device.ip_address, device.ssh_port, device.username)
+
+    def checkout(self, session_id, device, timings=None):
+        """Return a connected SSHClient bound to the given session.
+        
+        If a timings dict is given it receives the seconds spent in checkout
+        and, when a new connection had to be opened for it, the client's
+        connect and auth phases (which are part of the checkout time).
+        """
+        if timings is None:
+            return self._checkout(session_id, device)
+        
+        started = time.perf_counter()
+        client = self._checkout(session_id, device)
+        timings['checkout'] = time.perf_counter() - started
+        if client.connected_at is not None and client.connected_at >= started:
+            timings.update(client.timings)
+        return client
+    
+    def _checkout(self, session_id, device):
+        self._start_reaper()
+        key = self.device_key(device)
+
+        with self._lock:
+            conn = self._by_session.get(session_id)
+            if conn is not None and conn.key != key:
+                self._unbind(session_id)
+                conn = None
+            if conn is not None:
+                conn.touch()
+
+        if conn is not None:
+            if self._healthy(conn):
+                with self._lock:
+                    self.stats['reused'] += 1
+                return conn.client
+            self._evict(conn)
+
+        conn = self._acquire(key, device)
+        with self._lock:
+            conn.sessions.add(session_id)
+            self._by_session[session_id] = conn
+        return conn.client
+
+    def release_session(self, session_id):
+        """Unbind a session; its connection stays pooled until it goes idle"""
+        with self._lock:
+            self._unbind(session_id)
+
+    def discard_session(self, session_id, force=True):
+        """Drop the connection bound to a session after an SSH error.
+
+        A dead transport is always closed. With force=True a live one is
+        closed too if no other session shares it; otherwise only this
+        session is unbound, so its next checkout gets a fresh binding and
+        the other sessions keep their transport.
+        """
+        with self._lock:
+            conn = self._by_session.get(session_id)
+            if conn is None:
+                return
+            shared = conn.sessions != {session_id}
+        if not conn.client.is_alive():
+            self._evict(conn)
+        elif force:
+            if shared:
+                self.release_session(session_id)
+            else:
+                self._evict(conn)
+
+    def evict_idle(self):
+        """Close every connection unused for longer than its idle timeout.
+
+        Unbound connections use idle_timeout, bound ones bound_idle_timeout.
+        """
+        now = time.monotonic()
+        with self._lock:
+            expired = [
+                conn
+                for conns in self._connections.values()
+                for conn in conns
+                if now - conn.last_used > (self.bound_idle_timeout if conn.sessions else self.idle_timeout)
+            ]
+        for conn in expired:
+            self._evict(conn)
+        return len(expired)
+
+    def close_all(self):
+        with self._lock:
+            conns = [conn for conns in self._connections.values() for conn in conns]
+        for conn in conns:
+            self._evict(conn)
+
+    def get_stats(self):
+        with self._lock:
+            total = sum(len(conns) for conns in self._connections.values())
+            in_use = sum(
+                1 for conns in self._connections.values() for conn in conns if conn.sessions
+            )
+            return dict(
+                self.stats,
+                devices=len(self._connections),
+                connections=total,
+                in_use=in_use,
+                idle=total - in_use,
+                sessions=len(self._by_session),
+                pending=sum(self._pending.values()),
+                sftp=SSHClient.get_sftp_stats()
+            )
+
+    def _acquire(self, key, device):
+        while True:
+            with self._lock:
+                conns = self._connections.setdefault(key, [])
+                idle = [conn for conn in conns if not conn.sessions]
+                candidate = None
+
+                if idle:
+                    candidate = max(idle, key=lambda conn: conn.last_used)
+                elif len(conns) + self._pending.get(key, 0) < self.max_per_device:
+                    self._pending[key] = self._pending.get(key, 0) + 1
+                elif conns:
+                    # Cap reached: share the least loaded transport
+                    candidate = min(conns, key=lambda conn: len(conn.sessions))
+                else:
+                    # Every slot is still handshaking, wait for one to finish
+                    self._lock.wait(timeout=1)
+                    continue
+
+                if candidate is not None:
+                    candidate.touch()
+
+            if candidate is None:
+                return self._connect(key, device)
+
+            if self._healthy(candidate):
+                with self._lock:
+                    self.stats['reused'] += 1
+                return candidate
+            self._evict(candidate)
+
+    def _connect(self, key, device):
+        try:
+            client = create_ssh_client(
+                hostname=device.ip_address,
+                port=device.ssh_port,
+                username=device.username,
+                password=device.password,
+                authentication_method=device.authentication_method,
+                engine=self.engine
+            )
+            if self.engine == 'asyncssh':
+                client.set_keepalive(self.keepalive_interval)
+                client.connect()
+            else:
+                client.connect()
+                client.set_keepalive(self.keepalive_interval)
+        except Exception:
+            with self._lock:
+                self._pending[key] -= 1
+                self._lock.notify_all()
+            raise
+
+        conn = PooledConnection(key, client)
+        with self._lock:
+            self._pending[key] -= 1
+            self._connections.setdefault(key, []).append(conn)
+            self.stats['created'] += 1
+            self._lock.notify_all()
+        return conn
+
+    def _healthy(self, conn):
+        if not conn.client.is_alive():
+            with self._lock:
+                self.stats['failed_health_checks'] += 1
+            return False
+
+        now = time.monotonic()
+        if now - conn.last_checked < self.health_check_interval:
+            return True
+
+        if not conn.client.check_health():
+            with self._lock:
+                self.stats['failed_health_checks'] += 1
+            return False
+
+        conn.last_checked = now
+        return True
+
+    def _evict(self, conn):
+        with self._lock:
+            conns = self._connections.get(conn.key, [])
+            if conn not in conns:
+                return
+            conns.remove(conn)
+            if not conns and not self._pending.get(conn.key):
+                self._connections.pop(conn.key, None)
+            for session_id in list(conn.sessions):
+                self._by_session.pop(session_id, None)
+            conn.sessions.clear()
+            self.stats['evicted'] += 1
+            self._lock.notify_all()
+
+        try:
+            conn.client.close()
+        except Exception as e:
+            print(f"Error closing pooled SSH connection to {conn.key[0]}:{conn.key[1]}: {str(e)}")
+
+    def _unbind(self, session_id):
+        conn = self._by_session.pop(session_id, None)
+        if conn is not None:
+            conn.sessions.discard(session_id)
+            conn.touch()
+
+    def _start_reaper(self):
+        if self._reaper is not None and self._reaper.is_alive():
+            return
+        with self._lock:
+            if self._reaper is not None and self._reaper.is_alive():
+                return
+            self._reaper = threading.Thread(
+                target=self._reap_loop, name='ssh-pool-reaper', daemon=True)
+            self._reaper.start()
+
+    def _reap_loop(self):
+        while True:
+            time.sleep(max(1, min(self.idle_timeout, 30)))
+            try:
+                self.evict_idle()
+            except Exception as e:
+                print(f"Error evicting idle SSH connections: {str(e)}")
+
+
+ssh_pool = SSHConnectionPool()
@@ -0,0 +1,65 @@
+import re
+import sys
+import timeit
+from app.utils.file_edit_detector import detect_file_edits
+
+# Lệnh thực tế mà operator thường chạy trên thiết bị
+CORPUS = [
+    'uptime',
+    'df -h',
+    'free -m',
+    'ps aux | grep python',
+    'cat /tmp/aiot_test/test1.txt',
+    'tail -n 100 /var/log/syslog',
+    'journalctl -u nginx --since "1 hour ago" | tail -n 50',
+    'mkdir -p /tmp/aiot_test',
+    'touch /tmp/aiot_test/test1.txt',
+    'echo "Hello AIoT" > /tmp/aiot_test/test1.txt',
+    'echo "Temperature: 25C" >> /var/log/aiot/temp.log',
+    'dmesg | tee /tmp/dmesg.txt',
+    'cat /etc/hosts | sudo tee -a /etc/hosts.bak /tmp/hosts.copy',
+    'sed -i "s/^PermitRootLogin.*/PermitRootLogin no/" /etc/ssh/sshd_config',
+    'rm -f /tmp/aiot_test/a.txt /tmp/aiot_test/b.txt',
+    'systemctl restart nginx 2>&1 | tee -a /var/log/restart.log',
+    'cp /etc/nginx/nginx.conf /etc/nginx/nginx.conf.bak && echo ok',
+    'find /var/log -name "*.gz" -mtime +7 2>/dev/null',
+]
+
+
+def legacy_detect_file_edit(raw_command):
+    """The previous detector: three regex searches with a dict rebuilt per call"""
+    file_edit_patterns = {
+        'create': r'(?:touch|mkdir|>)\s+([^\s]+)',
+        'modify': r'(?:echo|cat|sed|awk)\s+.*?>\s+([^\s]+)',
+        'delete': r'(?:rm|rmdir)\s+([^\s]+)'
+    }
+
+    for edit_type, pattern in file_edit_patterns.items():
+        match = re.search(pattern, raw_command)
+        if match:
+            return edit_type, match.group(1)
+
+    return None, None
+
+
+def bench(func, number):
+    elapsed = min(timeit.repeat(lambda: [func(command) for command in CORPUS], number=number, repeat=5))
+    return elapsed / (number * len(CORPUS)) * 1e6
+
+
+def main():
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+
+    print(f"\n=== Benchmark phát hiện lệnh chỉnh sửa file ({len(CORPUS)} lệnh x {number} lần) ===\n")
+    for command in CORPUS:
+        print(f"{command[:60]:<60}  {legacy_detect_file_edit(command)}  ->  "
+              f"{[tuple(edit) for edit in detect_file_edits(command)]}")
+
+    legacy = bench(legacy_detect_file_edit, number)
+    current = bench(detect_file_edits, number)
+    print(f"\nlegacy regex detector : {legacy:.2f} µs/command")
+    print(f"single-pass tokenizer : {current:.2f} µs/command")
+
+
+if __name__ == '__main__':
+    main()
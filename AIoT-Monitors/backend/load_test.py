@@ -0,0 +1,274 @@
+import argparse
+import json
+import math
+import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+import requests
+
+SCENARIOS = ('interactive', 'stream', 'fanout')
+
+
+class Recorder:
+    """Latencies and outcomes of one measured phase"""
+
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self.latencies = []
+        self.first_bytes = []
+        self.outcomes = Counter()
+
+    def record(self, latency, outcome, first_byte=None):
+        with self._lock:
+            self.outcomes[outcome] += 1
+            if outcome == 'ok':
+                self.latencies.append(latency)
+                if first_byte is not None:
+                    self.first_bytes.append(first_byte)
+
+    def report(self, elapsed):
+        total = sum(self.outcomes.values())
+        print(f"\n--- {self.name} ---")
+        print(f"requests: {total}  ok: {self.outcomes['ok']}  elapsed: {elapsed:.2f}s  "
+              f"throughput: {self.outcomes['ok'] / elapsed if elapsed else 0:.1f}/s")
+        failures = {outcome: count for outcome, count in self.outcomes.items() if outcome != 'ok'}
+        if failures:
+            print(f"failures: {failures}")
+        _print_percentiles('latency', self.latencies)
+        _print_percentiles('first byte', self.first_bytes)
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of a sorted list"""
+    if not values:
+        return None
+    index = min(len(values) - 1, max(0, math.ceil(q / 100 * len(values)) - 1))
+    return values[index]
+
+
+def _print_percentiles(label, values):
+    if not values:
+        return
+    values = sorted(values)
+    parts = [f"p{q}={percentile(values, q) * 1000:.1f}ms" for q in (50, 90, 95, 99)]
+    print(f"{label:<11} min={values[0] * 1000:.1f}ms {' '.join(parts)} max={values[-1] * 1000:.1f}ms")
+
+
+class ApiClient:
+    """Thread-safe wrapper: one keep-alive HTTP session per worker thread"""
+
+    def __init__(self, base_url, timeout):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.token = None
+        self._local = threading.local()
+
+    @property
+    def http(self):
+        http = getattr(self._local, 'http', None)
+        if http is None:
+            http = self._local.http = requests.Session()
+            http.headers['Authorization'] = f"Bearer {self.token}"
+        return http
+
+    def login(self, username, password):
+        response = requests.post(f"{self.base_url}/api/auth/login",
+                                 json={'username': username, 'password': password}, timeout=self.timeout)
+        if response.status_code != 200:
+            raise RuntimeError(f"Login failed ({response.status_code}): {response.text}")
+        self.token = response.json()['access_token']
+
+    def request(self, method, path, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        return self.http.request(method, f"{self.base_url}{path}", **kwargs)
+
+
+def iter_sse(response):
+    """Yield (event, payload) from a text/event-stream response"""
+    event = None
+    for line in response.iter_lines(decode_unicode=True):
+        if line.startswith('event: '):
+            event = line[7:]
+        elif line.startswith('data: '):
+            yield event, json.loads(line[6:])
+            event = None
+
+
+def find_devices(api, group_name, limit):
+    response = api.request('GET', '/api/devices/groups')
+    response.raise_for_status()
+    groups = [group for group in response.json()['device_groups'] if group['name'] == group_name]
+    if not groups:
+        raise RuntimeError(f"Device group '{group_name}' not found (run ssh_device_simulator.py --register)")
+    group_id = groups[0]['id']
+
+    response = api.request('GET', f"/api/devices/groups/{group_id}/devices")
+    response.raise_for_status()
+    device_ids = [device['id'] for device in response.json()['devices']]
+    return group_id, device_ids[:limit] if limit else device_ids
+
+
+def open_sessions(api, device_ids, concurrency):
+    def open_one(device_id):
+        response = api.request('POST', '/api/sessions', json={'device_id': device_id})
+        if response.status_code != 201:
+            print(f"Could not open a session on device {device_id}: {response.text}")
+            return None
+        return response.json()['session']['id']
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return [session_id for session_id in executor.map(open_one, device_ids) if session_id]
+
+
+def close_sessions(api, session_ids, concurrency):
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(lambda session_id: api.request('PUT', f"/api/sessions/{session_id}", json={}),
+                          session_ids))
+
+
+def run_interactive(api, command, recorder):
+    def task(session_id):
+        started = time.perf_counter()
+        try:
+            response = api.request('POST', f"/api/sessions/{session_id}/commands", json={'command': command})
+        except requests.RequestException as e:
+            recorder.record(None, type(e).__name__)
+            return
+        outcome = 'ok' if response.status_code == 200 else f"http_{response.status_code}"
+        recorder.record(time.perf_counter() - started, outcome)
+    return task
+
+
+def run_stream(api, command, recorder):
+    def task(session_id):
+        started = time.perf_counter()
+        first_byte = None
+        outcome = 'incomplete'
+        try:
+            with api.request('POST', f"/api/sessions/{session_id}/commands/stream",
+                             json={'command': command}, stream=True) as response:
+                if response.status_code != 200:
+                    recorder.record(None, f"http_{response.status_code}")
+                    return
+                for event, payload in iter_sse(response):
+                    if event == 'output' and first_byte is None:
+                        first_byte = time.perf_counter() - started
+                    elif event == 'done':
+                        outcome = 'ok'
+                    elif event == 'error':
+                        outcome = 'stream_error'
+        except requests.RequestException as e:
+            outcome = type(e).__name__
+        recorder.record(time.perf_counter() - started, outcome, first_byte)
+    return task
+
+
+def run_fanout(api, target, command, fanout_concurrency, recorder, device_recorder):
+    """target is {'group_id': ...} or {'device_ids': [...]}, as the batch endpoint takes them"""
+    def task(_):
+        payload = dict(target, command=command, stream=True)
+        if fanout_concurrency:
+            payload['concurrency'] = fanout_concurrency
+        started = time.perf_counter()
+        first_byte = None
+        outcome = 'incomplete'
+        try:
+            with api.request('POST', '/api/sessions/batch', json=payload, stream=True) as response:
+                if response.status_code != 200:
+                    recorder.record(None, f"http_{response.status_code}")
+                    return
+                for event, result in iter_sse(response):
+                    elapsed = time.perf_counter() - started
+                    if event == 'result':
+                        first_byte = elapsed if first_byte is None else first_byte
+                        device_recorder.record(elapsed, 'ok' if result['status'] == 'success' else result['status'])
+                    elif event == 'done':
+                        outcome = 'ok'
+        except requests.RequestException as e:
+            outcome = type(e).__name__
+        recorder.record(time.perf_counter() - started, outcome, first_byte)
+    return task
+
+
+def drive(task, items, concurrency):
+    """Run task over items with concurrency worker threads; return the wall time"""
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(task, items))
+    return time.perf_counter() - started
+
+
+def print_server_stats(args):
+    """SSH pool and log writer counters, read with an admin account"""
+    api = ApiClient(args.api, args.timeout)
+    try:
+        api.login(args.stats_username, args.stats_password)
+        for path in ('/api/sessions/ssh-pool', '/api/sessions/log-writer'):
+            response = api.request('GET', path)
+            print(f"\n{path}: {json.dumps(response.json(), indent=2)}")
+    except Exception as e:
+        print(f"Could not read server stats: {str(e)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Tải thử API với các thiết bị từ ssh_device_simulator.py')
+    parser.add_argument('scenario', choices=SCENARIOS)
+    parser.add_argument('--api', default=os.environ.get('API_URL', 'http://localhost:8000'))
+    parser.add_argument('--username', default=os.environ.get('LOAD_TEST_USERNAME', 'operator_user'))
+    parser.add_argument('--password', default=os.environ.get('LOAD_TEST_PASSWORD', 'operator123'))
+    parser.add_argument('--group', default='Simulated Devices')
+    parser.add_argument('--devices', type=int, default=0, help='use only the first N devices (0 = all)')
+    parser.add_argument('--command', default='uptime')
+    parser.add_argument('--requests', type=int, default=1000, help='commands (or batches for fanout) to send')
+    parser.add_argument('--concurrency', type=int, default=32, help='concurrent HTTP clients')
+    parser.add_argument('--warmup', type=int, default=1, help='unmeasured commands per session first')
+    parser.add_argument('--fanout-concurrency', type=int, default=None, help='server-side fan-out concurrency')
+    parser.add_argument('--timeout', type=float, default=120.0)
+    parser.add_argument('--stats-username', default=None, help='admin account for /ssh-pool and /log-writer')
+    parser.add_argument('--stats-password', default=None)
+    args = parser.parse_args()
+
+    api = ApiClient(args.api, args.timeout)
+    api.login(args.username, args.password)
+    group_id, device_ids = find_devices(api, args.group, args.devices)
+    print(f"\n=== {args.scenario}: {len(device_ids)} devices, {args.requests} requests, "
+          f"concurrency {args.concurrency}, command '{args.command}' ===")
+
+    if args.scenario == 'fanout':
+        recorder = Recorder('batch (whole group)')
+        device_recorder = Recorder('per-device result arrival')
+        target = {'device_ids': device_ids} if args.devices else {'group_id': group_id}
+        task = run_fanout(api, target, args.command, args.fanout_concurrency, recorder, device_recorder)
+        elapsed = drive(task, range(args.requests), args.concurrency)
+        recorder.report(elapsed)
+        device_recorder.report(elapsed)
+    else:
+        session_ids = open_sessions(api, device_ids, args.concurrency)
+        if not session_ids:
+            print("No session could be opened, check the operator's profiles")
+            return
+        try:
+            runner = run_interactive if args.scenario == 'interactive' else run_stream
+            # Lượt đầu tiên mở kết nối SSH; đo riêng để thấy lợi ích của pool
+            warmup = Recorder('warm-up (includes SSH connect)')
+            elapsed = drive(runner(api, args.command, warmup),
+                            session_ids * args.warmup, args.concurrency)
+            if args.warmup:
+                warmup.report(elapsed)
+
+            recorder = Recorder(f"{args.scenario} (pooled connections)")
+            items = [session_ids[i % len(session_ids)] for i in range(args.requests)]
+            elapsed = drive(runner(api, args.command, recorder), items, args.concurrency)
+            recorder.report(elapsed)
+        finally:
+            close_sessions(api, session_ids, args.concurrency)
+
+    if args.stats_username:
+        print_server_stats(args)
+
+
+if __name__ == '__main__':
+    main()
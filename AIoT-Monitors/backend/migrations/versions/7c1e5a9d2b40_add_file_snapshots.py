@@ -0,0 +1,44 @@
+"""add content-addressed file snapshots
+
+Revision ID: 7c1e5a9d2b40
+Revises: 423f32cac2a1
+Create Date: 2026-10-18 13:05:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c1e5a9d2b40'
+down_revision = '423f32cac2a1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('file_snapshots',
+        sa.Column('content_hash', sa.String(length=64), nullable=False),
+        sa.Column('data', sa.LargeBinary(), nullable=False),
+        sa.Column('size', sa.Integer(), nullable=False),
+        sa.Column('compressed_size', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint('content_hash')
+    )
+    with op.batch_alter_table('file_edit_logs', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('content_before_hash', sa.String(length=64), nullable=True))
+        batch_op.add_column(sa.Column('content_after_hash', sa.String(length=64), nullable=True))
+        batch_op.create_foreign_key('file_edit_logs_content_before_hash_fkey', 'file_snapshots',
+                                    ['content_before_hash'], ['content_hash'])
+        batch_op.create_foreign_key('file_edit_logs_content_after_hash_fkey', 'file_snapshots',
+                                    ['content_after_hash'], ['content_hash'])
+
+
+def downgrade():
+    with op.batch_alter_table('file_edit_logs', schema=None) as batch_op:
+        batch_op.drop_constraint('file_edit_logs_content_after_hash_fkey', type_='foreignkey')
+        batch_op.drop_constraint('file_edit_logs_content_before_hash_fkey', type_='foreignkey')
+        batch_op.drop_column('content_after_hash')
+        batch_op.drop_column('content_before_hash')
+
+    op.drop_table('file_snapshots')
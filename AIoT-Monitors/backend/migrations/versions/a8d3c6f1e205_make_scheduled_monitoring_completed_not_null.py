@@ -0,0 +1,33 @@
+"""make scheduled_monitoring.completed NOT NULL
+
+Revision ID: a8d3c6f1e205
+Revises: f0c4b8e2d671
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a8d3c6f1e205'
+down_revision = 'f0c4b8e2d671'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The pending index is partial on completed = FALSE: NULLs would never use it
+    op.execute("UPDATE scheduled_monitoring SET completed = FALSE WHERE completed IS NULL")
+    with op.batch_alter_table('scheduled_monitoring', schema=None) as batch_op:
+        batch_op.alter_column('completed', existing_type=sa.Boolean(),
+                              nullable=False, server_default=sa.text('FALSE'))
+    op.execute("CREATE INDEX IF NOT EXISTS idx_scheduled_monitoring_pending "
+               "ON scheduled_monitoring(scheduled_time) WHERE completed = FALSE")
+
+
+def downgrade():
+    op.execute("DROP INDEX IF EXISTS idx_scheduled_monitoring_pending")
+    with op.batch_alter_table('scheduled_monitoring', schema=None) as batch_op:
+        batch_op.alter_column('completed', existing_type=sa.Boolean(),
+                              nullable=True, server_default=sa.text('FALSE'))
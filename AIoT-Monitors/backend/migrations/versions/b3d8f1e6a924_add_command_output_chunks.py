@@ -0,0 +1,39 @@
+"""spill large command output to compressed chunks
+
+Revision ID: b3d8f1e6a924
+Revises: 7c1e5a9d2b40
+Create Date: 2026-10-18 15:20:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3d8f1e6a924'
+down_revision = '7c1e5a9d2b40'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('command_logs', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('output_size', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('output_chunks', sa.Integer(), nullable=True, server_default='0'))
+
+    op.create_table('command_output_chunks',
+        sa.Column('log_id', sa.Integer(), nullable=False),
+        sa.Column('chunk_index', sa.Integer(), nullable=False),
+        sa.Column('data', sa.LargeBinary(), nullable=False),
+        sa.Column('size', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['log_id'], ['command_logs.log_id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('log_id', 'chunk_index')
+    )
+
+
+def downgrade():
+    op.drop_table('command_output_chunks')
+
+    with op.batch_alter_table('command_logs', schema=None) as batch_op:
+        batch_op.drop_column('output_chunks')
+        batch_op.drop_column('output_size')
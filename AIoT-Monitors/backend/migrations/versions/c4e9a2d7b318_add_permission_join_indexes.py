@@ -0,0 +1,31 @@
+"""add indexes for the effective-permission joins
+
+Revision ID: c4e9a2d7b318
+Revises: a8d3c6f1e205
+Create Date: 2026-10-19 14:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4e9a2d7b318'
+down_revision = 'a8d3c6f1e205'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Databases created from DB.sql already have them
+    op.execute("CREATE INDEX IF NOT EXISTS idx_user_profiles_active "
+               "ON user_profiles(user_id, profile_id) WHERE is_active = TRUE")
+    op.execute("CREATE INDEX IF NOT EXISTS idx_profiles_group_id ON profiles(group_id)")
+    op.execute("CREATE INDEX IF NOT EXISTS idx_profiles_list_id ON profiles(list_id)")
+    op.execute("CREATE INDEX IF NOT EXISTS idx_commands_list_id ON commands(list_id)")
+
+
+def downgrade():
+    op.execute("DROP INDEX IF EXISTS idx_commands_list_id")
+    op.execute("DROP INDEX IF EXISTS idx_profiles_list_id")
+    op.execute("DROP INDEX IF EXISTS idx_profiles_group_id")
+    op.execute("DROP INDEX IF EXISTS idx_user_profiles_active")
@@ -0,0 +1,31 @@
+"""add indexes for keyset pagination
+
+Revision ID: e5a27c4f9b13
+Revises: b3d8f1e6a924
+Create Date: 2026-10-18 16:40:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5a27c4f9b13'
+down_revision = 'b3d8f1e6a924'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('idx_sessions_start_time_id', 'sessions',
+                    [sa.text('start_time DESC'), sa.text('session_id DESC')])
+    op.create_index('idx_command_logs_session_executed', 'command_logs',
+                    ['session_id', 'executed_at', 'log_id'])
+    op.create_index('idx_file_edit_logs_started_id', 'file_edit_logs',
+                    [sa.text('edit_started_at DESC'), sa.text('log_id DESC')])
+
+
+def downgrade():
+    op.drop_index('idx_file_edit_logs_started_id', table_name='file_edit_logs')
+    op.drop_index('idx_command_logs_session_executed', table_name='command_logs')
+    op.drop_index('idx_sessions_start_time_id', table_name='sessions')
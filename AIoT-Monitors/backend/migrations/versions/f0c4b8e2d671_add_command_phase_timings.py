@@ -0,0 +1,27 @@
+"""add per-phase SSH timings to command logs
+
+Revision ID: f0c4b8e2d671
+Revises: e5a27c4f9b13
+Create Date: 2026-10-18 19:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'f0c4b8e2d671'
+down_revision = 'e5a27c4f9b13'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('command_logs', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('phase_timings', postgresql.JSONB(astext_type=sa.Text()), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('command_logs', schema=None) as batch_op:
+        batch_op.drop_column('phase_timings')
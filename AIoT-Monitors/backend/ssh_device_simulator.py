@@ -0,0 +1,575 @@
+import argparse
+import functools
+import os
+import posixpath
+import random
+import selectors
+import socket
+import stat
+import threading
+import time
+import paramiko
+
+# Lệnh mô phỏng, đăng ký vào command list của nhóm "Simulated Devices"
+SIMULATOR_COMMANDS = [
+    ('uptime', 'Default simulated command'),
+    ('hostname', 'Default simulated command'),
+    ('sim output {bytes}', 'Print the given number of bytes'),
+    ('sim sleep {ms}', 'Wait the given number of milliseconds, then exit'),
+    ('sim exit {code}', 'Exit with the given status code'),
+    ('sim stream {lines} {interval_ms}', 'Print one line every interval_ms milliseconds'),
+]
+
+SEED_FILES = {
+    '/etc/hostname': None,
+    '/etc/device.conf': b'mode=auto\ninterval=30\nthreshold=75\n',
+    '/var/log/syslog': None,
+}
+SEED_DIRS = ('/', '/etc', '/tmp', '/var', '/var/log')
+SEND_CHUNK_SIZE = 32768
+
+
+@functools.lru_cache(maxsize=64)
+def synthetic_output(size):
+    """Deterministic text of exactly size bytes, built once per size"""
+    line = b'sim-device: sensor=temperature value=23.5 status=ok ' + b'x' * 12 + b'\n'
+    return (line * (size // len(line) + 1))[:size]
+
+
+class SimulatorStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.values = {
+            'connections': 0,
+            'active_connections': 0,
+            'refused': 0,
+            'auth_failures': 0,
+            'commands': 0,
+            'errors': 0,
+            'dropped': 0,
+            'hung': 0,
+            'sftp_sessions': 0,
+            'bytes_sent': 0
+        }
+
+    def count(self, key, amount=1):
+        with self._lock:
+            self.values[key] += amount
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.values)
+
+
+class MemoryFilesystem:
+    """Per-device in-memory files served over SFTP"""
+
+    def __init__(self, hostname, log_bytes):
+        self.lock = threading.Lock()
+        self.dirs = set(SEED_DIRS)
+        self.files = {}
+        self.modes = {}
+        for path, data in SEED_FILES.items():
+            if path == '/etc/hostname':
+                data = f"{hostname}\n".encode('utf-8')
+            elif data is None:
+                data = synthetic_output(log_bytes)
+            self.files[path] = bytearray(data)
+            self.modes[path] = 0o644
+
+    def attributes(self, path):
+        with self.lock:
+            if path in self.files:
+                attr = paramiko.SFTPAttributes()
+                attr.st_size = len(self.files[path])
+                attr.st_mode = stat.S_IFREG | self.modes.get(path, 0o644)
+            elif path in self.dirs:
+                attr = paramiko.SFTPAttributes()
+                attr.st_size = 4096
+                attr.st_mode = stat.S_IFDIR | 0o755
+            else:
+                return paramiko.SFTP_NO_SUCH_FILE
+        attr.st_uid = attr.st_gid = 0
+        attr.st_atime = attr.st_mtime = int(time.time())
+        attr.filename = posixpath.basename(path) or '/'
+        return attr
+
+
+class MemoryHandle(paramiko.SFTPHandle):
+    def __init__(self, filesystem, path, flags):
+        super().__init__(flags)
+        self.filesystem = filesystem
+        self.path = path
+
+    def read(self, offset, length):
+        with self.filesystem.lock:
+            data = self.filesystem.files.get(self.path)
+            if data is None:
+                return paramiko.SFTP_NO_SUCH_FILE
+            return bytes(data[offset:offset + length])
+
+    def write(self, offset, data):
+        with self.filesystem.lock:
+            buffer = self.filesystem.files.setdefault(self.path, bytearray())
+            if len(buffer) < offset:
+                buffer.extend(b'\0' * (offset - len(buffer)))
+            buffer[offset:offset + len(data)] = data
+        return paramiko.SFTP_OK
+
+    def stat(self):
+        return self.filesystem.attributes(self.path)
+
+    def chattr(self, attr):
+        if attr.st_mode is not None:
+            with self.filesystem.lock:
+                self.filesystem.modes[self.path] = stat.S_IMODE(attr.st_mode)
+        return paramiko.SFTP_OK
+
+
+class MemorySFTPServer(paramiko.SFTPServerInterface):
+    """SFTP subsystem over a MemoryFilesystem (enough for read/edit/upload)"""
+
+    def __init__(self, server, filesystem, stats, *args, **kwargs):
+        super().__init__(server, *args, **kwargs)
+        self.filesystem = filesystem
+        stats.count('sftp_sessions')
+
+    def canonicalize(self, path):
+        return posixpath.normpath(posixpath.join('/', path))
+
+    def open(self, path, flags, attr):
+        path = self.canonicalize(path)
+        fs = self.filesystem
+        with fs.lock:
+            if posixpath.dirname(path) not in fs.dirs:
+                return paramiko.SFTP_NO_SUCH_FILE
+            exists = path in fs.files
+            if not exists and not flags & os.O_CREAT:
+                return paramiko.SFTP_NO_SUCH_FILE
+            if exists and flags & os.O_CREAT and flags & os.O_EXCL:
+                return paramiko.SFTP_FAILURE
+            if not exists or flags & os.O_TRUNC:
+                fs.files[path] = bytearray()
+                fs.modes.setdefault(path, 0o644)
+        return MemoryHandle(fs, path, flags)
+
+    def stat(self, path):
+        return self.filesystem.attributes(self.canonicalize(path))
+
+    lstat = stat
+
+    def list_folder(self, path):
+        path = self.canonicalize(path)
+        fs = self.filesystem
+        with fs.lock:
+            if path not in fs.dirs:
+                return paramiko.SFTP_NO_SUCH_FILE
+            children = [name for name in list(fs.files) + list(fs.dirs)
+                        if name != path and posixpath.dirname(name) == path]
+        return [attr for attr in (fs.attributes(name) for name in children)
+                if isinstance(attr, paramiko.SFTPAttributes)]
+
+    def remove(self, path):
+        path = self.canonicalize(path)
+        with self.filesystem.lock:
+            if self.filesystem.files.pop(path, None) is None:
+                return paramiko.SFTP_NO_SUCH_FILE
+            self.filesystem.modes.pop(path, None)
+        return paramiko.SFTP_OK
+
+    def rename(self, oldpath, newpath):
+        if isinstance(self.stat(newpath), paramiko.SFTPAttributes):
+            return paramiko.SFTP_FAILURE
+        return self.posix_rename(oldpath, newpath)
+
+    def posix_rename(self, oldpath, newpath):
+        oldpath, newpath = self.canonicalize(oldpath), self.canonicalize(newpath)
+        fs = self.filesystem
+        with fs.lock:
+            if oldpath not in fs.files:
+                return paramiko.SFTP_NO_SUCH_FILE
+            fs.files[newpath] = fs.files.pop(oldpath)
+            fs.modes[newpath] = fs.modes.pop(oldpath, 0o644)
+        return paramiko.SFTP_OK
+
+    def chattr(self, path, attr):
+        path = self.canonicalize(path)
+        if attr.st_mode is not None:
+            with self.filesystem.lock:
+                if path not in self.filesystem.files:
+                    return paramiko.SFTP_NO_SUCH_FILE
+                self.filesystem.modes[path] = stat.S_IMODE(attr.st_mode)
+        return paramiko.SFTP_OK
+
+    def mkdir(self, path, attr):
+        with self.filesystem.lock:
+            self.filesystem.dirs.add(self.canonicalize(path))
+        return paramiko.SFTP_OK
+
+    def rmdir(self, path):
+        with self.filesystem.lock:
+            self.filesystem.dirs.discard(self.canonicalize(path))
+        return paramiko.SFTP_OK
+
+
+class SimulatedDevice(paramiko.ServerInterface):
+    """One SSH connection to a simulated device: password auth, exec and SFTP"""
+
+    def __init__(self, simulator, port):
+        self.simulator = simulator
+        self.port = port
+
+    def get_allowed_auths(self, username):
+        return 'password'
+
+    def check_auth_password(self, username, password):
+        config = self.simulator.config
+        if self.simulator.inject(config.auth_failure_rate):
+            self.simulator.stats.count('auth_failures')
+            return paramiko.AUTH_FAILED
+        if username == config.username and password == config.password:
+            return paramiko.AUTH_SUCCESSFUL
+        self.simulator.stats.count('auth_failures')
+        return paramiko.AUTH_FAILED
+
+    def check_channel_request(self, kind, chanid):
+        if kind == 'session':
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_exec_request(self, channel, command):
+        command = command.decode('utf-8', 'replace') if isinstance(command, bytes) else command
+        threading.Thread(
+            target=self.simulator.run_command, args=(channel, self.port, command), daemon=True
+        ).start()
+        return True
+
+    def check_channel_pty_request(self, channel, term, width, height, pixelwidth, pixelheight, modes):
+        return True
+
+
+class DeviceSimulator:
+    """Emulates many SSH devices, one listening port per device.
+
+    All listening sockets share one selector thread; each accepted
+    connection gets a paramiko Transport (its own thread) and each exec
+    request a short-lived worker thread. Devices share one host key and
+    one set of credentials; each device has its own in-memory filesystem.
+    """
+
+    def __init__(self, config, host_key):
+        self.config = config
+        self.host_key = host_key
+        self.stats = SimulatorStats()
+        self._filesystems = {}
+        self._fs_lock = threading.Lock()
+        self._listeners = []
+        self._selector = selectors.DefaultSelector()
+        self._stopped = threading.Event()
+
+    @property
+    def ports(self):
+        return range(self.config.base_port, self.config.base_port + self.config.count)
+
+    def inject(self, rate):
+        return rate > 0 and random.random() < rate
+
+    def hostname(self, port):
+        return f"sim-device-{port}"
+
+    def filesystem(self, port):
+        with self._fs_lock:
+            fs = self._filesystems.get(port)
+            if fs is None:
+                fs = self._filesystems[port] = MemoryFilesystem(self.hostname(port), self.config.log_bytes)
+            return fs
+
+    def start(self):
+        for port in self.ports:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.bind((self.config.host, port))
+            sock.listen(self.config.backlog)
+            sock.setblocking(False)
+            self._selector.register(sock, selectors.EVENT_READ, port)
+            self._listeners.append(sock)
+        threading.Thread(target=self._accept_loop, name='simulator-accept', daemon=True).start()
+
+    def stop(self):
+        self._stopped.set()
+        for sock in self._listeners:
+            try:
+                self._selector.unregister(sock)
+            except Exception:
+                pass
+            sock.close()
+
+    def _accept_loop(self):
+        while not self._stopped.is_set():
+            for key, _ in self._selector.select(timeout=0.5):
+                try:
+                    conn, _ = key.fileobj.accept()
+                except (BlockingIOError, OSError):
+                    continue
+                conn.setblocking(True)
+                threading.Thread(target=self._serve, args=(conn, key.data), daemon=True).start()
+
+    def _serve(self, conn, port):
+        config = self.config
+        if self.inject(config.refuse_rate):
+            self.stats.count('refused')
+            conn.close()
+            return
+        if config.handshake_delay_ms:
+            time.sleep(config.handshake_delay_ms / 1000)
+
+        self.stats.count('connections')
+        self.stats.count('active_connections')
+        transport = paramiko.Transport(conn)
+        try:
+            transport.add_server_key(self.host_key)
+            transport.set_subsystem_handler('sftp', paramiko.SFTPServer, MemorySFTPServer,
+                                            self.filesystem(port), self.stats)
+            transport.start_server(server=SimulatedDevice(self, port))
+            # Nhận các channel đã mở để transport không giữ chúng mãi trong hàng đợi.
+            # Giữ tham chiếu tới chúng: Channel.__del__ đóng channel, và một
+            # channel SFTP chỉ nhận yêu cầu subsystem sau khi đã được accept
+            channels = []
+            while transport.is_active() and not self._stopped.is_set():
+                channel = transport.accept(timeout=1)
+                channels = [open_channel for open_channel in channels if not open_channel.closed]
+                if channel is not None:
+                    channels.append(channel)
+        except Exception as e:
+            if config.verbose:
+                print(f"[simulator] connection on port {port} failed: {str(e)}")
+        finally:
+            transport.close()
+            self.stats.count('active_connections', -1)
+
+    def run_command(self, channel, port, command):
+        """Emulate one exec request on a channel"""
+        config = self.config
+        self.stats.count('commands')
+        latency_ms = max(0.0, config.latency_ms + random.uniform(-config.jitter_ms, config.jitter_ms))
+        words = command.split()
+        try:
+            if self.inject(config.hang_rate):
+                # Không bao giờ trả lời: kiểm tra timeout phía client
+                self.stats.count('hung')
+                while not channel.closed and not self._stopped.is_set():
+                    time.sleep(0.5)
+                return
+
+            time.sleep(latency_ms / 1000)
+
+            if self.inject(config.drop_rate):
+                self.stats.count('dropped')
+                self._send(channel, synthetic_output(config.output_bytes)[:config.output_bytes // 2])
+                channel.get_transport().close()
+                return
+
+            if self.inject(config.error_rate):
+                self.stats.count('errors')
+                channel.sendall_stderr(b'sim: injected failure\n')
+                channel.send_exit_status(1)
+                return
+
+            exit_code = config.exit_code
+            if words[:2] == ['sim', 'output'] and len(words) == 3:
+                self._send(channel, synthetic_output(int(words[2])))
+            elif words[:2] == ['sim', 'sleep'] and len(words) == 3:
+                time.sleep(int(words[2]) / 1000)
+            elif words[:2] == ['sim', 'exit'] and len(words) == 3:
+                exit_code = int(words[2])
+            elif words[:2] == ['sim', 'stream'] and len(words) == 4:
+                for i in range(int(words[2])):
+                    self._send(channel, f"{self.hostname(port)} line {i}\n".encode('utf-8'))
+                    time.sleep(int(words[3]) / 1000)
+            elif words == ['hostname']:
+                self._send(channel, f"{self.hostname(port)}\n".encode('utf-8'))
+            else:
+                self._send(channel, synthetic_output(config.output_bytes))
+            channel.send_exit_status(exit_code)
+        except (ValueError, IndexError):
+            channel.sendall_stderr(f"sim: invalid command: {command}\n".encode('utf-8'))
+            channel.send_exit_status(2)
+        except Exception as e:
+            if config.verbose:
+                print(f"[simulator] command on port {port} failed: {str(e)}")
+        finally:
+            try:
+                channel.close()
+            except Exception:
+                pass
+
+    def _send(self, channel, data):
+        for start in range(0, len(data), SEND_CHUNK_SIZE):
+            channel.sendall(data[start:start + SEND_CHUNK_SIZE])
+        self.stats.count('bytes_sent', len(data))
+
+
+def load_host_key(path):
+    """Load the host key from path, or generate one (and save it if path is set)"""
+    if path and os.path.exists(path):
+        return paramiko.RSAKey(filename=path)
+    key = paramiko.RSAKey.generate(2048)
+    if path:
+        key.write_private_key_file(path)
+    return key
+
+
+def raise_open_file_limit(needed):
+    """Each device needs a listening socket plus one per connection"""
+    try:
+        import resource
+    except ImportError:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != resource.RLIM_INFINITY and soft < needed:
+        target = needed if hard == resource.RLIM_INFINITY else min(needed, hard)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+        if target < needed:
+            print(f"Warning: open file limit is {target}, {needed} may be needed")
+
+
+def register_devices(config, group_name, operator_username=None):
+    """Thêm các thiết bị mô phỏng vào database (giống update_docker_devices.py)"""
+    from app import create_app, db
+    from app.models.device import Device, DeviceGroup
+    from app.models.command import CommandList, Command
+    from app.models.profile import Profile
+    from app.models.user import User, UserProfile, UserRole
+    from app.utils.permission_cache import permission_cache
+
+    app = create_app()
+
+    with app.app_context():
+        admin = User.query.filter_by(role=UserRole.ADMIN).first()
+        if not admin:
+            print("Admin user not found!")
+            return None
+
+        group = DeviceGroup.query.filter_by(group_name=group_name).first()
+        if not group:
+            group = DeviceGroup(
+                group_name=group_name,
+                description="In-process SSH device simulator for load tests",
+                created_by=admin.user_id
+            )
+            db.session.add(group)
+            db.session.commit()
+
+        existing = {
+            (ip_address, port) for ip_address, port in db.session.query(Device.ip_address, Device.ssh_port).filter(
+                Device.group_id == group.group_id
+            ).all()
+        }
+        devices = [
+            Device(
+                device_name=f"sim-device-{port}",
+                ip_address=config.host,
+                device_type="simulator",
+                ssh_port=port,
+                username=config.username,
+                password=config.password,
+                authentication_method="password",
+                created_by=admin.user_id,
+                group_id=group.group_id
+            )
+            for port in range(config.base_port, config.base_port + config.count)
+            if (config.host, port) not in existing
+        ]
+        db.session.add_all(devices)
+
+        # Command list + profile để operator được phép chạy các lệnh mô phỏng
+        command_list = CommandList.query.filter_by(list_name=f"{group_name} commands").first()
+        if not command_list:
+            command_list = CommandList(
+                list_name=f"{group_name} commands",
+                description="Commands understood by ssh_device_simulator.py",
+                created_by=admin.user_id
+            )
+            db.session.add(command_list)
+            db.session.flush()
+            for command_text, description in SIMULATOR_COMMANDS:
+                db.session.add(Command(command_text, description, created_by=admin.user_id,
+                                       list_id=command_list.list_id))
+
+        profile = Profile.query.filter_by(group_id=group.group_id, list_id=command_list.list_id).first()
+        if not profile:
+            profile = Profile(
+                profile_name=f"{group_name} load test",
+                group_id=group.group_id,
+                list_id=command_list.list_id,
+                description="Access to the simulated devices",
+                created_by=admin.user_id
+            )
+            db.session.add(profile)
+            db.session.flush()
+
+        if operator_username:
+            operator = User.query.filter_by(username=operator_username).first()
+            if not operator:
+                print(f"User {operator_username} not found, profile not assigned")
+            elif not UserProfile.query.filter_by(user_id=operator.user_id, profile_id=profile.profile_id).first():
+                db.session.add(UserProfile(operator.user_id, profile.profile_id, assigned_by=admin.user_id))
+
+        db.session.commit()
+        permission_cache.invalidate_all()
+        print(f"Registered {len(devices)} new devices in group '{group_name}' (id {group.group_id})")
+        return group.group_id
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Giả lập nhiều thiết bị SSH trên các cổng local')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--base-port', type=int, default=30000)
+    parser.add_argument('--count', type=int, default=100, help='number of devices (one port each)')
+    parser.add_argument('--username', default=os.environ.get('DEVICE_USERNAME', 'sim'))
+    parser.add_argument('--password', default=os.environ.get('DEVICE_PASSWORD', 'sim'))
+    parser.add_argument('--host-key', default=None, help='RSA host key file, generated if missing')
+    parser.add_argument('--backlog', type=int, default=128)
+    parser.add_argument('--latency-ms', type=float, default=20.0, help='mean command latency')
+    parser.add_argument('--jitter-ms', type=float, default=5.0, help='uniform jitter around the latency')
+    parser.add_argument('--handshake-delay-ms', type=float, default=0.0, help='delay before the SSH banner')
+    parser.add_argument('--output-bytes', type=int, default=1024, help='output size of ordinary commands')
+    parser.add_argument('--log-bytes', type=int, default=65536, help='size of /var/log/syslog on each device')
+    parser.add_argument('--exit-code', type=int, default=0)
+    parser.add_argument('--error-rate', type=float, default=0.0, help='commands exiting 1 with a stderr message')
+    parser.add_argument('--drop-rate', type=float, default=0.0, help='commands whose connection is cut mid-output')
+    parser.add_argument('--hang-rate', type=float, default=0.0, help='commands that never complete')
+    parser.add_argument('--auth-failure-rate', type=float, default=0.0, help='logins rejected regardless of password')
+    parser.add_argument('--refuse-rate', type=float, default=0.0, help='connections closed right after accept')
+    parser.add_argument('--report-interval', type=float, default=10.0)
+    parser.add_argument('--register', action='store_true', help='add the devices to the database, then serve')
+    parser.add_argument('--group', default='Simulated Devices')
+    parser.add_argument('--operator', default=None, help='assign the simulator profile to this user')
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    if args.register:
+        register_devices(args, args.group, args.operator)
+
+    # Hàng nghìn kết nối đồng thời: giảm stack mỗi thread
+    threading.stack_size(512 * 1024)
+    raise_open_file_limit(args.count * 4 + 256)
+
+    simulator = DeviceSimulator(args, load_host_key(args.host_key))
+    simulator.start()
+    print(f"\n=== Simulating {args.count} devices on {args.host}:{args.base_port}-"
+          f"{args.base_port + args.count - 1} (user {args.username}) ===\n")
+
+    try:
+        while True:
+            time.sleep(args.report_interval)
+            stats = simulator.stats.snapshot()
+            print(' '.join(f"{key}={value}" for key, value in stats.items()))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        simulator.stop()
+
+
+if __name__ == '__main__':
+    main()
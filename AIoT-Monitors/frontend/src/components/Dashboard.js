@@ -197,7 +197,16 @@ const Dashboard = ({ user }) => {
         );
     };
 
-    const showFileEditDetails = (edit) => {
+    const showFileEditDetails = async (edit) => {
+        // Nội dung file chỉ được tải khi mở chi tiết
+        let content = {};
+        try {
+            const response = await axios.get(`/api/sessions/file-edits/${edit.id}/content`);
+            content = response.data;
+        } catch (err) {
+            console.error('Error fetching file edit content:', err);
+        }
+
         // Hiển thị modal với chi tiết của file edit
         const modal = document.createElement('div');
         modal.className = 'modal';
@@ -212,11 +221,11 @@ const Dashboard = ({ user }) => {
                 <div class="file-content">
                     <div class="content-before">
                         <h4>Before</h4>
-                        <pre>${edit.content_before || 'No content'}</pre>
+                        <pre>${content.content_before || 'No content'}</pre>
                     </div>
                     <div class="content-after">
                         <h4>After</h4>
-                        <pre>${edit.content_after || 'No content'}</pre>
+                        <pre>${content.content_after || 'No content'}</pre>
                     </div>
                 </div>
                 <button onclick="this.parentElement.parentElement.remove()">Close</button>